@@ -0,0 +1,508 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Correlation of the slave DAQ clock with the host clock.
+
+The slave clock is sampled periodically via GET_DAQ_CLOCK; every sample
+is bracketed by two host timestamps (:func:`time.perf_counter_ns`), only
+the sample with the shortest round-trip time of a burst is used.
+
+The accepted samples feed an exponentially weighted least-squares fit
+(offset + drift), which maps slave ticks to host nano-seconds.
+
+:class:`TimestampConverter` applies the same fit to reception timestamps of
+drivers (CAN hardware, kernel), which come with a clock of their own.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import threading
+from time import perf_counter_ns
+
+from pyxcp.logger import Logger
+from pyxcp.types import XcpResponseError, XcpTimeoutError
+
+
+def unwrapTicks(ticks, reference: int, width: int = 4):
+    """Extend truncated slave timestamps to the full (unwrapped) time-line.
+
+    The result is the value congruent to `ticks` (modulo 2 ** (8 * width))
+    closest to `reference`.
+
+    Parameters
+    ----------
+    ticks: int or array-like
+        Raw timestamp(s) as sent by the slave (one, two or four bytes).
+        NumPy arrays are processed vectorized.
+    reference: int
+        Unwrapped tick value, which is known to be near `ticks`
+        (less than half a wrap-around period apart).
+    width: int
+        Size of the raw timestamps in bytes.
+
+    Returns
+    -------
+    int or array-like
+    """
+    modulus = 1 << (8 * width)
+    half = modulus >> 1
+    return reference + ((ticks - reference + half) % modulus) - half
+
+
+class LinearFit:
+    """Exponentially weighted, numerically stable least-squares line fit.
+
+    Parameters
+    ----------
+    forgettingFactor: float
+        Weight of the history (0 < factor <= 1); 1.0 means an unweighted fit
+        over all samples, smaller values let the fit follow temperature
+        dependent drift.
+    """
+
+    def __init__(self, forgettingFactor: float = 0.98):
+        self.forgettingFactor = forgettingFactor
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._x0 = None
+        self._y0 = None
+        self._weight = 0.0
+        self._meanX = 0.0
+        self._meanY = 0.0
+        self._covXX = 0.0
+        self._covXY = 0.0
+
+    def update(self, x: int, y: int):
+        """Add a sample.
+
+        Parameters
+        ----------
+        x: int
+            Unwrapped slave ticks.
+        y: int
+            Host time in nano-seconds.
+        """
+        if self._x0 is None:
+            # Work relative to the first sample to keep the magnitudes small.
+            self._x0 = x
+            self._y0 = y
+        x -= self._x0
+        y -= self._y0
+        lam = self.forgettingFactor
+        self._weight = lam * self._weight + 1.0
+        dx = x - self._meanX
+        self._meanX += dx / self._weight
+        self._meanY += (y - self._meanY) / self._weight
+        self._covXX = lam * self._covXX + dx * (x - self._meanX)
+        self._covXY = lam * self._covXY + dx * (y - self._meanY)
+        self.count += 1
+
+    @property
+    def valid(self) -> bool:
+        """At least two distinct samples are required to determine the drift.
+        """
+        return self.count >= 2 and self._covXX > 0.0
+
+    def coefficients(self) -> tuple:
+        """
+        Returns
+        -------
+        tuple (slope, intercept)
+            host_ns = slope * ticks + intercept
+        """
+        if not self.valid:
+            raise ValueError("Not enough samples to fit.")
+        slope = self._covXY / self._covXX
+        intercept = (self._y0 + self._meanY) - slope * (self._x0 + self._meanX)
+        return (slope, intercept)
+
+    def line(self) -> tuple:
+        """Like :meth:`coefficients`, but anchored at the mean sample -- precise for large `x`.
+
+        Returns
+        -------
+        tuple (x, y, slope)
+            host_ns = y + slope * (ticks - x)
+        """
+        if not self.valid:
+            raise ValueError("Not enough samples to fit.")
+        meanX = int(round(self._meanX))
+        return (self._x0 + meanX, self._y0 + int(round(self._meanY + (meanX - self._meanX) * self._covXY / self._covXX)),
+            self._covXY / self._covXX)
+
+
+class TimestampConverter:
+    """Maps driver timestamps (CAN hardware, kernel) to the host time-base (:func:`time.perf_counter_ns`).
+
+    Reception latency only ever adds to the host time, so the lower envelope
+    of ``host - driver`` time is the offset between both clocks. The minimum
+    is taken per window of `window` nano-seconds (driver time) and the window
+    minima feed a :class:`LinearFit`, which follows drift between the clocks;
+    old windows are forgotten, so the offset may rise again.
+
+    If the host can read the driver clock itself (`clock`, e.g. :func:`time.time_ns`
+    for wall-clock based kernel timestamps), it's sampled once per window instead,
+    which gives a minimum without reception latency.
+
+    A step of the driver clock (e.g. the wall-clock being set) by more than
+    `stepThreshold` nano-seconds restarts the estimation.
+
+    Parameters
+    ----------
+    resolution: int
+        Duration of a driver timestamp tick in nano seconds,
+        see :meth:`pyxcp.transport.can.CanInterfaceBase.getTimestampResolution`.
+    clock: callable or None
+        Returns the current driver time in nano seconds.
+    window: int
+    forgettingFactor: float
+        Weight of previous windows, see :class:`LinearFit`.
+    stepThreshold: int
+    """
+
+    def __init__(self, resolution: int, clock=None, window: int = 1000000000, forgettingFactor: float = 0.9,
+                 stepThreshold: int = 10000000):
+        self.resolution = resolution
+        self.clock = clock
+        self.window = window
+        self.stepThreshold = stepThreshold
+        self.fit = LinearFit(forgettingFactor)
+        self.steps = 0  # Clock steps detected.
+        self.reset()
+
+    def reset(self):
+        self.fit.reset()
+        self.offset = None      # Offset (host - driver) of the last conversion.
+        self._floor = None      # Minimal offset, until the fit is valid.
+        self._line = None       # LinearFit.line()
+        self._windowStart = None
+        self._windowMin = None  # (offset, driver ns)
+        self._lastNs = None
+
+    def __call__(self, timestamp: int, hostNs: int) -> int:
+        """
+        Parameters
+        ----------
+        timestamp: int
+            Driver timestamp in ticks.
+        hostNs: int
+            Host time at which the frame has been read from the driver.
+
+        Returns
+        -------
+        int
+            Reception time in nano seconds (host time-base).
+        """
+        ns = timestamp * self.resolution
+        delta = hostNs - ns
+        if self._lastNs is not None and ns < self._lastNs - self.stepThreshold:
+            self._restart()     # Driver clock stepped back.
+        if self._windowStart is None:
+            self._windowStart = ns
+            if self.clock is not None:
+                self._sample()
+        elif ns - self._windowStart >= self.window:
+            self._closeWindow()
+            self._windowStart = ns
+        self._lastNs = ns
+        if self._windowMin is None or delta < self._windowMin[0]:
+            self._windowMin = (delta, ns)
+        if self._floor is None or delta < self._floor:
+            self._floor = delta
+        offset = self._estimate(ns)
+        if delta < offset - self.stepThreshold:
+            # Less than no latency, driver clock stepped forward.
+            self._restart()
+            self._lastNs = self._windowStart = ns
+            self._windowMin = (delta, ns)
+            self._floor = offset = delta
+        self.offset = min(offset, delta)    # Never later than read.
+        return ns + self.offset
+
+    def _restart(self):
+        self.steps += 1
+        self.reset()
+
+    def _estimate(self, ns: int) -> int:
+        if self._line is None:
+            return self._floor
+        x, y, slope = self._line
+        return y + int(slope * (ns - x)) - ns
+
+    def _sample(self):
+        """Reference sample of the driver clock, without reception latency.
+        """
+        ns = self.clock()
+        delta = perf_counter_ns() - ns
+        if self._floor is None or delta < self._floor:
+            self._floor = delta
+        return (delta, ns)
+
+    def _closeWindow(self):
+        delta, ns = self._sample() if self.clock is not None else self._windowMin
+        if self._line is not None and delta - self._estimate(ns) > self.stepThreshold:
+            # Minimum rose all of a sudden, driver clock stepped back while there were no frames.
+            self._restart()
+            self._floor = delta
+        self._windowMin = None
+        self.fit.update(ns, ns + delta)
+        if self.fit.valid:
+            self._line = self.fit.line()
+
+
+class ClockSync:
+    """Background service correlating slave DAQ clock and host clock.
+
+    Parameters
+    ----------
+    master: :class:`pyxcp.master.Master`
+        Connected master; the slave must support GET_DAQ_CLOCK.
+    interval: float
+        Seconds between two sampling bursts.
+    burstSize: int
+        Number of GET_DAQ_CLOCK round trips per burst, only the one with the
+        minimal round-trip time is fed into the fit.
+    rttTolerance: float
+        Bursts whose best round-trip time exceeds `rttTolerance` times the
+        smallest round-trip time observed so far are discarded.
+    forgettingFactor: float
+        See :class:`LinearFit`.
+    tickWidth: int
+        Size of the GET_DAQ_CLOCK timestamp in bytes.
+
+    Example
+    -------
+    .. code-block:: python
+
+        with ClockSync(xm) as cs:
+            ...
+            hostNs = cs.toHost(ticks)
+    """
+
+    def __init__(self, master, interval: float = 1.0, burstSize: int = 8,
+                 rttTolerance: float = 2.0, forgettingFactor: float = 0.98,
+                 tickWidth: int = 4):
+        self.master = master
+        self.interval = interval
+        self.burstSize = burstSize
+        self.rttTolerance = rttTolerance
+        self.tickWidth = tickWidth
+        self.logger = Logger("ClockSync")
+        self.fit = LinearFit(forgettingFactor)
+        self.minRtt = None
+        self.lastTicks = None    # Last accepted sample (unwrapped ticks, host ns).
+        self.lastHost = None
+        self._coefficients = None
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Take an initial burst and start the sampling thread.
+        """
+        self.sample()
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name="ClockSync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopEvent.wait(self.interval):
+            try:
+                self.sample()
+            except (XcpTimeoutError, XcpResponseError) as e:
+                self.logger.warn("GET_DAQ_CLOCK failed: {}".format(e))
+
+    def sample(self):
+        """Run a single burst of GET_DAQ_CLOCK round trips.
+
+        Returns
+        -------
+        bool
+            True if the burst has been accepted.
+        """
+        best = None
+        getDaqClock = self.master.getDaqClock
+        for _ in range(self.burstSize):
+            start = perf_counter_ns()
+            ticks = getDaqClock()
+            stop = perf_counter_ns()
+            rtt = stop - start
+            if best is None or rtt < best[2]:
+                best = (ticks, start + rtt // 2, rtt)
+        return self.addSample(*best)
+
+    def addSample(self, ticks: int, hostNs: int, rtt: int = 0) -> bool:
+        """Feed a (raw slave ticks, host ns) pair into the fit.
+
+        Parameters
+        ----------
+        ticks: int
+            Raw slave clock as returned by GET_DAQ_CLOCK.
+        hostNs: int
+            Host time (:func:`time.perf_counter_ns`) at which the slave
+            presumably sampled its clock, i.e. the midpoint of the round trip.
+        rtt: int
+            Round-trip time in nano-seconds.
+
+        Returns
+        -------
+        bool
+            False if the sample has been rejected by the round-trip filter.
+        """
+        with self._lock:
+            if self.minRtt is None or rtt < self.minRtt:
+                self.minRtt = rtt
+            elif rtt > self.minRtt * self.rttTolerance:
+                return False
+            if self.lastTicks is None:
+                unwrapped = ticks
+            else:
+                # Estimate the expected tick count from host time elapsed, so
+                # multiple wrap-arounds between two samples are handled too.
+                if self._coefficients:
+                    slope = self._coefficients[0]
+                    reference = self.lastTicks + int((hostNs - self.lastHost) / slope)
+                else:
+                    reference = self.lastTicks
+                unwrapped = unwrapTicks(ticks, reference, self.tickWidth)
+            self.lastTicks = unwrapped
+            self.lastHost = hostNs
+            self.fit.update(unwrapped, hostNs)
+            if self.fit.valid:
+                self._coefficients = self.fit.coefficients()
+            return True
+
+    @property
+    def valid(self) -> bool:
+        return self._coefficients is not None
+
+    @property
+    def coefficients(self) -> tuple:
+        """Current fit, a tuple (slope [ns/tick], intercept [ns]).
+        """
+        if self._coefficients is None:
+            raise ValueError("Clock correlation not (yet) available.")
+        return self._coefficients
+
+    @property
+    def nsPerTick(self) -> float:
+        return self.coefficients[0]
+
+    def drift(self, nominalNsPerTick: float) -> float:
+        """Deviation of the slave clock from its nominal rate.
+
+        Parameters
+        ----------
+        nominalNsPerTick: float
+            Derived from GET_DAQ_RESOLUTION_INFO (timestampTicks * unit).
+
+        Returns
+        -------
+        float
+            Drift in ppm, positive values mean the slave clock is too slow.
+        """
+        return (self.nsPerTick / nominalNsPerTick - 1.0) * 1e6
+
+    def toHost(self, ticks):
+        """Map unwrapped slave ticks to host time.
+
+        Parameters
+        ----------
+        ticks: int or array-like
+            NumPy arrays are processed vectorized.
+
+        Returns
+        -------
+        int or array-like
+            Host time in nano-seconds (:func:`time.perf_counter_ns` time-base).
+        """
+        slope, intercept = self.coefficients
+        result = ticks * slope + intercept
+        if isinstance(ticks, int):
+            return int(round(result))
+        return result
+
+    def toSlave(self, hostNs):
+        """Inverse of :meth:`toHost`, result is an (unwrapped) tick value.
+        """
+        slope, intercept = self.coefficients
+        result = (hostNs - intercept) / slope
+        if isinstance(hostNs, int):
+            return int(round(result))
+        return result
+
+    def applyToBatch(self, ticks, width: int = 4, hostNs=None):
+        """Map a batch of raw DTO timestamps to host time.
+
+        The fit coefficients are fetched once per batch, so concurrent
+        updates from the sampling thread are cheap and consistent.
+
+        Parameters
+        ----------
+        ticks: sequence or :class:`numpy.ndarray`
+            Raw timestamps as found in the DTOs.
+        width: int
+            Size of the DTO timestamps in bytes.
+        hostNs: sequence or :class:`numpy.ndarray` or None
+            Host reception times of the DTOs. They are used as unwrap
+            references, which is required if the DTO timestamps wrap around
+            faster than the sampling interval (e.g. two byte timestamps).
+            Otherwise the last sync sample acts as reference.
+
+        Returns
+        -------
+        list or :class:`numpy.ndarray`
+            Host times in nano-seconds.
+        """
+        slope, intercept = self.coefficients
+        if hostNs is None:
+            with self._lock:
+                reference = self.lastTicks
+            if hasattr(ticks, "dtype"):
+                unwrapped = unwrapTicks(ticks.astype("int64"), reference, width)
+                return unwrapped * slope + intercept
+            return [int(round(unwrapTicks(t, reference, width) * slope + intercept)) for t in ticks]
+        if hasattr(ticks, "dtype"):
+            references = ((hostNs - intercept) / slope).round().astype("int64")
+            unwrapped = unwrapTicks(ticks.astype("int64"), references, width)
+            return unwrapped * slope + intercept
+        result = []
+        for t, h in zip(ticks, hostNs):
+            reference = int(round((h - intercept) / slope))
+            result.append(int(round(unwrapTicks(t, reference, width) * slope + intercept)))
+        return result
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Vectorized decoding of DTOs.
+
+Every ODT of a :class:`~pyxcp.daq.layout.DaqLayout` is compiled into a NumPy
+structured data type, so packets are decoded by re-interpreting memory
+(no copies, no Python loops).
+
+.. note:: Requires NumPy.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import numpy as np
+
+from pyxcp.daq.layout import DATA_TYPES
+
+TIMESTAMP_FIELD = "timestamp"
+TIMESTAMP_TYPES = {1: "B", 2: "H", 4: "I"}
+
+
+class DaqDecoder:
+    """Compiled form of a DAQ layout.
+
+    Parameters
+    ----------
+    layout: :class:`~pyxcp.daq.layout.DaqLayout`
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.dtypes = {}
+        prefix = layout.byteOrderPrefix
+        for pid, (daqList, odtNumber) in layout.pidMap.items():
+            names = []
+            formats = []
+            offsets = []
+            if odtNumber == 0 and daqList.timestampSize:
+                names.append(TIMESTAMP_FIELD)
+                formats.append(prefix + TIMESTAMP_TYPES[daqList.timestampSize])
+                offsets.append(daqList.timestampOffset)
+            headerSize = daqList.headerSize(odtNumber)
+            for meas in daqList.odts[odtNumber].measurements:
+                names.append(meas.name)
+                formats.append(prefix + DATA_TYPES[meas.dataType][1])
+                offsets.append(headerSize + meas.offset)
+            self.dtypes[pid] = np.dtype({
+                "names": names, "formats": formats, "offsets": offsets,
+                "itemsize": daqList.packetSize(odtNumber),
+            })
+
+    def packetSize(self, pid: int) -> int:
+        return self.dtypes[pid].itemsize
+
+    def decode(self, pid: int, packets):
+        """Decode packets of a single ODT.
+
+        Parameters
+        ----------
+        pid: int
+        packets: :class:`numpy.ndarray`
+            uint8 array of shape (n, packetSize); rows may be strided,
+            but bytes within a row must be contiguous.
+            Longer rows (e.g. padded CAN frames) are truncated.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            Structured array of length n, a view of `packets` (no copy).
+        """
+        dtype = self.dtypes[pid]
+        size = dtype.itemsize
+        if packets.shape[1] < size:
+            raise ValueError("PID {}: packets too short ({} < {} bytes).".format(pid, packets.shape[1], size))
+        return packets[:, :size].view(dtype)[:, 0]
+
+    def decodeBytes(self, packet: bytes):
+        """Decode a single packet, e.g. straight from :attr:`~pyxcp.transport.base.BaseTransport.daqQueue`.
+
+        Returns
+        -------
+        tuple (pid, :class:`numpy.void`)
+        """
+        pid = packet[0]
+        dtype = self.dtypes[pid]
+        return (pid, np.frombuffer(packet, dtype=dtype, count=1)[0])
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Callback based DAQ consumption.
+
+A :class:`DaqDispatcher` consumes :attr:`~pyxcp.transport.base.BaseTransport.daqQueue`
+(as sink of its :class:`~pyxcp.daq.drain.DaqDrain`), routes packets by DAQ list / event
+channel (via the PID map of a :class:`~pyxcp.daq.layout.DaqLayout`) and delivers them in batches of `batchSize`
+packets or every `batchInterval` seconds, whichever comes first, on a thread pool.
+
+Callbacks of a single subscriber are never run concurrently and see batches in
+order. If a subscriber falls behind (more than `maxPending` undelivered batches),
+its policy applies:
+
+- ``"drop"``: new batches are discarded.
+- ``"coalesce"``: the oldest undelivered batch is discarded, i.e. the subscriber gets the most recent data.
+- ``"block"``: the drain thread waits; this delays other subscribers and sinks of the
+  :class:`~pyxcp.daq.drain.DaqDrain` (e.g. a recorder on the same queue), but never the listener.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import perf_counter
+
+from pyxcp.daq.drain import DaqDrain
+from pyxcp.daq.stats import OVERLOAD_BIT
+from pyxcp.logger import Logger
+
+POLICIES = ("drop", "coalesce", "block")
+
+
+class Subscription:
+    """Handle returned by :meth:`DaqDispatcher.subscribe`.
+
+    Attributes
+    ----------
+    deliveredCount: int
+        Packets handed to the callback.
+    droppedCount: int
+        Packets discarded due to the policy (or not delivered before :meth:`DaqDispatcher.unsubscribe`).
+    """
+
+    def __init__(self, callback, daqList, eventChannel, batchSize, batchInterval, policy, maxPending):
+        if policy not in POLICIES:
+            raise ValueError("Invalid policy '{}' -- choose from {}".format(policy, list(POLICIES)))
+        self.callback = callback
+        self.daqList = daqList
+        self.eventChannel = eventChannel
+        self.batchSize = batchSize
+        self.batchInterval = batchInterval
+        self.policy = policy
+        self.maxPending = maxPending
+        self.deliveredCount = 0
+        self.droppedCount = 0
+        self.active = True
+        self._batch = []
+        self._batchStart = None
+        self._pending = deque()
+        self._running = False   # Delivery task submitted.
+        self._cond = threading.Condition()
+
+    def matches(self, daqList) -> bool:
+        if self.daqList is not None and (daqList is None or daqList.number != self.daqList):
+            return False
+        if self.eventChannel is not None and (daqList is None or daqList.eventChannel != self.eventChannel):
+            return False
+        return True
+
+    def __repr__(self):
+        return "Subscription(daqList = {}, eventChannel = {}, policy = '{}')".format(
+            self.daqList, self.eventChannel, self.policy
+        )
+
+
+class DaqDispatcher:
+    """
+    Parameters
+    ----------
+    queue: :class:`collections.deque`
+        Source of DAQ elements ``(packet, counter, length, timestamp)``.
+    layout: :class:`~pyxcp.daq.layout.DaqLayout` or None
+        Required to subscribe to DAQ lists or event channels; packets with
+        unknown PIDs only reach catch-all subscriptions.
+    workers: int
+        Size of the delivery thread pool.
+    overloadMsb: bool
+        The slave indicates overloads in the most significant bit of the PID
+        (see :attr:`pyxcp.daq.stats.DaqStatistics.overloadMsb`), which is ignored for routing.
+
+    Example
+    -------
+    .. code-block:: python
+
+        overloadMsb = xm.transport.daqStatistics.overloadMsb
+        with DaqDispatcher(xm.transport.daqQueue, layout, overloadMsb=overloadMsb) as dispatcher:
+            dispatcher.subscribe(plot, eventChannel=1, batchInterval=0.05, policy="coalesce")
+            dispatcher.subscribe(checkLimits, daqList=0, batchSize=100, policy="block")
+            ...
+    """
+
+    def __init__(self, queue, layout=None, workers: int = 4, overloadMsb: bool = False):
+        self.queue = queue
+        self.layout = layout
+        self.workers = workers
+        self.overloadMsb = overloadMsb
+        self.logger = Logger("DaqDispatcher")
+        self._subscriptions = ()
+        self._routes = {}   # pid -> tuple of subscriptions, rebuilt on (un)subscribe.
+        self._retired = []  # Unsubscribed, batch not accounted for yet.
+        self._lock = threading.Lock()
+        self._executor = None
+        self._drain = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def subscribe(self, callback, daqList: int = None, eventChannel: int = None, batchSize: int = 256,
+                  batchInterval: float = 0.01, policy: str = "drop", maxPending: int = 16) -> Subscription:
+        """Register a callback.
+
+        Parameters
+        ----------
+        callback: callable
+            Called with a list of DAQ elements ``(packet, counter, length, timestamp)``.
+        daqList: int or None
+            DAQ list number, None means any.
+        eventChannel: int or None
+            Event channel number, None means any.
+        batchSize: int
+        batchInterval: float
+            Seconds.
+        policy: str
+            "drop", "coalesce" or "block".
+        maxPending: int
+            Undelivered batches before `policy` applies.
+
+        Returns
+        -------
+        :class:`Subscription`
+        """
+        if (daqList is not None or eventChannel is not None) and self.layout is None:
+            raise ValueError("Subscribing to DAQ lists or event channels requires a layout.")
+        sub = Subscription(callback, daqList, eventChannel, batchSize, batchInterval, policy, maxPending)
+        with self._lock:
+            self._subscriptions += (sub, )
+            self._routes = {}
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        """Remove a subscription, packets not delivered so far are counted as dropped.
+        """
+        sub.active = False
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not sub)
+            self._routes = {}
+            self._retired.append(sub)
+            if self._drain is None:
+                self._retire()
+            # Otherwise on the drain thread, which may still be filling the batch.
+
+    def _retire(self):
+        retired, self._retired = self._retired, []
+        for sub in retired:
+            with sub._cond:
+                sub.droppedCount += len(sub._batch)
+                sub._batch = []
+
+    def _route(self, pid: int):
+        routes = self._routes
+        subs = routes.get(pid)
+        if subs is None:
+            key = pid & ~OVERLOAD_BIT if self.overloadMsb else pid
+            entry = self.layout.pidMap.get(key) if self.layout else None
+            daqList = entry[0] if entry else None
+            subs = tuple(s for s in self._subscriptions if s.matches(daqList))
+            routes[pid] = subs
+        return subs
+
+    def start(self):
+        """Attach to the :class:`~pyxcp.daq.drain.DaqDrain` of :attr:`queue`.
+        """
+        if self._drain is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="DaqDelivery")
+        self._drain = DaqDrain.forQueue(self.queue)
+        self._drain.attach(self._consume)
+
+    def stop(self):
+        """Deliver everything queued so far and shut down.
+        """
+        if self._drain is not None:
+            self._drain.detach(self._consume)
+            self._drain = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _consume(self, elements, final: bool):
+        route = self._route
+        for element in elements:
+            subs = route(element[0][0])
+            if subs and type(element[0]) is memoryview:
+                element = (bytes(element[0]), ) + element[1:]  # Views of a ring don't outlive the call.
+            for sub in subs:
+                if not sub._batch:
+                    sub._batchStart = perf_counter()
+                sub._batch.append(element)
+                if len(sub._batch) >= sub.batchSize:
+                    self._submit(sub)
+        now = perf_counter()
+        for sub in self._subscriptions:
+            if sub._batch and (final or now - sub._batchStart >= sub.batchInterval):
+                self._submit(sub)
+        if self._retired:
+            with self._lock:
+                self._retire()
+
+    def _submit(self, sub: Subscription):
+        batch = sub._batch
+        sub._batch = []
+        with sub._cond:
+            if len(sub._pending) >= sub.maxPending:
+                if sub.policy == "drop":
+                    sub.droppedCount += len(batch)
+                    return
+                elif sub.policy == "coalesce":
+                    sub.droppedCount += len(sub._pending.popleft())
+                else:
+                    while len(sub._pending) >= sub.maxPending and sub.active:
+                        sub._cond.wait(0.1)
+            sub._pending.append(batch)
+            if not sub._running:
+                sub._running = True
+                self._executor.submit(self._deliver, sub)
+
+    def _deliver(self, sub: Subscription):
+        while True:
+            with sub._cond:
+                if not sub._pending:
+                    sub._running = False
+                    return
+                batch = sub._pending.popleft()
+                sub._cond.notify()
+                if not sub.active:
+                    sub.droppedCount += len(batch)
+                    continue
+            try:
+                sub.callback(batch)
+            except Exception as e:
+                self.logger.error("DAQ callback {!r} failed: {}".format(sub.callback, e))
+            sub.deliveredCount += len(batch)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Single consumer of a DAQ queue, fanning packets out to several sinks.
+
+:attr:`~pyxcp.transport.base.BaseTransport.daqQueue` must have exactly one
+consumer -- two threads popping from the same deque would split the stream
+between them. So recorders, MDF writers, ring publishers and dispatchers
+don't drain the queue themselves, but attach to the :class:`DaqDrain` of
+the queue (:meth:`DaqDrain.forQueue`), which hands every batch of DAQ elements
+to all of its sinks on one thread:
+
+.. code-block:: python
+
+    drain = DaqDrain.forQueue(xm.transport.daqQueue)
+    drain.attach(sink)      # sink(elements, final)
+    ...
+    drain.detach(sink)      # Returns after `sink` has seen everything queued so far.
+
+Sinks are called with a (possibly empty) list of DAQ elements
+``(packet, counter, length, timestamp)`` every `pollInterval` seconds at least,
+so they can run timers; `final` is True on the last call after :meth:`DaqDrain.detach`.
+Sinks run on the drain thread, a slow sink delays all others (but never the listener).
+
+If the transport receives in a child process (see :mod:`pyxcp.transport.process`),
+the drain reads the shared-memory ring directly (:meth:`DaqDrain.feed`) -- packets
+are memoryviews then, valid for the duration of the call; sinks keeping packets must copy them.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import threading
+from time import sleep
+
+from pyxcp.logger import Logger
+
+DRAINS = {}     # id(queue) -> DaqDrain
+LOCK = threading.Lock()     # Guards DRAINS and the sinks of all drains.
+
+
+class DaqDrain:
+    """
+    Parameters
+    ----------
+    queue: :class:`collections.deque`
+        Source of DAQ elements.
+    pollInterval: float
+        Seconds to sleep if the queue is empty.
+    batchSize: int
+        Upper bound of elements per sink call.
+
+    Note
+    ----
+    Use :meth:`forQueue` instead of creating drains directly, otherwise the
+    single consumer guarantee is lost.
+    """
+
+    def __init__(self, queue, pollInterval: float = 0.001, batchSize: int = 4096):
+        self.queue = queue
+        self.pollInterval = pollInterval
+        self.batchSize = batchSize
+        self.logger = Logger("DaqDrain")
+        self.sinks = ()         # Replaced, not modified -- the drain loop doesn't lock while delivering.
+        self._detaching = {}    # sink -> threading.Event
+        self._feed = None       # (consumer, account, store, threading.Event), see feed().
+        self._thread = None
+
+    @classmethod
+    def forQueue(cls, queue):
+        """The drain of `queue`, created on demand.
+        """
+        with LOCK:
+            drain = DRAINS.get(id(queue))
+            if drain is None:
+                drain = cls(queue)
+                DRAINS[id(queue)] = drain
+            return drain
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def attach(self, sink):
+        """Start delivering to `sink`, the drain thread is started with the first sink.
+        """
+        with LOCK:
+            if sink in self.sinks:
+                raise ValueError("{!r} is already attached.".format(sink))
+            if DRAINS.setdefault(id(self.queue), self) is not self:
+                raise RuntimeError("Queue is already drained by another DaqDrain.")
+            self.sinks = self.sinks + (sink, )
+            self._start()
+
+    def _start(self):
+        # Caller holds LOCK.
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="DaqDrain", daemon=True)
+            self._thread.start()
+
+    def detach(self, sink):
+        """Deliver everything queued so far to `sink`, then stop delivering to it.
+
+        The drain thread exits with the last sink.
+        """
+        done = threading.Event()
+        with LOCK:
+            if sink not in self.sinks:
+                return
+            self._detaching[sink] = done
+            thread = self._thread
+        if threading.current_thread() is thread:
+            raise RuntimeError("Sinks can't detach from within the drain thread.")
+        while not done.wait(0.1):
+            if not thread.is_alive():
+                break
+
+    def feed(self, consumer, account=None, store=None):
+        """Read DAQ elements from a shared-memory ring instead of the queue, until the ring is closed.
+
+        Packets already in the queue are delivered first.
+
+        Parameters
+        ----------
+        consumer: :class:`pyxcp.daq.shmring.RingConsumer`
+            Owned by the drain from now on, closed after the ring is drained.
+        account: callable or None
+            Called as `account(elements)` for every batch read from the ring, before delivery (e.g. statistics).
+        store: callable or None
+            Called as `store(elements)` instead of the sinks, while there are none --
+            copies packets into the queue for direct readers.
+        """
+        with LOCK:
+            if self._feed is not None:
+                raise RuntimeError("Drain is already fed by a ring.")
+            if DRAINS.setdefault(id(self.queue), self) is not self:
+                raise RuntimeError("Queue is already drained by another DaqDrain.")
+            self._feed = (consumer, account, store, threading.Event())
+            self._start()
+
+    def unfeed(self):
+        """Wait until the feeding ring is closed (by its publisher) and drained.
+        """
+        with LOCK:
+            if self._feed is None:
+                return
+            done = self._feed[3]
+            thread = self._thread
+        if threading.current_thread() is thread:
+            raise RuntimeError("Can't wait for the ring from within the drain thread.")
+        while not done.wait(0.1):
+            if not thread.is_alive():
+                break
+        if self._thread is not thread:
+            thread.join()   # Exited with the ring, don't leave it to linger.
+
+    def _remove(self, sink):
+        # Caller holds LOCK.
+        self.sinks = tuple(s for s in self.sinks if s != sink)
+        done = self._detaching.pop(sink, None)
+        if done is not None:
+            done.set()
+
+    def _run(self):
+        queue = self.queue
+        popleft = queue.popleft
+        batchSize = self.batchSize
+        while True:
+            with LOCK:
+                detaching = tuple(self._detaching)  # Sample before draining, so nothing queued gets lost.
+                sinks = self.sinks
+                feed = self._feed
+            elements = []
+            if sinks:
+                while queue and len(elements) < batchSize:
+                    elements.append(popleft())
+            drained = not queue
+            if feed is not None and len(elements) < batchSize:
+                consumer, account, store, done = feed
+                count = batchSize - len(elements)
+                fed = consumer.read(count, timeout=None if elements else self.pollInterval)
+                if fed and account is not None:
+                    account(fed)
+                if sinks:
+                    elements.extend(fed)
+                elif fed and store is not None:
+                    store(fed)
+                drained = drained and len(fed) < count
+            last = bool(detaching) and drained
+            for sink in sinks:
+                try:
+                    sink(elements, last and sink in detaching)
+                except Exception as e:
+                    self.logger.error("DAQ sink {!r} failed, detached: {}".format(sink, e))
+                    with LOCK:
+                        self._remove(sink)
+            idle = feed is None and not elements and not detaching
+            elements = fed = None   # Release views of the ring.
+            with LOCK:
+                if last:
+                    for sink in detaching:
+                        self._remove(sink)
+                if feed is not None and consumer.closed:
+                    consumer.close()
+                    self._feed = None
+                    done.set()
+                if not self.sinks and self._feed is None:
+                    self._thread = None
+                    if DRAINS.get(id(queue)) is self:
+                        del DRAINS[id(queue)]
+                    return
+            if idle:
+                sleep(self.pollInterval)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Description of a DAQ configuration (DAQ lists, ODTs, measurements).
+
+Layouts are plain data and can be read from JSON or TOML files:
+
+.. code-block:: json
+
+    {
+        "byteOrder": "INTEL",
+        "daqLists": [
+            {
+                "number": 0, "eventChannel": 1, "firstPid": 0, "timestampSize": 4,
+                "odts": [
+                    [["engineSpeed", 0, "U16"], ["throttle", 2, "F32"]],
+                    [["lambda", 0, "F32"]]
+                ]
+            }
+        ]
+    }
+
+Measurement offsets are relative to the ODT payload, i.e. they don't include
+the identification field and the timestamp.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import namedtuple
+
+from pyxcp.config import readConfiguration
+
+# Data type: (size in bytes, struct / NumPy type character)
+DATA_TYPES = {
+    "U8":   (1, "B"),
+    "I8":   (1, "b"),
+    "U16":  (2, "H"),
+    "I16":  (2, "h"),
+    "U32":  (4, "I"),
+    "I32":  (4, "i"),
+    "U64":  (8, "Q"),
+    "I64":  (8, "q"),
+    "F32":  (4, "f"),
+    "F64":  (8, "d"),
+}
+
+# Size of the absolute ODT number (identification field), the only
+# identification field type supported so far.
+PID_SIZE = 1
+DTO_CTR_SIZE = 1
+
+
+class Measurement(namedtuple("Measurement", "name offset dataType")):
+    """A single value within an ODT.
+
+    Parameters
+    ----------
+    name: str
+    offset: int
+        Byte offset relative to the ODT payload.
+    dataType: str
+        One of :obj:`DATA_TYPES`.
+    """
+
+    __slots__ = ()
+
+    @property
+    def size(self) -> int:
+        return DATA_TYPES[self.dataType][0]
+
+
+class Odt:
+    """Object Descriptor Table, i.e. the contents of a single DTO.
+
+    Parameters
+    ----------
+    measurements: list of :class:`Measurement`
+    """
+
+    def __init__(self, measurements):
+        for meas in measurements:
+            if meas.dataType not in DATA_TYPES:
+                raise ValueError("'{}': invalid data type '{}' -- choose from {}".format(
+                    meas.name, meas.dataType, list(DATA_TYPES.keys()))
+                )
+        self.measurements = list(measurements)
+
+    @property
+    def size(self) -> int:
+        """Size of the ODT payload in bytes.
+        """
+        return max((m.offset + m.size for m in self.measurements), default=0)
+
+    def __repr__(self):
+        return "Odt({!r})".format(self.measurements)
+
+
+class DaqList:
+    """
+    Parameters
+    ----------
+    number: int
+    eventChannel: int
+    odts: list of :class:`Odt`
+    firstPid: int
+        Absolute ODT number of the first ODT, as returned by
+        :meth:`pyxcp.master.Master.startStopDaqList`.
+    timestampSize: int
+        Size of the DTO timestamp (first ODT only), 0 if disabled.
+    prescaler: int
+    dtoCounter: bool
+        First ODT carries a DTO CTR byte (behind the identification field).
+    """
+
+    def __init__(self, number: int, eventChannel: int, odts, firstPid: int = 0,
+                 timestampSize: int = 0, prescaler: int = 1, dtoCounter: bool = False):
+        self.number = number
+        self.eventChannel = eventChannel
+        self.odts = list(odts)
+        self.firstPid = firstPid
+        self.timestampSize = timestampSize
+        self.prescaler = prescaler
+        self.dtoCounter = dtoCounter
+
+    @property
+    def pids(self) -> range:
+        return range(self.firstPid, self.firstPid + len(self.odts))
+
+    @property
+    def timestampOffset(self) -> int:
+        """Position of the timestamp within the first ODT.
+        """
+        return PID_SIZE + (DTO_CTR_SIZE if self.dtoCounter else 0)
+
+    def headerSize(self, odtNumber: int) -> int:
+        """Bytes in front of the ODT payload (identification field, DTO CTR and timestamp).
+        """
+        if odtNumber:
+            return PID_SIZE
+        return self.timestampOffset + self.timestampSize
+
+    def packetSize(self, odtNumber: int) -> int:
+        return self.headerSize(odtNumber) + self.odts[odtNumber].size
+
+    def __repr__(self):
+        return "DaqList(number = {}, eventChannel = {}, firstPid = {}, odts = {})".format(
+            self.number, self.eventChannel, self.firstPid, self.odts
+        )
+
+
+class DaqLayout:
+    """Collection of DAQ lists with PID lookup.
+
+    Parameters
+    ----------
+    daqLists: list of :class:`DaqList`
+    byteOrder: str
+        "INTEL" or "MOTOROLA".
+    """
+
+    def __init__(self, daqLists, byteOrder: str = "INTEL"):
+        if byteOrder not in ("INTEL", "MOTOROLA"):
+            raise ValueError("byteOrder must be either 'INTEL' or 'MOTOROLA'.")
+        self.daqLists = list(daqLists)
+        self.byteOrder = byteOrder
+        self.pidMap = {}
+        self.measurements = {}
+        for daqList in self.daqLists:
+            for odtNumber, odt in enumerate(daqList.odts):
+                pid = daqList.firstPid + odtNumber
+                if pid in self.pidMap:
+                    raise ValueError("PID {} is used by more than one ODT.".format(pid))
+                self.pidMap[pid] = (daqList, odtNumber)
+                for meas in odt.measurements:
+                    if meas.name in self.measurements:
+                        raise ValueError("Measurement '{}' is not unique.".format(meas.name))
+                    self.measurements[meas.name] = (pid, meas)
+
+    @property
+    def byteOrderPrefix(self) -> str:
+        return "<" if self.byteOrder == "INTEL" else ">"
+
+    def lookup(self, pid: int) -> tuple:
+        """
+        Returns
+        -------
+        tuple (:class:`DaqList`, odtNumber)
+        """
+        return self.pidMap[pid]
+
+    def locate(self, name: str) -> tuple:
+        """Find a measurement.
+
+        Returns
+        -------
+        tuple (pid, :class:`Measurement`)
+        """
+        return self.measurements[name]
+
+    @classmethod
+    def fromDict(cls, data: dict):
+        daqLists = []
+        for dl in data.get("daqLists", []):
+            odts = [Odt([Measurement(*m) for m in odt]) for odt in dl.get("odts", [])]
+            daqLists.append(DaqList(
+                number=dl["number"], eventChannel=dl.get("eventChannel", 0), odts=odts,
+                firstPid=dl.get("firstPid", 0), timestampSize=dl.get("timestampSize", 0),
+                prescaler=dl.get("prescaler", 1), dtoCounter=dl.get("dtoCounter", False))
+            )
+        return cls(daqLists, data.get("byteOrder", "INTEL"))
+
+    def toDict(self) -> dict:
+        return {
+            "byteOrder": self.byteOrder,
+            "daqLists": [
+                {
+                    "number": dl.number, "eventChannel": dl.eventChannel, "firstPid": dl.firstPid,
+                    "timestampSize": dl.timestampSize, "prescaler": dl.prescaler, "dtoCounter": dl.dtoCounter,
+                    "odts": [[list(m) for m in odt.measurements] for odt in dl.odts],
+                } for dl in self.daqLists
+            ]
+        }
+
+    @classmethod
+    def fromFile(cls, fp):
+        """Read layout from a JSON or TOML file.
+
+        Parameters
+        ----------
+        fp: file-like
+            Opened file, format is derived from suffix (see :func:`pyxcp.config.readConfiguration`).
+        """
+        return cls.fromDict(readConfiguration(fp))
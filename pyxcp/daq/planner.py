@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Bus-load estimation for DAQ configurations on XCP on CAN.
+
+Every ODT of a DAQ list is transmitted as a frame of its own once per
+event cycle (times prescaler); the bit time of that frame (worst-case bit
+stuffing, CAN-FD with or without bitrate switch, see
+:func:`pyxcp.transport.can.frameBits`) divided by the cycle time is the bus
+load it causes.
+
+:meth:`BusLoadPlanner.plan` checks a :class:`~pyxcp.daq.layout.DaqLayout`
+against a target load *before* DAQ is started and suggests changes:
+
+1. ODT repacking -- measurements are packed into as few ODTs as possible, saving per-frame overhead.
+2. Prescalers -- raised on the lists causing the highest load, until the target is met.
+
+.. code-block:: python
+
+    planner = BusLoadPlanner.fromTransport(xm.transport, targetLoad = 0.5)
+    planner.fetchEventCycles(xm, layout)
+    plan = planner.plan(layout)
+    if not plan.feasible:
+        ...
+    for suggestion in plan.suggestions:
+        print(suggestion)
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import namedtuple
+import copy
+
+from pyxcp.daq.layout import DaqLayout, DaqList, Measurement, Odt
+from pyxcp.transport.can import frameDuration, setDLC
+
+# Unit of `eventChannelTimeCycle` in seconds.
+EVENT_CHANNEL_TIME_UNITS = {
+    "EVENT_CHANNEL_TIME_UNIT_1NS":      1e-9,
+    "EVENT_CHANNEL_TIME_UNIT_10NS":     1e-8,
+    "EVENT_CHANNEL_TIME_UNIT_100NS":    1e-7,
+    "EVENT_CHANNEL_TIME_UNIT_1US":      1e-6,
+    "EVENT_CHANNEL_TIME_UNIT_10US":     1e-5,
+    "EVENT_CHANNEL_TIME_UNIT_100US":    1e-4,
+    "EVENT_CHANNEL_TIME_UNIT_1MS":      1e-3,
+    "EVENT_CHANNEL_TIME_UNIT_10MS":     1e-2,
+    "EVENT_CHANNEL_TIME_UNIT_100MS":    1e-1,
+    "EVENT_CHANNEL_TIME_UNIT_1S":       1.0,
+    "EVENT_CHANNEL_TIME_UNIT_1PS":      1e-12,
+    "EVENT_CHANNEL_TIME_UNIT_10PS":     1e-11,
+    "EVENT_CHANNEL_TIME_UNIT_100PS":    1e-10,
+}
+
+MAX_PRESCALER = 255
+
+BusLoadEstimate = namedtuple("BusLoadEstimate", "total daqLists unknown")
+BusLoadEstimate.__doc__ = """Result of :meth:`BusLoadPlanner.estimate`.
+
+Attributes
+----------
+total: float
+    Bus load (1.0 equals the bitrate) caused by all DAQ lists with known cycle time.
+daqLists: dict
+    DAQ list number -> load.
+unknown: list
+    Numbers of DAQ lists on sporadic / unknown event channels, not included in `total`.
+"""
+
+Suggestion = namedtuple("Suggestion", "daqList kind old new")
+Suggestion.__doc__ = """A change proposed by :meth:`BusLoadPlanner.plan`.
+
+`kind` is either "repack" (`old` / `new` are ODT counts) or "prescaler".
+"""
+
+DaqPlan = namedtuple("DaqPlan", "layout estimate suggestions feasible")
+DaqPlan.__doc__ = """Result of :meth:`BusLoadPlanner.plan`.
+
+Attributes
+----------
+layout: :class:`~pyxcp.daq.layout.DaqLayout`
+    Layout with all suggestions applied.
+estimate: :class:`BusLoadEstimate`
+    Load of `layout`.
+suggestions: list of :class:`Suggestion`
+feasible: bool
+    Target load is met.
+"""
+
+
+def eventCycleTime(info):
+    """Cycle time of an event channel in seconds.
+
+    Parameters
+    ----------
+    info: `pyxcp.types.GetEventChannelInfoResponse`
+
+    Returns
+    -------
+    float or None
+        None for sporadic event channels.
+    """
+    if not info.eventChannelTimeCycle:
+        return None
+    return info.eventChannelTimeCycle * EVENT_CHANNEL_TIME_UNITS[str(info.eventChannelTimeUnit)]
+
+
+class BusLoadPlanner:
+    """
+    Parameters
+    ----------
+    bitrate: float
+        Nominal bitrate (`BAUDRATE`).
+    fdBitrate: float
+        Data bitrate (`FD_BAUDRATE`).
+    fd: bool
+        DTOs are sent as CAN-FD frames.
+    brs: bool
+        Bitrate switch.
+    extended: bool
+        DTO identifiers are 29 bit.
+    maxDto: int
+    padToMaxDto: bool
+        Frames are always padded to `maxDto` (`MAX_DLC_REQUIRED`).
+    targetLoad: float
+        Upper bound for :meth:`plan`.
+    """
+
+    def __init__(self, bitrate: float = 500000.0, fdBitrate: float = 2000000.0, fd: bool = False, brs: bool = False,
+                 extended: bool = False, maxDto: int = 8, padToMaxDto: bool = False, targetLoad: float = 0.8):
+        self.bitrate = bitrate
+        self.fdBitrate = fdBitrate
+        self.fd = fd
+        self.brs = brs
+        self.extended = extended
+        self.maxDto = maxDto
+        self.padToMaxDto = padToMaxDto
+        self.targetLoad = targetLoad
+        self.eventCycles = {}   # Event channel number -> seconds or None.
+
+    @classmethod
+    def fromTransport(cls, transport, maxDto: int = None, targetLoad: float = 0.8):
+        """Take the bus parameters from a :class:`~pyxcp.transport.can.Can` transport.
+        """
+        return cls(
+            bitrate=transport.config.get("BAUDRATE"), fdBitrate=transport.config.get("FD_BAUDRATE"),
+            fd=transport.fd, brs=transport.brs, extended=transport.can_id_master.is_extended,
+            maxDto=maxDto or transport.MAX_DATAGRAM_SIZE, padToMaxDto=transport.max_dlc_required,
+            targetLoad=targetLoad
+        )
+
+    def setEventCycle(self, eventChannel: int, seconds):
+        """Cycle time of `eventChannel`, None if sporadic.
+        """
+        self.eventCycles[eventChannel] = seconds
+
+    def fetchEventCycles(self, master, layout: DaqLayout):
+        """Read the cycle times of all event channels used by `layout` (:meth:`pyxcp.master.Master.getDaqEventInfo`).
+        """
+        for eventChannel in sorted({daqList.eventChannel for daqList in layout.daqLists}):
+            self.setEventCycle(eventChannel, eventCycleTime(master.getDaqEventInfo(eventChannel)))
+
+    def frameTime(self, size: int) -> float:
+        """Seconds a DTO of `size` bytes occupies the bus.
+        """
+        if size > self.maxDto:
+            raise ValueError("DTO of {} bytes exceeds MAX_DTO ({}).".format(size, self.maxDto))
+        length = self.maxDto if self.padToMaxDto else setDLC(size)
+        return frameDuration(length, self.extended, self.fd, self.brs, self.bitrate, self.fdBitrate)
+
+    def daqListLoad(self, daqList: DaqList):
+        """Bus load of `daqList`, None if the cycle time of its event channel is unknown.
+        """
+        cycle = self.eventCycles.get(daqList.eventChannel)
+        if not cycle:
+            return None
+        busy = sum(self.frameTime(daqList.packetSize(odtNumber)) for odtNumber in range(len(daqList.odts)))
+        return busy / (cycle * max(daqList.prescaler, 1))
+
+    def estimate(self, layout: DaqLayout) -> BusLoadEstimate:
+        daqLists = {}
+        unknown = []
+        for daqList in layout.daqLists:
+            load = self.daqListLoad(daqList)
+            if load is None:
+                unknown.append(daqList.number)
+            else:
+                daqLists[daqList.number] = load
+        return BusLoadEstimate(sum(daqLists.values()), daqLists, unknown)
+
+    def repack(self, daqList: DaqList) -> DaqList:
+        """Pack the measurements of `daqList` into as few ODTs as possible (first-fit decreasing).
+
+        Measurements keep their names and data types, offsets are reassigned.
+        """
+        measurements = sorted((m for odt in daqList.odts for m in odt.measurements), key=lambda m: -m.size)
+        odts = []   # [free bytes, measurements]
+        for meas in measurements:
+            for odt in odts:
+                if odt[0] >= meas.size:
+                    break
+            else:
+                odt = [self.maxDto - daqList.headerSize(len(odts)), []]
+                if odt[0] < meas.size:
+                    raise ValueError("'{}' doesn't fit into a DTO.".format(meas.name))
+                odts.append(odt)
+            odt[1].append(meas)
+            odt[0] -= meas.size
+        packed = []
+        for _, members in odts:
+            offset = 0
+            entries = []
+            for meas in members:
+                entries.append(Measurement(meas.name, offset, meas.dataType))
+                offset += meas.size
+            packed.append(Odt(entries))
+        return DaqList(daqList.number, daqList.eventChannel, packed, daqList.firstPid,
+            daqList.timestampSize, daqList.prescaler, daqList.dtoCounter)
+
+    def plan(self, layout: DaqLayout, repack: bool = True) -> DaqPlan:
+        """Suggest changes to `layout`, so that the estimated load stays below `targetLoad`.
+
+        Lists on sporadic event channels are left alone.
+        """
+        suggestions = []
+        daqLists = []
+        for daqList in layout.daqLists:
+            if repack and daqList.odts:
+                packed = self.repack(daqList)
+                if len(packed.odts) < len(daqList.odts):
+                    suggestions.append(Suggestion(daqList.number, "repack", len(daqList.odts), len(packed.odts)))
+                    daqLists.append(packed)
+                    continue
+            daqLists.append(copy.copy(daqList))     # Prescalers are modified below.
+        prescalers = {daqList.number: daqList.prescaler for daqList in daqLists}
+        estimate = self.estimate(DaqLayout(daqLists, layout.byteOrder))
+        loads = dict(estimate.daqLists)
+        total = estimate.total
+        while total > self.targetLoad:
+            candidates = [d for d in daqLists if d.number in loads and d.prescaler < MAX_PRESCALER]
+            if not candidates:
+                break
+            daqList = max(candidates, key=lambda d: loads[d.number])
+            daqList.prescaler += 1
+            load = self.daqListLoad(daqList)
+            total += load - loads[daqList.number]
+            loads[daqList.number] = load
+        for daqList in daqLists:
+            if daqList.prescaler != prescalers[daqList.number]:
+                suggestions.append(Suggestion(daqList.number, "prescaler", prescalers[daqList.number], daqList.prescaler))
+        planned = DaqLayout(daqLists, layout.byteOrder)
+        estimate = self.estimate(planned)
+        return DaqPlan(planned, estimate, suggestions, estimate.total <= self.targetLoad)
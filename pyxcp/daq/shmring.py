@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fan-out of DAQ packets to other processes via a shared-memory ring buffer.
+
+A single :class:`RingPublisher` (usually living in the :class:`~pyxcp.master.Master`
+process) writes DAQ elements into a :mod:`multiprocessing.shared_memory` block,
+any number of :class:`RingConsumer` (up to `maxConsumers`) read them at their own
+pace -- each one owns a read cursor, packets are handed out as memoryviews of
+the shared block (no copies, no sockets).
+
+The publisher never blocks: if there is no room left, because a consumer
+lags behind by more than the ring size, the packet is dropped and counted
+(:attr:`RingPublisher.droppedCount`); so are packets larger than half the ring.
+Slots of consumers that died without detaching are reclaimed.
+
+Memory layout::
+
+    header        magic, capacity, maxConsumers, writeCursor, droppedCount, closed, trackerId
+    slots         per consumer: active, readCursor, owner PID
+    data          records (length, counter, timestamp, packet), 8 byte aligned
+
+Cursors are monotonically increasing byte positions, i.e. position modulo
+capacity is the offset within the data area.
+
+.. note:: Requires Python 3.8 or newer.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import os
+import struct
+from time import perf_counter, sleep
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    HAS_SHARED_MEMORY = False
+else:
+    HAS_SHARED_MEMORY = True
+
+from pyxcp.daq.drain import DaqDrain
+from pyxcp.logger import Logger
+
+RING_MAGIC = b"PYXCPSHM"
+
+# magic, capacity, maxConsumers, writeCursor, droppedCount, closed, publisher's resource tracker (see trackerId)
+RING_HEADER = struct.Struct("<8sQQQQQQ8x")
+WRITE_CURSOR_OFFSET = 24
+DROPPED_OFFSET = 32
+CLOSED_OFFSET = 40
+
+SLOT = struct.Struct("<QQQ8x")     # active, readCursor, owner PID
+READ_CURSOR_OFFSET = 8
+
+RECORD = struct.Struct("<HHq")      # length, counter, timestamp
+WRAP_MARKER = 0xffff                # Rest of the data area is unused, continue at offset 0.
+
+U16 = struct.Struct("<H")
+U64 = struct.Struct("<Q")
+
+POLL_INTERVAL = 0.0005
+
+
+def align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def trackerId() -> int:
+    """Identifies the resource tracker of this process (0 if there is none).
+
+    Processes started by :mod:`multiprocessing` inherit the tracker -- and the pipe
+    to it, so the inode of the pipe tells if two processes share a tracker.
+    """
+    if os.name != "posix":
+        return 0    # Shared memory isn't tracked.
+    return os.fstat(resource_tracker.getfd()).st_ino
+
+
+def attachSharedMemory(name: str):
+    """Open an existing block.
+
+    Returns
+    -------
+    tuple (:class:`multiprocessing.shared_memory.SharedMemory`, bool)
+        The flag tells if the block is registered with the resource tracker.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False), False
+    except TypeError:   # Python < 3.13
+        return shared_memory.SharedMemory(name=name), os.name == "posix"
+
+
+def untrack(shm):
+    """Unregister `shm` from the resource tracker of this process.
+    """
+    # The tracker knows POSIX names, i.e. with leading slash.
+    resource_tracker.unregister("/" + shm.name.lstrip("/"), "shared_memory")
+
+
+class RingPublisher:
+    """Single producer of a shared-memory ring.
+
+    Parameters
+    ----------
+    name: str or None
+        Name of the shared-memory block, None picks a random one (see :attr:`name`).
+    size: int
+        Size of the data area in bytes.
+    maxConsumers: int
+    queue: :class:`collections.deque` or None
+        Source of DAQ elements for :meth:`start`,
+        usually :attr:`pyxcp.transport.base.BaseTransport.daqQueue`.
+
+    Example
+    -------
+    .. code-block:: python
+
+        with RingPublisher("xcp-daq", queue=xm.transport.daqQueue) as publisher:
+            ...     # Consumers attach with RingConsumer("xcp-daq").
+    """
+
+    def __init__(self, name: str = None, size: int = 16 * 1024 * 1024, maxConsumers: int = 8, queue=None):
+        if not HAS_SHARED_MEMORY:
+            raise RuntimeError("RingPublisher requires multiprocessing.shared_memory (Python >= 3.8).")
+        self.capacity = align(size)
+        self.maxConsumers = maxConsumers
+        self.queue = queue
+        self.logger = Logger("RingPublisher")
+        self._dataOffset = RING_HEADER.size + SLOT.size * maxConsumers
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=self._dataOffset + self.capacity)
+        self._buf = self._shm.buf
+        self._buf[: self._dataOffset] = bytes(self._dataOffset)
+        RING_HEADER.pack_into(self._buf, 0, RING_MAGIC, self.capacity, maxConsumers, 0, 0, 0, trackerId())
+        self._writeCursor = 0
+        self._limit = self.capacity    # writeCursor may advance up to here without checking consumers.
+        self.droppedCount = 0
+        self.oversizedCount = 0     # Dropped, because they'd never fit (included in droppedCount).
+        self.publishedCount = 0
+        self._drain = None
+
+    def __enter__(self):
+        if self.queue is not None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _slotOffset(self, idx: int) -> int:
+        return RING_HEADER.size + idx * SLOT.size
+
+    def _updateLimit(self, reap: bool = False):
+        """Find the slowest consumer.
+        """
+        cursor = self._writeCursor
+        for idx in range(self.maxConsumers):
+            active, readCursor, owner = SLOT.unpack_from(self._buf, self._slotOffset(idx))
+            if not active:
+                continue
+            if reap and not processAlive(owner):
+                self.logger.warn("Consumer #{} (PID {}) died, releasing its slot.".format(idx, owner))
+                U64.pack_into(self._buf, self._slotOffset(idx), 0)
+                continue
+            cursor = min(cursor, readCursor)
+        self._limit = cursor + self.capacity
+
+    def _put(self, packet, counter: int, timestamp: int) -> bool:
+        length = len(packet)
+        size = align(RECORD.size + length)
+        capacity = self.capacity
+        if size > capacity // 2 or length >= WRAP_MARKER:
+            if not self.oversizedCount:
+                self.logger.warn("Packet of {} bytes doesn't fit into ring, dropped.".format(length))
+            self.oversizedCount += 1
+            self.droppedCount += 1
+            return False
+        cursor = self._writeCursor
+        offset = cursor % capacity
+        pad = capacity - offset if offset + size > capacity else 0
+        end = cursor + pad + size
+        if end > self._limit:
+            self._updateLimit()
+            if end > self._limit:
+                self._updateLimit(reap=True)
+                if end > self._limit:
+                    self.droppedCount += 1
+                    return False
+        buf = self._buf
+        base = self._dataOffset
+        if pad:
+            U16.pack_into(buf, base + offset, WRAP_MARKER)
+            offset = 0
+        RECORD.pack_into(buf, base + offset, length, counter & 0xffff, timestamp)
+        start = base + offset + RECORD.size
+        buf[start : start + length] = packet
+        self._writeCursor = end
+        self.publishedCount += 1
+        return True
+
+    def _commit(self):
+        # Records become visible to consumers with the cursor update.
+        U64.pack_into(self._buf, WRITE_CURSOR_OFFSET, self._writeCursor)
+        U64.pack_into(self._buf, DROPPED_OFFSET, self.droppedCount)
+
+    def publish(self, packet, counter: int, length: int, timestamp: int) -> bool:
+        """Publish a single DAQ element.
+
+        Returns
+        -------
+        bool
+            False if the packet was dropped.
+        """
+        result = self._put(packet, counter, timestamp)
+        self._commit()
+        return result
+
+    def publishMany(self, elements) -> int:
+        """Publish DAQ elements ``(packet, counter, length, timestamp)``, consumers see them at once.
+
+        Returns
+        -------
+        int
+            Number of dropped packets.
+        """
+        dropped = self.droppedCount
+        put = self._put
+        for packet, counter, _, timestamp in elements:
+            put(packet, counter, timestamp)
+        self._commit()
+        return self.droppedCount - dropped
+
+    def start(self):
+        """Attach to the :class:`~pyxcp.daq.drain.DaqDrain` of :attr:`queue`.
+        """
+        if self._drain is None:
+            self._drain = DaqDrain.forQueue(self.queue)
+            self._drain.attach(self._consume)
+
+    def stop(self):
+        if self._drain is not None:
+            self._drain.detach(self._consume)
+            self._drain = None
+
+    def _consume(self, elements, final: bool):
+        if elements:
+            self.publishMany(elements)
+
+    def close(self, unlink: bool = True):
+        """Stop publishing, consumers see :attr:`RingConsumer.closed` after draining the ring.
+        """
+        if self._shm is None:
+            return
+        self.stop()
+        U64.pack_into(self._buf, CLOSED_OFFSET, 1)
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
+
+
+def processAlive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RingConsumer:
+    """Reader of a shared-memory ring.
+
+    Parameters
+    ----------
+    name: str
+        Name of the shared-memory block, see :attr:`RingPublisher.name`.
+    slot: int or None
+        Consumer slot, None takes the first free one. Processes attaching
+        concurrently should use distinct, explicit slots.
+
+    Consumers start with packets published after attaching.
+
+    Example
+    -------
+    .. code-block:: python
+
+        with RingConsumer("xcp-daq") as consumer:
+            while not consumer.closed:
+                for packet, counter, length, timestamp in consumer.read(timeout=0.1):
+                    ...
+    """
+
+    def __init__(self, name: str, slot: int = None):
+        if not HAS_SHARED_MEMORY:
+            raise RuntimeError("RingConsumer requires multiprocessing.shared_memory (Python >= 3.8).")
+        self._shm, tracked = attachSharedMemory(name)
+        self._buf = self._shm.buf
+        magic, self.capacity, self.maxConsumers, writeCursor, _, _, publisherTracker = RING_HEADER.unpack_from(self._buf)
+        if tracked and publisherTracker != trackerId():
+            # A resource tracker of our own would destroy the block when this process exits.
+            untrack(self._shm)
+        if magic != RING_MAGIC:
+            self._shm.close()
+            raise ValueError("'{}' is not a DAQ ring.".format(name))
+        self._dataOffset = RING_HEADER.size + SLOT.size * self.maxConsumers
+        if slot is None:
+            for idx in range(self.maxConsumers):
+                if not U64.unpack_from(self._buf, RING_HEADER.size + idx * SLOT.size)[0]:
+                    slot = idx
+                    break
+            else:
+                self._shm.close()
+                raise RuntimeError("No free consumer slot.")
+        self.slot = slot
+        self._slotOffset = RING_HEADER.size + slot * SLOT.size
+        self._cursor = writeCursor
+        self._pending = None
+        # Cursor first, the publisher must not see an active slot with a stale cursor.
+        SLOT.pack_into(self._buf, self._slotOffset, 0, writeCursor, os.getpid())
+        U64.pack_into(self._buf, self._slotOffset, 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        """Publisher has closed the ring and all packets are consumed.
+        """
+        cursor = self._cursor if self._pending is None else self._pending
+        return bool(U64.unpack_from(self._buf, CLOSED_OFFSET)[0]) and \
+            cursor == U64.unpack_from(self._buf, WRITE_CURSOR_OFFSET)[0]
+
+    @property
+    def droppedCount(self) -> int:
+        """Packets dropped by the publisher (ring full).
+        """
+        return U64.unpack_from(self._buf, DROPPED_OFFSET)[0]
+
+    def release(self):
+        """Hand the packets returned by the last :meth:`read` back to the publisher.
+        """
+        if self._pending is not None:
+            self._cursor = self._pending
+            self._pending = None
+            U64.pack_into(self._buf, self._slotOffset + READ_CURSOR_OFFSET, self._cursor)
+
+    def read(self, maxCount: int = None, timeout: float = None):
+        """Get available DAQ elements.
+
+        Implicitly releases the elements of the previous call.
+
+        Parameters
+        ----------
+        maxCount: int or None
+        timeout: float or None
+            Wait up to `timeout` seconds for data, None returns immediately.
+
+        Returns
+        -------
+        list of tuple (packet, counter, length, timestamp)
+            `packet` is a memoryview of the shared block, valid until the next
+            :meth:`read` or :meth:`release`.
+        """
+        self.release()
+        buf = self._buf
+        writeCursor = U64.unpack_from(buf, WRITE_CURSOR_OFFSET)[0]
+        if writeCursor == self._cursor and timeout:
+            deadline = perf_counter() + timeout
+            while writeCursor == self._cursor and perf_counter() < deadline and \
+                    not U64.unpack_from(buf, CLOSED_OFFSET)[0]:
+                sleep(POLL_INTERVAL)
+                writeCursor = U64.unpack_from(buf, WRITE_CURSOR_OFFSET)[0]
+        capacity = self.capacity
+        base = self._dataOffset
+        unpack = RECORD.unpack_from
+        result = []
+        cursor = self._cursor
+        while cursor < writeCursor and (maxCount is None or len(result) < maxCount):
+            offset = cursor % capacity
+            if U16.unpack_from(buf, base + offset)[0] == WRAP_MARKER:
+                cursor += capacity - offset
+                continue
+            length, counter, timestamp = unpack(buf, base + offset)
+            start = base + offset + RECORD.size
+            result.append((buf[start : start + length], counter, length, timestamp))
+            cursor += align(RECORD.size + length)
+        self._pending = cursor
+        return result
+
+    def close(self):
+        """Detach from the ring, the slot becomes available again.
+        """
+        if self._shm is None:
+            return
+        self._pending = None
+        U64.pack_into(self._buf, self._slotOffset, 0)
+        self._buf = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Packets still referenced, the mapping goes away with them.
+            pass
+        self._shm = None
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Packet-loss and overload accounting for DAQ reception.
+
+:class:`DaqStatistics` keeps per-PID counters, which are updated by the
+transport-layer listener for every packet (see
+:meth:`~pyxcp.transport.base.BaseTransport.processResponse`) and aggregated
+per DAQ list on demand:
+
+- `received`: DAQ packets seen.
+- `missing`: gaps in the DTO CTR of the first ODT, i.e. lost sampling cycles
+  (requires :attr:`pyxcp.daq.layout.DaqList.dtoCounter`).
+- `overload`: packets with the OVERLOAD bit set in the identification field
+  (``OVERLOAD_MSB`` indication, see `overloadMsb`).
+- `dropped`: packets evicted from a bounded
+  :attr:`~pyxcp.transport.base.BaseTransport.daqQueue` before anyone read them.
+
+Additionally, gaps in the transport-layer counter (XCP on Ethernet / SxI) and
+``EV_DAQ_OVERLOAD`` events are counted connection-wide.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import namedtuple
+
+from pyxcp.daq.layout import PID_SIZE
+from pyxcp.logger import Logger
+
+OVERLOAD_BIT = 0x80
+
+
+class DaqListCounters(namedtuple("DaqListCounters", "received missing overload dropped")):
+    """Counters of a single DAQ list (or PID, if no layout is known).
+    """
+
+    @property
+    def lost(self) -> int:
+        return self.missing + self.dropped
+
+
+class StatisticsSnapshot(namedtuple("StatisticsSnapshot", "daqLists transportGaps overloadEvents")):
+    """Result of :meth:`DaqStatistics.snapshot`.
+
+    Attributes
+    ----------
+    daqLists: dict
+        DAQ list number (PID without a layout) -> :class:`DaqListCounters`.
+    transportGaps: int
+        Packets missing according to the transport-layer counter.
+    overloadEvents: int
+        ``EV_DAQ_OVERLOAD`` events.
+    """
+
+    @property
+    def total(self) -> DaqListCounters:
+        return DaqListCounters(*(sum(c) for c in zip(DaqListCounters(0, 0, 0, 0), *self.daqLists.values())))
+
+
+class DaqStatistics:
+    """
+    Parameters
+    ----------
+    layout: :class:`~pyxcp.daq.layout.DaqLayout` or None
+        Required for DTO CTR checking and per DAQ list aggregation.
+    overloadMsb: bool
+        Slave indicates overload by setting the MSB of the PID
+        (``DAQ_PROPERTIES.OVERLOAD_MSB``); the bit is masked before counting.
+
+    Note
+    ----
+    Updates are not locked, they take place in the listener thread only;
+    :meth:`snapshot` may be called from anywhere.
+    """
+
+    def __init__(self, layout=None, overloadMsb: bool = False):
+        self.logger = Logger("DaqStatistics")
+        self.overloadMsb = overloadMsb
+        self._callback = None
+        self._threshold = 0
+        self._reported = 0
+        self.setLayout(layout)
+
+    def setLayout(self, layout):
+        """Use `layout` from now on; resets all counters.
+        """
+        self.layout = layout
+        self._ctrPids = [False] * 256
+        if layout is not None:
+            for daqList in layout.daqLists:
+                if daqList.dtoCounter and daqList.odts:
+                    self._ctrPids[daqList.firstPid] = True
+        self.reset()
+
+    def reset(self):
+        self.received = [0] * 256
+        self.missing = [0] * 256
+        self.overload = [0] * 256
+        self.dropped = [0] * 256
+        self.transportGaps = 0
+        self.overloadEvents = 0
+        self._lastCtr = [None] * 256
+        self._lastCounter = None
+        self._losses = 0
+        self._reported = 0
+
+    def onLoss(self, callback, threshold: int = 1):
+        """Call `callback` with a :class:`StatisticsSnapshot`, whenever
+        `threshold` packets have been lost (or flagged as overload) since the previous call.
+
+        The callback runs in the listener thread -- keep it short.
+        Pass None to remove the callback.
+        """
+        self._callback = callback
+        self._threshold = max(threshold, 1)
+        self._reported = self._losses
+
+    def counterReceived(self, counter: int, mask: int = 0xffff):
+        """Check the transport-layer counter of any incoming packet.
+        """
+        last = self._lastCounter
+        self._lastCounter = counter
+        if last is not None and counter != ((last + 1) & mask):
+            self.transportGap((counter - last - 1) & mask)
+
+    def transportGap(self, count: int):
+        """`count` packets are missing according to the transport-layer counter.
+        """
+        self.transportGaps += count
+        self._lost(count)
+
+    def daqReceived(self, packet):
+        pid = packet[0]
+        if self.overloadMsb and pid & OVERLOAD_BIT:
+            pid &= ~OVERLOAD_BIT
+            self.overload[pid] += 1
+            self._lost(1)
+        self.received[pid] += 1
+        if self._ctrPids[pid] and len(packet) > PID_SIZE:
+            ctr = packet[PID_SIZE]
+            last = self._lastCtr[pid]
+            self._lastCtr[pid] = ctr
+            if last is not None and ctr != ((last + 1) & 0xff):
+                count = (ctr - last - 1) & 0xff
+                self.missing[pid] += count
+                self._lost(count)
+
+    def daqDropped(self, packet):
+        """`packet` was discarded before it was consumed.
+        """
+        pid = packet[0]
+        if self.overloadMsb:
+            pid &= ~OVERLOAD_BIT
+        self.dropped[pid] += 1
+        self._lost(1)
+
+    def overloadEvent(self, code=None, data=None):
+        """Handler for ``EV_DAQ_OVERLOAD``.
+        """
+        self.overloadEvents += 1
+        self._lost(1)
+
+    def _lost(self, count: int):
+        self._losses += count
+        if self._callback is not None and self._losses - self._reported >= self._threshold:
+            self._reported = self._losses
+            try:
+                self._callback(self.snapshot())
+            except Exception as e:
+                self.logger.error("Loss callback {!r} failed: {}".format(self._callback, e))
+
+    def snapshot(self) -> StatisticsSnapshot:
+        columns = (list(self.received), list(self.missing), list(self.overload), list(self.dropped))
+        daqLists = {}
+        if self.layout is not None:
+            for daqList in self.layout.daqLists:
+                daqLists[daqList.number] = DaqListCounters(*(sum(c[pid] for pid in daqList.pids) for c in columns))
+        else:
+            for pid in range(256):
+                counters = DaqListCounters(*(c[pid] for c in columns))
+                if any(counters):
+                    daqLists[pid] = counters
+        return StatisticsSnapshot(daqLists, self.transportGaps, self.overloadEvents)
@@ -31,8 +31,10 @@ __copyright__ = """
   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
+import functools
 import logging
 import struct
+import time
 import traceback
 
 from pyxcp import checksum
@@ -43,13 +45,25 @@ from pyxcp.constants import (
 from pyxcp.master.errorhandler import wrapped
 from pyxcp.transport.base import createTransport
 
+# Size of a memory element in bytes.
+AG_SIZES = {
+    types.AddressGranularity.BYTE:  1,
+    types.AddressGranularity.WORD:  2,
+    types.AddressGranularity.DWORD: 4,
+}
 
-def broadcasted(func):
-    """
 
+def broadcasted(func):
+    """Mark a master method as broadcast command, only transports with a `broadcast` method support it.
     """
-    return func
 
+    @functools.wraps(func)
+    def inner(self, *args, **kws):
+        if getattr(self.transport, "broadcast", None) is None:
+            raise NotImplementedError("{}() is only supported by XCP on CAN, not by {}.".format(
+                func.__name__, type(self.transport).__name__))
+        return func(self, *args, **kws)
+    return inner
 
 class SlaveProperties(dict):
     """Container class for fixed parameters, like byte-order, maxCTO, ...
@@ -401,11 +415,12 @@ class MasterBaseType:
         bytes
         """
 
-        response = self.transport.request(types.Command.UPLOAD, length)
-        if length > (self.slaveProperties.maxCto - 1):
-            block_response = self.transport.block_receive(
-                length_required=(length - len(response)))
-            response += block_response
+        with self.transport.requestLock:
+            response = self.transport.request(types.Command.UPLOAD, length)
+            if length > (self.slaveProperties.maxCto - 1):
+                block_response = self.transport.block_receive(
+                    length_required=(length - len(response)))
+                response += block_response
         return response
 
     @wrapped
@@ -468,6 +483,45 @@ class MasterBaseType:
             types.Command.TRANSPORT_LAYER_CMD, subCommand, *data)
         return response
 
+    @wrapped
+    def getDaqId(self, daqListNumber: int):
+        """Get the CAN identifier of a DAQ list (XCP on CAN only).
+
+        Parameters
+        ----------
+        daqListNumber : int
+
+        Returns
+        -------
+        `pyxcp.types.GetDaqIdResponse`
+        """
+        response = self.transport.request(
+            types.Command.TRANSPORT_LAYER_CMD, types.CanCommand.GET_DAQ_ID,
+            *self.WORD_pack(daqListNumber))
+        return types.GetDaqIdResponse.parse(
+            response, byteOrder=self.slaveProperties.byteOrder)
+
+    @wrapped
+    def setDaqId(self, daqListNumber: int, identifier: int, queue=None):
+        """Assign a CAN identifier to a DAQ list (XCP on CAN only).
+
+        The transport-layer extends its acceptance filters accordingly and
+        routes frames with `identifier` straight to `queue`.
+
+        Parameters
+        ----------
+        daqListNumber : int
+        identifier : int
+            XCP formatted, see :class:`pyxcp.transport.can.Identifier`.
+        queue : :class:`collections.deque` or None
+            Defaults to :attr:`pyxcp.transport.base.BaseTransport.daqQueue`.
+        """
+        response = self.transport.request(
+            types.Command.TRANSPORT_LAYER_CMD, types.CanCommand.SET_DAQ_ID,
+            *self.WORD_pack(daqListNumber), *self.DWORD_pack(identifier))
+        self.transport.setDaqId(daqListNumber, identifier, queue)
+        return response
+
     @wrapped
     def userCmd(self, subCommand: int, data: bytes):
         """Execute proprietary command implemented in your XCP client.
@@ -607,6 +661,52 @@ class MasterBaseType:
                 types.Command.DOWNLOAD_NEXT, remainingBlockLength, *data)
             return None
 
+    @wrapped
+    def downloadBlock(self, data: bytes):
+        """Transfer data from master to slave using master block mode.
+
+        `data` is split into blocks of DOWNLOAD / DOWNLOAD_NEXT packets, as
+        permitted by `MAX_BS`; all packets of a block except the last one are
+        handed to the transport-layer at once (see :meth:`pyxcp.transport.base.BaseTransport.sendMany`),
+        unless the slave requires a separation time (`MIN_ST`).
+        The whole sequence holds the request lock of the transport, so no other
+        command can interleave.
+
+        Parameters
+        ----------
+        data : bytes
+            Length must be a multiple of the address granularity.
+
+        Note
+        ----
+        Requires :meth:`getCommModeInfo` to be called beforehand. Adress is set via :meth:`setMta`
+        """
+        ag = AG_SIZES[self.slaveProperties.addressGranularity]
+        if len(data) % ag:
+            raise ValueError("Length of data ({}) isn't a multiple of the address granularity ({}).".format(len(data), ag))
+        alignment = 2 if ag == 4 else 0
+        maxPayload = (self.slaveProperties.maxCto - 2 - alignment) // ag * ag
+        maxBs = (self.slaveProperties.maxBs or 1) if self.slaveProperties.masterBlockMode else 1
+        minSt = self.slaveProperties.minSt * 100e-6  # 100µs units.
+        blockSize = min(maxBs * maxPayload, 255 * ag)   # Number of elements is a byte.
+        response = None
+        with self.transport.requestLock:
+            for blockOffset in range(0, len(data), blockSize):
+                block = data[blockOffset: blockOffset + blockSize]
+                requests = []
+                for offset in range(0, len(block), maxPayload):
+                    cmd = types.Command.DOWNLOAD if offset == 0 else types.Command.DOWNLOAD_NEXT
+                    requests.append((cmd, (len(block) - offset) // ag, *bytes(alignment),
+                        *block[offset: offset + maxPayload]))
+                if minSt:
+                    for request in requests[: -1]:
+                        self.transport.block_request(*request)
+                        time.sleep(minSt)
+                elif len(requests) > 1:
+                    self.transport.block_request_many(requests[: -1])
+                response = self.transport.request(*requests[-1])
+        return response
+
     @wrapped
     def downloadMax(self, data: bytes):
         """Transfer data from master to slave (fixed size).
@@ -903,8 +1003,10 @@ class MasterBaseType:
         `pyxcp.types.GetDaqProcessorInfoResponse`
         """
         response = self.transport.request(types.Command.GET_DAQ_PROCESSOR_INFO)
-        return types.GetDaqProcessorInfoResponse.parse(
+        result = types.GetDaqProcessorInfoResponse.parse(
             response, byteOrder=self.slaveProperties.byteOrder)
+        self.transport.daqStatistics.overloadMsb = result.daqProperties.overloadMsb
+        return result
 
     @wrapped
     def getDaqResolutionInfo(self):
@@ -1157,8 +1259,46 @@ class MasterBaseType:
 
     @broadcasted
     @wrapped
-    def getSlaveID(self, mode: int):
-        self.transportLayerCmd(0xff, 'X', 'C', 'P', mode)
+    def getSlaveID(self, mode: int = 0, window: float = 0.05, identifier: int = None):
+        """Find the XCP on CAN slaves on the bus (XCP on CAN only).
+
+        GET_SLAVE_ID is broadcasted on `CAN_ID_BROADCAST` and every slave
+        answering within `window` seconds is reported; no CONNECT is required.
+
+        Parameters
+        ----------
+        mode : int
+            0 -- identify by echo, 1 -- confirm by inverse echo.
+        window : float
+            Seconds to wait for responses.
+        identifier : int or None
+            Send to this identifier instead of `CAN_ID_BROADCAST`, e.g. to confirm a single slave.
+
+        Returns
+        -------
+        list of :class:`pyxcp.types.CanSlave`
+
+        Raises
+        ------
+        NotImplementedError
+            Transport-layer isn't CAN.
+        """
+        echo = b"XCP" if mode == 0 else bytes(~c & 0xff for c in b"XCP")
+        byteOrder = self.slaveProperties.byteOrder if hasattr(self, "slaveProperties") else types.ByteOrder.INTEL
+        if not self.transport.status:
+            self.transport.connect()
+        responses = self.transport.broadcast(
+            bytes([types.Command.TRANSPORT_LAYER_CMD, types.CanCommand.GET_SLAVE_ID]) + b"XCP" + bytes([mode]),
+            window, identifier)
+        result = []
+        for rawId, data in responses:
+            if len(data) < 8 or data[0] != 0xFF or data[1: 4] != echo:
+                continue    # Unrelated traffic.
+            response = types.GetSlaveIdResponse.parse(data[1: 8], byteOrder=byteOrder)
+            slave = types.CanSlave(rawId, response.canId)
+            if slave not in result:
+                result.append(slave)
+        return result
 
     # Convenience Functions.
     def verify(self, addr, length):
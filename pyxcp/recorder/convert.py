@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Parallel conversion of DAQ recordings to columnar files.
+
+Recordings are split into ranges of chunks, which are decoded by a pool of
+worker processes, so conversion scales with the number of cores. Every worker
+writes its part to a temporary file next to the output, the parts are merged
+one at a time (:func:`convertRecordingTo`) -- memory consumption doesn't depend
+on the size of the recording.
+
+Usage::
+
+    xdaq-convert layout.json run_0000.xdaq run_0001.xdaq -o run.npz -j 8
+
+Output formats:
+
+- `npz` (default): one array per signal plus `<signal>.timestamp` (host timestamps [ns]);
+  ECU timestamps are stored as `daq<number>.timestamp`.
+- `parquet` (requires pyarrow): one file per ODT, `<output>/odt_<pid>.parquet`,
+  with a `timestamp` column followed by the signals.
+
+.. note:: Requires NumPy.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import pathlib
+import tempfile
+import zipfile
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    HAS_PYARROW = False
+else:
+    HAS_PYARROW = True
+
+from pyxcp.daq.decoder import TIMESTAMP_FIELD, DaqDecoder
+from pyxcp.daq.layout import DaqLayout
+from pyxcp.logger import Logger
+from pyxcp.recorder.reader import MappedRecording
+
+OUTPUT_FORMATS = ("npz", "parquet")
+TASKS_PER_WORKER = 4
+
+logger = Logger("recorder.convert")
+
+_decoder = None     # Per worker process, see _initWorker().
+
+
+def _initWorker(layout: dict):
+    global _decoder
+
+    _decoder = DaqDecoder(DaqLayout.fromDict(layout))
+
+
+def decodeRange(decoder, filename, start: int, stop: int):
+    """Decode a range of chunks.
+
+    Returns
+    -------
+    dict
+        pid -> (timestamps, dict signal name -> values), arrays are copies.
+    """
+    result = {}
+    with MappedRecording(filename) as rec:
+        chunks = list(rec.iterChunks(start, stop))
+        for pid, dtype in decoder.dtypes.items():
+            timestamps = []
+            values = []
+            for chunk in chunks:
+                ts, data = chunk.decode(decoder, pid)
+                if len(ts):
+                    timestamps.append(ts)
+                    values.append(data)
+            if not timestamps:
+                continue
+            data = np.concatenate(values)
+            daqList, _ = decoder.layout.lookup(pid)
+            columns = {}
+            for name in dtype.names:
+                # ECU timestamps are named after their DAQ list, signal names are unique.
+                key = "daq{}.{}".format(daqList.number, name) if name == TIMESTAMP_FIELD else name
+                columns[key] = np.ascontiguousarray(data[name])
+            result[pid] = (np.concatenate(timestamps), columns)
+    return result
+
+
+def _decodeRange(filename, start: int, stop: int):
+    return decodeRange(_decoder, filename, start, stop)
+
+
+def decodeRangeTo(decoder, filename, start: int, stop: int, path: str):
+    """Decode a range of chunks into files `<path>_<pid>.npz`.
+
+    Returns
+    -------
+    dict
+        pid -> (file name, signal names, number of samples); the files hold
+        the timestamps as `arr_0`, followed by the signals in order.
+    """
+    result = {}
+    for pid, (timestamps, columns) in decodeRange(decoder, filename, start, stop).items():
+        name = "{}_{:03d}.npz".format(path, pid)
+        np.savez(name, timestamps, *columns.values())
+        result[pid] = (name, list(columns.keys()), len(timestamps))
+    return result
+
+
+def _decodeRangeTo(filename, start: int, stop: int, path: str):
+    return decodeRangeTo(_decoder, filename, start, stop, path)
+
+
+def makeTasks(filenames, chunksPerTask: int):
+    """Split recordings into (filename, start, stop) chunk ranges.
+    """
+    tasks = []
+    for filename in filenames:
+        with MappedRecording(filename) as rec:
+            count = len(rec)
+        for start in range(0, count, chunksPerTask):
+            tasks.append((str(filename), start, min(start + chunksPerTask, count)))
+    return tasks
+
+
+def convertRecording(layout, filenames, workers: int = None, chunksPerTask: int = None):
+    """Decode recordings into per-ODT columns.
+
+    Parameters
+    ----------
+    layout: :class:`~pyxcp.daq.layout.DaqLayout`
+    filenames: list
+        Recording files, in chronological order (e.g. rotated files).
+    workers: int or None
+        Number of worker processes, defaults to the number of CPUs;
+        0 decodes in the calling process.
+    chunksPerTask: int or None
+        Granularity of work distribution, by default every worker gets
+        about four tasks.
+
+    Returns
+    -------
+    dict
+        pid -> (timestamps, dict signal name -> values)
+    """
+    workers, tasks = planTasks(filenames, workers, chunksPerTask)
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(layout.toDict(), )) as pool:
+            parts = list(pool.map(_decodeRange, *zip(*tasks))) if tasks else []
+    else:
+        decoder = DaqDecoder(layout)
+        parts = [decodeRange(decoder, *task) for task in tasks]
+    result = {}
+    for pid in sorted(set().union(*parts)):
+        pieces = [part[pid] for part in parts if pid in part]   # map() preserves task order.
+        names = pieces[0][1].keys()
+        result[pid] = (
+            np.concatenate([ts for ts, _ in pieces]),
+            {name: np.concatenate([values[name] for _, values in pieces]) for name in names}
+        )
+    return result
+
+
+def planTasks(filenames, workers: int = None, chunksPerTask: int = None):
+    """Apply the defaults of :func:`convertRecording`.
+
+    Returns
+    -------
+    tuple (workers, tasks)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksPerTask is None:
+        total = 0
+        for filename in filenames:
+            with MappedRecording(filename) as rec:
+                total += len(rec)
+        chunksPerTask = max(1, -(-total // (max(workers, 1) * TASKS_PER_WORKER)))
+    return (workers, makeTasks(filenames, chunksPerTask))
+
+
+def convertRecordingTo(layout, filenames, output, format: str = "npz", workers: int = None,
+                       chunksPerTask: int = None) -> int:
+    """Like :func:`convertRecording`, but writes `output` directly.
+
+    Workers don't send decoded arrays back, but write them to a temporary
+    directory next to `output`; these parts are merged in task order, one at a time.
+
+    Parameters
+    ----------
+    output: str or :class:`pathlib.Path`
+        File (npz) or directory (parquet).
+    format: str
+        One of :data:`OUTPUT_FORMATS`.
+
+    Returns
+    -------
+    int
+        Number of ODTs written.
+    """
+    if format not in OUTPUT_FORMATS:
+        raise ValueError("Invalid output format '{}' -- choose from {}".format(format, list(OUTPUT_FORMATS)))
+    if format == "parquet" and not HAS_PYARROW:
+        raise RuntimeError("Parquet output requires pyarrow.")
+    workers, tasks = planTasks(filenames, workers, chunksPerTask)
+    directory = pathlib.Path(output).resolve().parent
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="xdaq-", dir=str(directory)) as tmp:
+        paths = [os.path.join(tmp, "part{:06d}".format(idx)) for idx in range(len(tasks))]
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(layout.toDict(), )) as pool:
+                parts = list(pool.map(_decodeRangeTo, *zip(*tasks), paths)) if tasks else []
+        else:
+            decoder = DaqDecoder(layout)
+            parts = [decodeRangeTo(decoder, *task, path) for task, path in zip(tasks, paths)]
+        pieces = {pid: [part[pid] for part in parts if pid in part] for pid in sorted(set().union(*parts))}
+        if format == "parquet":
+            writeParquetParts(pieces, output)
+        else:
+            writeNpzParts(pieces, output)
+    return len(pieces)
+
+
+def _loadParts(pieces, key: str):
+    for name, _, _ in pieces:
+        with np.load(name) as data:
+            yield data[key]
+
+
+def _writeColumn(archive, name: str, arrays, length: int):
+    with archive.open("{}.npy".format(name), "w", force_zip64=True) as fp:
+        for idx, array in enumerate(arrays):
+            array = np.ascontiguousarray(array)
+            if not idx:
+                header = np.lib.format.header_data_from_array_1_0(array)
+                header["shape"] = (length, ) + array.shape[1:]
+                np.lib.format.write_array_header_1_0(fp, header)
+            fp.write(array.tobytes())
+
+
+def writeNpzParts(pieces, filename):
+    """Write the parts of :func:`convertRecordingTo` like :func:`writeNpz`, one part at a time.
+
+    Parameters
+    ----------
+    pieces: dict
+        pid -> list of (file name, signal names, number of samples), see :func:`decodeRangeTo`.
+    """
+    filename = str(filename)
+    if not filename.endswith(".npz"):
+        filename += ".npz"  # Like numpy.savez().
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for parts in pieces.values():
+            length = sum(count for _, _, count in parts)
+            for idx, name in enumerate(parts[0][1], 1):
+                _writeColumn(archive, name, _loadParts(parts, "arr_{}".format(idx)), length)
+                _writeColumn(archive, "{}.timestamp".format(name), _loadParts(parts, "arr_0"), length)
+
+
+def writeParquetParts(pieces, directory):
+    """Write the parts of :func:`convertRecordingTo` like :func:`writeParquet`, a row group per part.
+    """
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet output requires pyarrow.")
+    pth = pathlib.Path(directory)
+    pth.mkdir(parents=True, exist_ok=True)
+    for pid, parts in pieces.items():
+        writer = None
+        for name, names, _ in parts:
+            with np.load(name) as data:
+                table = pyarrow.table(dict(
+                    [("timestamp", data["arr_0"])] + [(n, data["arr_{}".format(i)]) for i, n in enumerate(names, 1)]
+                ))
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(str(pth / "odt_{:03d}.parquet".format(pid)), table.schema)
+            writer.write_table(table)
+        writer.close()
+
+
+def writeNpz(columns, filename):
+    arrays = {}
+    for timestamps, values in columns.values():
+        for name, data in values.items():
+            arrays[name] = data
+            arrays["{}.timestamp".format(name)] = timestamps
+    np.savez(str(filename), **arrays)
+
+
+def writeParquet(columns, directory):
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet output requires pyarrow.")
+    pth = pathlib.Path(directory)
+    pth.mkdir(parents=True, exist_ok=True)
+    for pid, (timestamps, values) in columns.items():
+        table = pyarrow.table(dict([("timestamp", timestamps)] + list(values.items())))
+        pyarrow.parquet.write_table(table, str(pth / "odt_{:03d}.parquet".format(pid)))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Convert DAQ recordings to columnar files.")
+    parser.add_argument("layout", type=argparse.FileType("r"), help="DAQ layout (JSON or TOML).")
+    parser.add_argument("recordings", nargs="+", help="Recording file(s), rotated files in chronological order.")
+    parser.add_argument("-o", "--output", required=True, help="Output file (npz) or directory (parquet).")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="npz")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--chunks-per-task", type=int, default=None)
+    args = parser.parse_args(args)
+
+    if args.format == "parquet" and not HAS_PYARROW:
+        parser.error("Parquet output requires pyarrow.")
+    layout = DaqLayout.fromFile(args.layout)
+    count = convertRecordingTo(layout, args.recordings, args.output, args.format, args.jobs, args.chunks_per_task)
+    logger.info("Wrote {} ODTs to '{}'.".format(count, args.output))
+
+
+if __name__ == "__main__":
+    main()
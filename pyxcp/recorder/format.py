@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Binary layout of DAQ recordings.
+
+::
+
+    File      := FileHeader Chunk*
+    Chunk     := ChunkHeader Payload
+    Payload   := Record*
+    Record    := RecordHeader Packet
+
+All numbers are little-endian, timestamps are nano seconds
+(:func:`time.perf_counter_ns` time-base, see :class:`FileHeader`).
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import namedtuple
+import struct
+
+FILE_MAGIC = b"PYXCPDAQ"
+CHUNK_MAGIC = b"CHNK"
+FORMAT_VERSION = 2     # 2: sync tables.
+FILE_SUFFIX = ".xdaq"
+
+# magic, version, flags, wall-clock (time_ns), host clock (perf_counter_ns)
+# -- both clocks are sampled at the same time and relate record timestamps to wall-clock.
+FILE_HEADER = struct.Struct("<8sHHqq")
+
+# magic, compression, flags, reserved, number of records,
+# size of stored payload, size of (uncompressed) payload, CRC32 of sync table and stored payload,
+# first timestamp, last timestamp.
+CHUNK_HEADER = struct.Struct("<4sBBHIIIIqq")
+
+# length of packet, transport-layer counter, timestamp.
+RECORD_HEADER = struct.Struct("<HHq")
+
+# Chunk flags.
+CHUNK_SYNC_TABLE = 0x01
+
+# The sync table sits between chunk header and stored payload: payload offsets of every
+# SYNC_INTERVAL-th record, so readers can locate records without walking the length prefixes.
+SYNC_INTERVAL = 64
+SYNC_ENTRY = struct.Struct("<I")
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+
+COMPRESSION_METHODS = {
+    None:   COMPRESSION_NONE,
+    "none": COMPRESSION_NONE,
+    "zlib": COMPRESSION_ZLIB,
+    "lzma": COMPRESSION_LZMA,
+}
+
+FileHeader = namedtuple("FileHeader", "magic version flags wallClock hostClock")
+
+ChunkHeader = namedtuple("ChunkHeader", "magic compression flags reserved recordCount "
+    "storedSize size crc firstTimestamp lastTimestamp"
+)
+
+
+def syncTableSize(header: ChunkHeader) -> int:
+    """Size of the sync table following the chunk header.
+    """
+    if not header.flags & CHUNK_SYNC_TABLE:
+        return 0
+    return (header.recordCount + SYNC_INTERVAL - 1) // SYNC_INTERVAL * SYNC_ENTRY.size
+
+
+def packSyncTable(offsets) -> bytes:
+    return struct.pack("<{}I".format(len(offsets)), *offsets)
+
+
+class RecordingError(Exception):
+    """Malformed or unsupported recording file.
+    """
+
+
+def parseFileHeader(data) -> FileHeader:
+    header = FileHeader(*FILE_HEADER.unpack_from(data))
+    if header.magic != FILE_MAGIC:
+        raise RecordingError("Not a pyXCP DAQ recording.")
+    if header.version > FORMAT_VERSION:
+        raise RecordingError("Unsupported recording version {}.".format(header.version))
+    return header
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Sparse time index of DAQ recordings.
+
+Every `interval` records an entry (timestamp, byte position, PID range) is
+written to a side file (`run.xdaq` -> `run.xidx`), so time-range queries
+boil down to a binary search. Missing index files are rebuilt from the data.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import os
+import pathlib
+import struct
+
+from pyxcp.logger import Logger
+from pyxcp.recorder.format import CHUNK_HEADER, CHUNK_MAGIC, RECORD_HEADER, ChunkHeader, RecordingError, syncTableSize
+from pyxcp.recorder.reader import indexChunks, readChunk
+
+INDEX_MAGIC = b"PYXCPIDX"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".xidx"
+DEFAULT_INTERVAL = 1024
+
+# magic, version, reserved, interval
+INDEX_HEADER = struct.Struct("<8sHHI")
+
+# timestamp of first record, file offset of chunk, offset of first record within
+# (uncompressed) chunk payload, number of records, lowest PID, highest PID, reserved
+INDEX_ENTRY = struct.Struct("<qQIIBBH")
+
+logger = Logger("recorder.index")
+
+IndexEntry = namedtuple("IndexEntry", "timestamp chunkOffset payloadOffset recordCount minPid maxPid")
+
+
+def indexFileName(filename) -> pathlib.Path:
+    return pathlib.Path(filename).with_suffix(INDEX_SUFFIX)
+
+
+class IndexWriter:
+    """Appends index entries to a side file (used by :class:`~pyxcp.recorder.writer.DaqRecorder`).
+    """
+
+    def __init__(self, filename, interval: int):
+        self.interval = interval
+        self._fp = open(str(indexFileName(filename)), "wb")
+        self._fp.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, interval))
+        self._fp.flush()
+
+    def write(self, chunkOffset: int, entries):
+        """
+        Parameters
+        ----------
+        chunkOffset: int
+        entries: list of tuple (timestamp, payloadOffset, recordCount, minPid, maxPid)
+        """
+        pack = INDEX_ENTRY.pack
+        self._fp.write(b''.join(
+            pack(ts, chunkOffset, payloadOffset, count, minPid, maxPid, 0)
+            for ts, payloadOffset, count, minPid, maxPid in entries
+        ))
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+
+def scanChunk(payload, interval: int):
+    """Compute index entries of a single chunk payload.
+
+    Returns
+    -------
+    list of tuple (timestamp, payloadOffset, recordCount, minPid, maxPid)
+    """
+    unpack = RECORD_HEADER.unpack_from
+    headerSize = RECORD_HEADER.size
+    result = []
+    offset = 0
+    end = len(payload)
+    while offset < end:
+        start = offset
+        count = 0
+        minPid = 0xff
+        maxPid = 0
+        firstTimestamp = None
+        while offset < end and count < interval:
+            length, _, timestamp = unpack(payload, offset)
+            if firstTimestamp is None:
+                firstTimestamp = timestamp
+            pid = payload[offset + headerSize] if length else 0
+            if pid < minPid:
+                minPid = pid
+            if pid > maxPid:
+                maxPid = pid
+            offset += headerSize + length
+            count += 1
+        result.append((firstTimestamp, start, count, minPid, maxPid))
+    return result
+
+
+class TimeIndex:
+    """Sparse time index of a single recording file.
+
+    Parameters
+    ----------
+    entries: list of :class:`IndexEntry`
+    interval: int
+    """
+
+    def __init__(self, entries, interval: int):
+        self.entries = entries
+        self.interval = interval
+        self.timestamps = [e.timestamp for e in entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, filename):
+        """Load the index of a recording file.
+
+        Parameters
+        ----------
+        filename: str or :class:`pathlib.Path`
+            Name of the recording or the index file.
+        """
+        with open(str(indexFileName(filename)), "rb") as fp:
+            data = fp.read()
+        if len(data) < INDEX_HEADER.size:
+            raise RecordingError("'{}' is not a valid index file.".format(filename))
+        magic, version, _, interval = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or version > INDEX_VERSION:
+            raise RecordingError("'{}' is not a valid index file.".format(filename))
+        usable = len(data) - (len(data) - INDEX_HEADER.size) % INDEX_ENTRY.size  # Ignore torn entry.
+        entries = [
+            IndexEntry(ts, co, po, cnt, lo, hi)
+            for ts, co, po, cnt, lo, hi, _ in INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size : usable])
+        ]
+        return cls(entries, interval)
+
+    @classmethod
+    def build(cls, filename, interval: int = DEFAULT_INTERVAL, save: bool = True):
+        """(Re-)build the index by scanning the recording.
+
+        Parameters
+        ----------
+        filename: str or :class:`pathlib.Path`
+        interval: int
+        save: bool
+            Write the index file.
+        """
+        writer = IndexWriter(filename, interval) if save else None
+        entries = []
+        for chunkOffset, _ in indexChunks(filename):
+            _, payload = readChunk(filename, chunkOffset)
+            chunkEntries = scanChunk(payload, interval)
+            entries.extend(IndexEntry(ts, chunkOffset, po, cnt, lo, hi) for ts, po, cnt, lo, hi in chunkEntries)
+            if writer:
+                writer.write(chunkOffset, chunkEntries)
+        if writer:
+            writer.close()
+        return cls(entries, interval)
+
+    @classmethod
+    def open(cls, filename, interval: int = DEFAULT_INTERVAL):
+        """Load the index, rebuild it if the index file is missing, invalid or doesn't
+        match the recording.
+
+        Validation is cheap (see :meth:`matches`), the recording is only scanned
+        (see :meth:`covers`) if that fails.
+        """
+        idxName = indexFileName(filename)
+        if idxName.exists():
+            try:
+                index = cls.load(filename)
+            except RecordingError as e:
+                logger.warn("{} -- rebuilding.".format(e))
+            else:
+                if index.matches(filename):
+                    return index
+                if index.covers(indexChunks(filename)):
+                    os.utime(str(idxName))  # Up to date, next time the cheap check suffices.
+                    return index
+                logger.warn("Index of '{}' is stale or incomplete -- rebuilding.".format(filename))
+        return cls.build(filename, interval)
+
+    def matches(self, filename) -> bool:
+        """Cheap check if the index belongs to the recording: the index file isn't older than
+        the recording and the last chunk it refers to is intact, ends the file and
+        holds the indexed records. Only this chunk header is read.
+
+        Parameters
+        ----------
+        filename: str or :class:`pathlib.Path`
+        """
+        if not self.entries:
+            return False
+        chunkOffset = self.entries[-1].chunkOffset
+        try:
+            if os.stat(str(indexFileName(filename))).st_mtime_ns < os.stat(str(filename)).st_mtime_ns:
+                return False
+            with open(str(filename), "rb") as fp:
+                fileSize = fp.seek(0, 2)
+                fp.seek(chunkOffset)
+                data = fp.read(CHUNK_HEADER.size)
+        except OSError:
+            return False
+        if len(data) < CHUNK_HEADER.size:
+            return False
+        header = ChunkHeader(*CHUNK_HEADER.unpack(data))
+        entries = [e for e in self.entries if e.chunkOffset == chunkOffset]
+        return header.magic == CHUNK_MAGIC and \
+            chunkOffset + CHUNK_HEADER.size + syncTableSize(header) + header.storedSize == fileSize and \
+            sum(e.recordCount for e in entries) == header.recordCount and entries[0].timestamp == header.firstTimestamp
+
+    def covers(self, chunks) -> bool:
+        """Check if the index refers to exactly the given chunks, with all of their records.
+
+        Parameters
+        ----------
+        chunks: list of tuple (offset, :class:`~pyxcp.recorder.format.ChunkHeader`)
+            As returned by :func:`~pyxcp.recorder.reader.indexChunks`.
+        """
+        counts = {}
+        for entry in self.entries:
+            counts[entry.chunkOffset] = counts.get(entry.chunkOffset, 0) + entry.recordCount
+        return len(counts) == len(chunks) and all(counts.get(offset) == header.recordCount for offset, header in chunks)
+
+    def lookup(self, start: int, stop: int = None, pids=None):
+        """Find the index entries covering a time range.
+
+        Parameters
+        ----------
+        start: int
+            Timestamp [ns].
+        stop: int or None
+            Timestamp [ns] (inclusive), None means up to the end.
+        pids: container or None
+            Only entries containing at least one of the given PIDs (range check).
+
+        Returns
+        -------
+        list of :class:`IndexEntry`
+        """
+        # The entry before the first one >= start may still contain records >= start.
+        first = max(bisect_left(self.timestamps, start) - 1, 0)
+        last = len(self.entries) if stop is None else bisect_right(self.timestamps, stop)
+        result = self.entries[first:last]
+        if pids is not None:
+            result = [e for e in result if any(e.minPid <= p <= e.maxPid for p in pids)]
+        return result
+
+
+def readTimeRange(filename, start: int, stop: int = None, pids=None, index: TimeIndex = None):
+    """Read records of a time range, only the chunks involved are read.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+    start: int
+        Timestamp [ns].
+    stop: int or None
+        Timestamp [ns] (inclusive), None means up to the end.
+    pids: container or None
+        Restrict to these PIDs.
+    index: :class:`TimeIndex` or None
+        Defaults to :meth:`TimeIndex.open`.
+
+    Yields
+    ------
+    tuple (packet, counter, length, timestamp)
+    """
+    if index is None:
+        index = TimeIndex.open(filename)
+    unpack = RECORD_HEADER.unpack_from
+    headerSize = RECORD_HEADER.size
+    chunkOffset = payload = None
+    for entry in index.lookup(start, stop, pids):
+        if entry.chunkOffset != chunkOffset:
+            chunkOffset = entry.chunkOffset
+            _, payload = readChunk(filename, chunkOffset)
+        offset = entry.payloadOffset
+        for _ in range(entry.recordCount):
+            length, counter, timestamp = unpack(payload, offset)
+            offset += headerSize
+            if timestamp >= start and (stop is None or timestamp <= stop) and \
+                    (pids is None or (length and payload[offset] in pids)):
+                yield (bytes(payload[offset : offset + length]), counter, length, timestamp)
+            offset += length
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Streaming ASAM MDF 4.1 writer for DAQ measurements.
+
+The file is laid out as a single *unsorted* data group: every ODT becomes a
+channel group whose record ID is the PID, so DTOs are stored as they come in
+(the PID doubles as record ID), followed by the host timestamp as master
+channel. Records are appended in DT blocks of bounded size, which are linked
+by a DL block when the file is closed; nothing but the current block is held
+in memory.
+
+Until :meth:`Mdf4Writer.close` the file is marked as unfinalized (``UnFinMF``).
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import struct
+from time import perf_counter_ns, time_ns
+
+from pyxcp.daq.drain import DaqDrain
+from pyxcp.daq.layout import DATA_TYPES, PID_SIZE
+from pyxcp.logger import Logger
+from pyxcp.version import __version__
+
+MDF_SUFFIX = ".mf4"
+
+BLOCK_HEADER = struct.Struct("<4s4xQQ")     # id, reserved, length, link count
+LINK = struct.Struct("<Q")
+TIMESTAMP = struct.Struct("<q")
+
+ID_BLOCK = struct.Struct("<8s8s8s4xH30xHH")
+ID_SIZE = 64
+HD_DATA = struct.Struct("<QhhBBBxdd")
+FH_DATA = struct.Struct("<QhhB3x")
+DG_DATA = struct.Struct("<B7x")
+CG_DATA = struct.Struct("<QQHH4xII")
+CN_DATA = struct.Struct("<BBBBIIIIBxH6d")
+CC_DATA = struct.Struct("<BBHHHdd")
+DL_DATA = struct.Struct("<B3xI")
+
+HD_LINKS = 6
+CG_LINKS = 6
+
+# id_unfin_flags: cycle counters of CG blocks and the DL block have to be updated.
+UNFIN_CG_COUNTERS = 0x01
+UNFIN_DL = 0x10
+
+CN_TYPE_FIXED = 0
+CN_TYPE_MASTER = 2
+CN_SYNC_NONE = 0
+CN_SYNC_TIME = 1
+
+CC_TYPE_LINEAR = 1
+
+# struct type character -> (MDF data type little endian, big endian)
+MDF_DATA_TYPES = {
+    "B": (0, 1), "H": (0, 1), "I": (0, 1), "Q": (0, 1),
+    "b": (2, 3), "h": (2, 3), "i": (2, 3), "q": (2, 3),
+    "f": (4, 5), "d": (4, 5),
+}
+MDF_INT_LE = 2
+
+FH_COMMENT = (
+    "<FHcomment><TX>Created</TX><tool_id>pyxcp</tool_id><tool_vendor>pyxcp</tool_vendor>"
+    "<tool_version>{}</tool_version></FHcomment>"
+)
+
+
+def align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def makeBlock(blockId: bytes, links=(), data: bytes = b"", pad: bool = True) -> bytes:
+    """
+    Parameters
+    ----------
+    blockId: bytes
+        e.g. b"##DG"
+    links: sequence of int
+    data: bytes
+    pad: bool
+        Pad to 8 byte boundary (counted in block length).
+    """
+    size = BLOCK_HEADER.size + LINK.size * len(links) + len(data)
+    length = align(size) if pad else size
+    return b"".join([
+        BLOCK_HEADER.pack(blockId, length, len(links)), b"".join(LINK.pack(link) for link in links),
+        data, bytes(length - size)
+    ])
+
+
+class Mdf4Writer:
+    """Write DAQ packets to an MDF4 file.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+    layout: :class:`~pyxcp.daq.layout.DaqLayout`
+        Every ODT becomes a channel group, packets with unknown PIDs are dropped.
+    queue: :class:`collections.deque` or None
+        Source of DAQ elements ``(packet, counter, length, timestamp)`` for :meth:`start`,
+        usually :attr:`pyxcp.transport.base.BaseTransport.daqQueue` (requires `CREATE_DAQ_TIMESTAMPS`).
+    blockSize: int
+        Records are written as DT block once `blockSize` bytes are buffered.
+
+    Example
+    -------
+    .. code-block:: python
+
+        with Mdf4Writer("run.mf4", layout, xm.transport.daqQueue):
+            ...
+
+        # Conversion of a recording:
+        with Mdf4Writer("run.mf4", layout) as writer:
+            writer.extend(readRecords("run.xdaq"))
+    """
+
+    def __init__(self, filename, layout, queue=None, blockSize: int = 4 * 1024 * 1024):
+        self.filename = filename
+        self.layout = layout
+        self.queue = queue
+        self.blockSize = blockSize
+        self.logger = Logger("Mdf4Writer")
+        self.startTime = time_ns()
+        self.startCounter = perf_counter_ns()   # Master channel is relative to this.
+        self.recordSizes = {}       # PID -> record size without record ID.
+        self.cycleCounts = [0] * 256
+        self.droppedCount = 0
+        self._cgOffsets = {}
+        self._blocks = []           # (file offset, logical offset) of DT blocks.
+        self._dataLength = 0
+        self._buffer = bytearray()
+        self._timestampsChecked = False
+        self._drain = None
+        self._fp = open(str(filename), "w+b")
+        self._writeHeader()
+
+    def __enter__(self):
+        if self.queue is not None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self, block: bytes) -> int:
+        offset = self._fp.tell()
+        self._fp.write(block)
+        return offset
+
+    def _text(self, text: str, blockId: bytes = b"##TX") -> int:
+        return self._write(makeBlock(blockId, data=text.encode("utf-8") + b"\x00"))
+
+    def _idBlock(self, finalized: bool) -> bytes:
+        return ID_BLOCK.pack(
+            b"MDF     " if finalized else b"UnFinMF ", b"4.10    ", b"pyxcp   ", 410,
+            0 if finalized else UNFIN_CG_COUNTERS | UNFIN_DL, 0
+        )
+
+    def _writeHeader(self):
+        fp = self._fp
+        fp.write(self._idBlock(False))
+        hdOffset = ID_SIZE
+        fp.write(bytes(BLOCK_HEADER.size + HD_LINKS * LINK.size + HD_DATA.size))   # Written last.
+
+        comment = self._text(FH_COMMENT.format(__version__), b"##MD")
+        fhOffset = self._write(makeBlock(b"##FH", (0, comment), FH_DATA.pack(self.startTime, 0, 0, 0)))
+
+        timeName = self._text("time")
+        timeUnit = self._text("s")
+        timeConversion = self._write(makeBlock(
+            b"##CC", (0, 0, 0, 0), CC_DATA.pack(CC_TYPE_LINEAR, 0, 0, 0, 2, 0.0, 0.0) + struct.pack("<dd", 0.0, 1e-9)
+        ))
+
+        prefix = self.layout.byteOrderPrefix
+        bigEndian = 1 if prefix == ">" else 0
+        groups = []
+        for pid, (daqList, odtNumber) in sorted(self.layout.pidMap.items()):
+            odt = daqList.odts[odtNumber]
+            headerSize = daqList.headerSize(odtNumber)
+            packetSize = daqList.packetSize(odtNumber)
+            dataBytes = packetSize - PID_SIZE + TIMESTAMP.size
+            self.recordSizes[pid] = packetSize
+            channels = [(timeName, CN_TYPE_MASTER, CN_SYNC_TIME, MDF_INT_LE, packetSize - PID_SIZE, 64,
+                         timeConversion, timeUnit)]
+            if odtNumber == 0 and daqList.timestampSize:
+                channels.append((
+                    self._text("daq{}.timestamp".format(daqList.number)), CN_TYPE_FIXED, CN_SYNC_NONE,
+                    bigEndian, daqList.timestampOffset - PID_SIZE, daqList.timestampSize * 8, 0, 0
+                ))
+            for meas in odt.measurements:
+                size, typeChar = DATA_TYPES[meas.dataType]
+                channels.append((
+                    self._text(meas.name), CN_TYPE_FIXED, CN_SYNC_NONE, MDF_DATA_TYPES[typeChar][bigEndian],
+                    headerSize - PID_SIZE + meas.offset, size * 8, 0, 0
+                ))
+            nextChannel = 0
+            for name, cnType, syncType, dataType, byteOffset, bitCount, conversion, unit in reversed(channels):
+                nextChannel = self._write(makeBlock(
+                    b"##CN", (nextChannel, 0, name, 0, conversion, 0, unit, 0),
+                    CN_DATA.pack(cnType, syncType, dataType, 0, byteOffset, bitCount, 0, 0, 0, 0,
+                                 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+                ))
+            acqName = self._text("DAQ {} ODT {}".format(daqList.number, odtNumber))
+            groups.append((pid, nextChannel, acqName, dataBytes))
+
+        nextGroup = 0
+        for pid, firstChannel, acqName, dataBytes in reversed(groups):
+            nextGroup = self._write(makeBlock(
+                b"##CG", (nextGroup, firstChannel, acqName, 0, 0, 0), CG_DATA.pack(pid, 0, 0, 0, dataBytes, 0)
+            ))
+            self._cgOffsets[pid] = nextGroup
+        self._dgOffset = self._write(makeBlock(b"##DG", (0, nextGroup, 0, 0), DG_DATA.pack(PID_SIZE)))
+
+        fp.seek(hdOffset)
+        fp.write(makeBlock(
+            b"##HD", (self._dgOffset, fhOffset, 0, 0, 0, 0), HD_DATA.pack(self.startTime, 0, 0, 0, 0, 0, 0.0, 0.0)
+        ))
+        fp.seek(0, 2)
+        fp.flush()
+
+    def append(self, packet, counter, length, timestamp):
+        """Add a single DAQ element.
+        """
+        self.extend(((packet, counter, length, timestamp), ))
+
+    def extend(self, elements):
+        """Add DAQ elements ``(packet, counter, length, timestamp)``.
+        """
+        sizes = self.recordSizes
+        counts = self.cycleCounts
+        pack = TIMESTAMP.pack
+        startCounter = self.startCounter
+        blockSize = self.blockSize
+        buffer = self._buffer
+        for packet, _, _, timestamp in elements:
+            pid = packet[0]
+            size = sizes.get(pid)
+            if size is None:
+                self.droppedCount += 1
+                continue
+            if len(packet) != size:
+                packet = bytes(packet[:size]).ljust(size, b"\x00")  # e.g. padded CAN frames.
+            buffer += packet
+            buffer += pack(timestamp - startCounter)
+            counts[pid] += 1
+            if len(buffer) >= blockSize:
+                self.flush()
+                buffer = self._buffer
+
+    def flush(self):
+        """Write buffered records as DT block.
+        """
+        if not self._buffer:
+            return
+        block = makeBlock(b"##DT", data=self._buffer, pad=False)
+        self._blocks.append((self._write(block), self._dataLength))
+        self._fp.write(bytes(align(len(block)) - len(block)))
+        self._dataLength += len(self._buffer)
+        self._buffer = bytearray()
+
+    def start(self):
+        """Attach to the :class:`~pyxcp.daq.drain.DaqDrain` of :attr:`queue`.
+        """
+        if self._drain is None:
+            self._drain = DaqDrain.forQueue(self.queue)
+            self._drain.attach(self._consume)
+
+    def stop(self):
+        if self._drain is not None:
+            self._drain.detach(self._consume)
+            self._drain = None
+
+    def _consume(self, elements, final: bool):
+        if not elements:
+            return
+        if not self._timestampsChecked:
+            self._timestampsChecked = True
+            if not elements[0][3]:
+                self.logger.warn("DAQ packets carry no timestamps (CREATE_DAQ_TIMESTAMPS is off), "
+                    "time channel is meaningless.")
+        self.extend(elements)
+
+    def close(self):
+        """Write remaining records, link DT blocks and finalize the file.
+        """
+        if self._fp is None:
+            return
+        self.stop()
+        self.flush()
+        fp = self._fp
+        if self._blocks:
+            links = [offset for offset, _ in self._blocks]
+            offsets = b"".join(struct.pack("<Q", dataOffset) for _, dataOffset in self._blocks)
+            dataLink = self._write(makeBlock(b"##DL", [0] + links, DL_DATA.pack(0, len(links)) + offsets))
+            fp.seek(self._dgOffset + BLOCK_HEADER.size + 2 * LINK.size)
+            fp.write(LINK.pack(dataLink))
+        for pid, offset in self._cgOffsets.items():
+            fp.seek(offset + BLOCK_HEADER.size + CG_LINKS * LINK.size + 8)
+            fp.write(struct.pack("<Q", self.cycleCounts[pid]))
+        fp.seek(0)
+        fp.write(self._idBlock(True))
+        fp.close()
+        self._fp = None
+        if self.droppedCount:
+            self.logger.warn("{} packets with unknown PIDs dropped.".format(self.droppedCount))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Multi-resolution min/max/mean pyramid of recorded signals.
+
+For every signal and decimation factor (10, 100, 1000 by default) the bucket
+minimum, maximum, mean and first timestamp are stored as `.npy` files in a
+directory next to the recording (`run.xdaq` -> `run.xpyr/`)::
+
+    speed.10.min.npy  speed.10.max.npy  speed.10.mean.npy  speed.10.timestamp.npy
+    speed.100.min.npy ...
+
+Files are memory-mapped on reading, so rendering a zoom level touches only
+O(pixels) data. The pyramid is built in a single streaming pass over the
+recording, coarser levels are reduced from finer ones.
+
+.. note:: Requires NumPy.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import pathlib
+
+import numpy as np
+
+from pyxcp.daq.decoder import TIMESTAMP_FIELD
+from pyxcp.recorder.reader import MappedRecording
+
+PYRAMID_SUFFIX = ".xpyr"
+DEFAULT_FACTORS = (10, 100, 1000)
+STATISTICS = ("min", "max", "mean", "timestamp")
+
+NPY_HEADER_SIZE = 128   # Fixed, so the header can be rewritten once the length is known.
+
+
+def pyramidDirectory(filename) -> pathlib.Path:
+    return pathlib.Path(filename).with_suffix(PYRAMID_SUFFIX)
+
+
+class NpyAppender:
+    """Write a one-dimensional `.npy` file of unknown length incrementally.
+    """
+
+    def __init__(self, filename, dtype):
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._fp = open(str(filename), "wb")
+        self._fp.write(self._header())
+
+    def _header(self) -> bytes:
+        header = repr({
+            "descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.length, )
+        })
+        magic = np.lib.format.magic(1, 0)
+        size = NPY_HEADER_SIZE - len(magic) - 2
+        return magic + size.to_bytes(2, "little") + header.ljust(size - 1).encode("latin1") + b"\n"
+
+    def append(self, data):
+        self._fp.write(np.ascontiguousarray(data, dtype=self.dtype).tobytes())
+        self.length += len(data)
+
+    def close(self):
+        self._fp.seek(0)
+        self._fp.write(self._header())
+        self._fp.close()
+
+
+class _Level:
+    """A single pyramid level, reduces the output of the level below by `ratio`.
+    """
+
+    def __init__(self, directory, name: str, factor: int, ratio: int, dtype, parent=None):
+        self.ratio = ratio
+        self.parent = parent
+        self.files = {
+            stat: NpyAppender(
+                directory / "{}.{}.{}.npy".format(name, factor, stat),
+                np.int64 if stat == "timestamp" else (np.float64 if stat == "mean" else dtype)
+            ) for stat in STATISTICS
+        }
+        self._pending = None  # (min, max, sum, count, timestamp) not yet reduced.
+
+    def push(self, mins, maxs, sums, counts, timestamps):
+        if self._pending is not None:
+            mins, maxs, sums, counts, timestamps = (
+                np.concatenate((p, a)) for p, a in zip(self._pending, (mins, maxs, sums, counts, timestamps))
+            )
+        full = len(mins) // self.ratio * self.ratio
+        if full:
+            self._reduce(*(a[:full].reshape(-1, self.ratio) for a in (mins, maxs, sums, counts, timestamps)))
+        self._pending = tuple(a[full:] for a in (mins, maxs, sums, counts, timestamps))
+
+    def _reduce(self, mins, maxs, sums, counts, timestamps):
+        result = (mins.min(axis=1), maxs.max(axis=1), sums.sum(axis=1), counts.sum(axis=1), timestamps[:, 0])
+        self.files["min"].append(result[0])
+        self.files["max"].append(result[1])
+        self.files["mean"].append(result[2] / result[3])
+        self.files["timestamp"].append(result[4])
+        if self.parent is not None:
+            self.parent.push(*result)
+
+    def finish(self):
+        """Emit the incomplete last bucket and close files.
+        """
+        if self._pending is not None and len(self._pending[0]):
+            self._reduce(*(a.reshape(1, -1) for a in self._pending))
+        self._pending = None
+        for fp in self.files.values():
+            fp.close()
+        if self.parent is not None:
+            self.parent.finish()
+
+
+class PyramidBuilder:
+    """Streaming pyramid computation.
+
+    Parameters
+    ----------
+    directory: str or :class:`pathlib.Path`
+    signals: dict
+        Signal name -> NumPy dtype.
+    factors: tuple of int
+        Increasing decimation factors, every factor must be a multiple of its predecessor.
+    """
+
+    def __init__(self, directory, signals, factors=DEFAULT_FACTORS):
+        ratios = [factors[0]] + [b // a for a, b in zip(factors, factors[1:])]
+        if any(r < 2 for r in ratios) or any(b % a for a, b in zip(factors, factors[1:])):
+            raise ValueError("Decimation factors must be increasing multiples, got {}.".format(factors))
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.factors = tuple(factors)
+        self._levels = {}
+        for name, dtype in signals.items():
+            level = None
+            for factor, ratio in reversed(list(zip(factors, ratios))):
+                level = _Level(self.directory, name, factor, ratio, dtype, level)
+            self._levels[name] = level
+
+    def append(self, name: str, timestamps, values):
+        """Feed raw samples of a signal.
+        """
+        if not len(values):
+            return
+        self._levels[name].push(
+            values, values, values.astype(np.float64), np.ones(len(values), dtype=np.int64), timestamps
+        )
+
+    def close(self):
+        for level in self._levels.values():
+            level.finish()
+
+
+def buildPyramid(filename, decoder, factors=DEFAULT_FACTORS, directory=None):
+    """Post-process a recording.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+    decoder: :class:`pyxcp.daq.decoder.DaqDecoder`
+    factors: tuple of int
+    directory: str or :class:`pathlib.Path` or None
+        Defaults to :func:`pyramidDirectory`.
+
+    Returns
+    -------
+    :class:`Pyramid`
+    """
+    if directory is None:
+        directory = pyramidDirectory(filename)
+    signals = {}
+    for pid, dtype in decoder.dtypes.items():
+        for name in dtype.names:
+            if name != TIMESTAMP_FIELD:
+                signals[name] = dtype[name]
+    builder = PyramidBuilder(directory, signals, factors)
+    with MappedRecording(filename) as rec:
+        for chunk in rec.iterChunks():
+            for pid, dtype in decoder.dtypes.items():
+                timestamps, data = chunk.decode(decoder, pid)
+                for name in dtype.names:
+                    if name != TIMESTAMP_FIELD:
+                        builder.append(name, timestamps, data[name])
+    builder.close()
+    return Pyramid(directory)
+
+
+class Pyramid:
+    """Read access to a pyramid directory, all arrays are memory-mapped.
+
+    Parameters
+    ----------
+    directory: str or :class:`pathlib.Path`
+        Pyramid directory or name of the recording.
+    """
+
+    def __init__(self, directory):
+        pth = pathlib.Path(directory)
+        if pth.suffix != PYRAMID_SUFFIX:
+            pth = pyramidDirectory(pth)
+        self.directory = pth
+        self.factors = {}
+        for fname in pth.glob("*.timestamp.npy"):
+            name, factor, _, _ = fname.name.rsplit(".", 3)
+            self.factors.setdefault(name, []).append(int(factor))
+        for factors in self.factors.values():
+            factors.sort()
+
+    @property
+    def signals(self):
+        return sorted(self.factors.keys())
+
+    def level(self, name: str, factor: int) -> dict:
+        """
+        Returns
+        -------
+        dict
+            statistic ("min", "max", "mean", "timestamp") -> memory-mapped array.
+        """
+        return {
+            stat: np.load(str(self.directory / "{}.{}.{}.npy".format(name, factor, stat)), mmap_mode="r")
+            for stat in STATISTICS
+        }
+
+    def query(self, name: str, start: int = None, stop: int = None, pixels: int = 1000):
+        """Select the coarsest level with at least `pixels` buckets in the time range.
+
+        Parameters
+        ----------
+        name: str
+        start: int or None
+            Timestamp [ns].
+        stop: int or None
+            Timestamp [ns] (inclusive).
+        pixels: int
+
+        Returns
+        -------
+        tuple (factor, dict statistic -> array)
+            If even the finest level is too coarse, the finest level is returned
+            (use the raw data for higher zoom levels).
+        """
+        factors = self.factors[name]
+        for factor in reversed(factors):
+            data = self.level(name, factor)
+            ts = data["timestamp"]
+            first = 0 if start is None else max(int(np.searchsorted(ts, start, side="right")) - 1, 0)
+            last = len(ts) if stop is None else int(np.searchsorted(ts, stop, side="right"))
+            if last - first >= pixels or factor == factors[0]:
+                return factor, {stat: arr[first:last] for stat, arr in data.items()}
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from array import array
+import lzma
+import mmap
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    HAS_NUMPY = False
+else:
+    HAS_NUMPY = True
+
+from pyxcp.logger import Logger
+from pyxcp.recorder.format import (
+    CHUNK_HEADER, CHUNK_MAGIC, COMPRESSION_LZMA, COMPRESSION_NONE, COMPRESSION_ZLIB,
+    FILE_HEADER, RECORD_HEADER, SYNC_INTERVAL, ChunkHeader, RecordingError, parseFileHeader, syncTableSize
+)
+
+logger = Logger("recorder.reader")
+
+if HAS_NUMPY:
+    RECORD_DTYPE = np.dtype([("length", "<u2"), ("counter", "<u2"), ("timestamp", "<i8")])   # RECORD_HEADER
+
+
+def decodePayload(header: ChunkHeader, stored):
+    """
+    Returns
+    -------
+    bytes-like
+        Uncompressed chunk payload.
+    """
+    if header.compression == COMPRESSION_NONE:
+        return stored
+    elif header.compression == COMPRESSION_ZLIB:
+        return zlib.decompress(stored)
+    elif header.compression == COMPRESSION_LZMA:
+        return lzma.decompress(stored, format=lzma.FORMAT_XZ)
+    raise RecordingError("Unsupported compression method {}.".format(header.compression))
+
+
+def readChunks(filename):
+    """Iterate over the chunks of a recording.
+
+    A truncated or corrupted chunk (e.g. after a crash) ends the iteration.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+
+    Yields
+    ------
+    tuple (:class:`~pyxcp.recorder.format.ChunkHeader`, bytes)
+        Chunk header and uncompressed payload.
+    """
+    with open(str(filename), "rb") as fp:
+        parseFileHeader(fp.read(FILE_HEADER.size))
+        while True:
+            data = fp.read(CHUNK_HEADER.size)
+            if not data:
+                break
+            if len(data) < CHUNK_HEADER.size:
+                logger.warn("'{}': truncated chunk header.".format(filename))
+                break
+            header = ChunkHeader(*CHUNK_HEADER.unpack(data))
+            if header.magic != CHUNK_MAGIC:
+                logger.warn("'{}': invalid chunk header.".format(filename))
+                break
+            table = fp.read(syncTableSize(header))
+            stored = fp.read(header.storedSize)
+            if len(stored) < header.storedSize or zlib.crc32(stored, zlib.crc32(table)) != header.crc:
+                logger.warn("'{}': truncated or corrupted chunk.".format(filename))
+                break
+            yield header, decodePayload(header, stored)
+
+
+def indexChunks(filename):
+    """Locate all chunks of a recording without reading (or decompressing) payloads.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+
+    Returns
+    -------
+    list of tuple (offset, :class:`~pyxcp.recorder.format.ChunkHeader`)
+        `offset` is the file position of the chunk header, see :func:`readChunk`.
+    """
+    result = []
+    with open(str(filename), "rb") as fp:
+        parseFileHeader(fp.read(FILE_HEADER.size))
+        offset = FILE_HEADER.size
+        fileSize = fp.seek(0, 2)
+        while offset + CHUNK_HEADER.size <= fileSize:
+            fp.seek(offset)
+            header = ChunkHeader(*CHUNK_HEADER.unpack(fp.read(CHUNK_HEADER.size)))
+            end = offset + CHUNK_HEADER.size + syncTableSize(header) + header.storedSize
+            if header.magic != CHUNK_MAGIC or end > fileSize:
+                break
+            result.append((offset, header))
+            offset = end
+    return result
+
+
+def readChunk(filename, offset: int):
+    """Random access to a single chunk.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+    offset: int
+        Position of the chunk header, see :func:`indexChunks`.
+
+    Returns
+    -------
+    tuple (:class:`~pyxcp.recorder.format.ChunkHeader`, bytes)
+    """
+    with open(str(filename), "rb") as fp:
+        fp.seek(offset)
+        header = ChunkHeader(*CHUNK_HEADER.unpack(fp.read(CHUNK_HEADER.size)))
+        if header.magic != CHUNK_MAGIC:
+            raise RecordingError("No chunk at offset {}.".format(offset))
+        table = fp.read(syncTableSize(header))
+        stored = fp.read(header.storedSize)
+    if len(stored) < header.storedSize or zlib.crc32(stored, zlib.crc32(table)) != header.crc:
+        raise RecordingError("Chunk at offset {} is truncated or corrupted.".format(offset))
+    return header, decodePayload(header, stored)
+
+
+def iterRecords(payload):
+    """Iterate over the records of a chunk payload.
+
+    Yields
+    ------
+    tuple (packet, counter, length, timestamp)
+        Same layout as the elements of :attr:`pyxcp.transport.base.BaseTransport.daqQueue`.
+    """
+    unpack = RECORD_HEADER.unpack_from
+    headerSize = RECORD_HEADER.size
+    offset = 0
+    end = len(payload)
+    while offset < end:
+        length, counter, timestamp = unpack(payload, offset)
+        offset += headerSize
+        yield (bytes(payload[offset : offset + length]), counter, length, timestamp)
+        offset += length
+
+
+def readRecords(*filenames):
+    """Iterate over all records of one or more (rotated) recording files.
+    """
+    for filename in filenames:
+        for _, payload in readChunks(filename):
+            yield from iterRecords(payload)
+
+
+class ChunkView:
+    """Zero-copy access to the records of a single chunk.
+
+    Record bookkeeping (offsets, PIDs, timestamps) is computed on first use;
+    with the sync table written by :class:`~pyxcp.recorder.writer.DaqRecorder`
+    this is vectorised: the length prefixes of all `SYNC_INTERVAL` record groups
+    are walked in lockstep, i.e. `SYNC_INTERVAL` NumPy steps per chunk instead of
+    a Python step per record.
+
+    Parameters
+    ----------
+    header: :class:`~pyxcp.recorder.format.ChunkHeader`
+    buffer: :class:`numpy.ndarray`
+        uint8 array covering the (uncompressed) payload -- a view of the
+        memory mapping for uncompressed chunks.
+    sync: :class:`numpy.ndarray` or None
+        Sync table, payload offsets of every `SYNC_INTERVAL`-th record.
+    """
+
+    def __init__(self, header, buffer, sync=None):
+        self.header = header
+        self.buffer = buffer
+        self.sync = sync
+        self._offsets = None
+
+    def __len__(self):
+        return self.header.recordCount
+
+    def _scan(self):
+        count = self.header.recordCount
+        starts = None
+        if count and self.sync is not None:
+            starts = self._locate()
+            if starts is None:
+                logger.warn("Chunk with inconsistent sync table, scanning records one by one.")
+        if starts is None:
+            starts = self._walk()
+        headers = self.buffer[starts[:, None] + np.arange(RECORD_HEADER.size)].view(RECORD_DTYPE)[:, 0] \
+            if count else np.empty(0, dtype=RECORD_DTYPE)
+        self._offsets = starts + RECORD_HEADER.size
+        self._lengths = headers["length"]
+        self._counters = headers["counter"]
+        self._timestamps = headers["timestamp"]
+        if count:
+            self._pids = self.buffer[self._offsets]
+        else:
+            self._pids = np.empty(0, dtype=np.uint8)
+
+    def _locate(self):
+        """Record positions from the sync table, None if the table doesn't fit the payload.
+        """
+        buffer = self.buffer
+        count = self.header.recordCount
+        size = len(buffer)
+        if size < RECORD_HEADER.size:
+            return None
+        last = size - 2     # Lanes running past their group are clamped and discarded below.
+        position = self.sync.astype(np.int64)
+        if len(position) != (count + SYNC_INTERVAL - 1) // SYNC_INTERVAL or (position > last).any():
+            return None
+        steps = min(count, SYNC_INTERVAL)
+        starts = np.empty((steps, len(position)), dtype=np.int64)
+        for step in range(steps):
+            starts[step] = position
+            length = buffer[position].astype(np.int64) | (buffer[position + 1].astype(np.int64) << 8)
+            np.minimum(position + RECORD_HEADER.size + length, last, out=position)
+        starts = starts.T.ravel()[:count]
+        if starts[-1] > size - RECORD_HEADER.size:
+            return None
+        ends = starts + RECORD_HEADER.size + (buffer[starts].astype(np.int64) | (buffer[starts + 1].astype(np.int64) << 8))
+        if ends[-1] != size or (ends[:-1] != starts[1:]).any():
+            return None
+        return starts
+
+    def _walk(self):
+        """Record positions by following the length prefixes.
+        """
+        unpack = RECORD_HEADER.unpack_from
+        headerSize = RECORD_HEADER.size
+        count = self.header.recordCount
+        starts = array("q", bytes(8 * count))
+        payload = memoryview(self.buffer)
+        offset = 0
+        for idx in range(count):
+            starts[idx] = offset
+            offset += headerSize + unpack(payload, offset)[0]
+        return np.frombuffer(starts, dtype=np.int64)
+
+    @property
+    def offsets(self):
+        """Position of every packet within the payload.
+        """
+        if self._offsets is None:
+            self._scan()
+        return self._offsets
+
+    @property
+    def lengths(self):
+        if self._offsets is None:
+            self._scan()
+        return self._lengths
+
+    @property
+    def counters(self):
+        if self._offsets is None:
+            self._scan()
+        return self._counters
+
+    @property
+    def timestamps(self):
+        if self._offsets is None:
+            self._scan()
+        return self._timestamps
+
+    @property
+    def pids(self):
+        """First byte of every packet (absolute ODT number).
+        """
+        if self._offsets is None:
+            self._scan()
+        return self._pids
+
+    def select(self, pid: int):
+        """
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            Indices of the records belonging to `pid`.
+        """
+        return np.flatnonzero(self.pids == pid)
+
+    def packets(self, pid: int, size: int = None, allowCopy: bool = True):
+        """All packets of an ODT as two-dimensional array.
+
+        If the packets are equidistant within the chunk (which is the common
+        case for periodic DAQ lists) the result is a read-only, strided view of the
+        underlying memory. Otherwise the packets are gathered, i.e. the result is
+        a copy -- check with :func:`numpy.shares_memory` or pass ``allowCopy = False``.
+
+        Parameters
+        ----------
+        pid: int
+        size: int or None
+            Number of bytes per packet, defaults to the length of the first packet.
+        allowCopy: bool
+            If False, :class:`~pyxcp.recorder.format.RecordingError` is raised instead of copying.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            uint8 array of shape (n, size).
+        """
+        indices = self.select(pid)
+        offsets = self.offsets[indices]
+        if size is None:
+            size = int(self.lengths[indices[0]]) if len(indices) else 0
+        if len(offsets) and int(self.lengths[indices].min()) < size:
+            raise RecordingError("PID {}: packets shorter than {} bytes.".format(pid, size))
+        if len(offsets) == 0:
+            return np.empty((0, size), dtype=np.uint8)
+        steps = np.diff(offsets)
+        if len(steps) == 0 or (steps == steps[0]).all():
+            stride = int(steps[0]) if len(steps) else size
+            return np.lib.stride_tricks.as_strided(
+                self.buffer[int(offsets[0]):], shape=(len(offsets), size), strides=(stride, 1), writeable=False
+            )
+        if not allowCopy:
+            raise RecordingError("PID {}: packets aren't equidistant, a view isn't possible.".format(pid))
+        return self.buffer[offsets[:, None] + np.arange(size)]
+
+    def decode(self, decoder, pid: int):
+        """Decode all packets of an ODT.
+
+        Parameters
+        ----------
+        decoder: :class:`pyxcp.daq.decoder.DaqDecoder`
+        pid: int
+
+        Returns
+        -------
+        tuple (timestamps, :class:`numpy.ndarray`)
+            Record timestamps and structured array as returned by
+            :meth:`~pyxcp.daq.decoder.DaqDecoder.decode`.
+        """
+        packets = self.packets(pid, decoder.packetSize(pid))
+        return self.timestamps[self.select(pid)], decoder.decode(pid, packets)
+
+
+class MappedRecording:
+    """Memory-mapped, read-only access to a DAQ recording.
+
+    Nothing is read into memory up-front, chunks are visited lazily and
+    uncompressed chunks are exposed as views of the mapping.
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+
+    Example
+    -------
+    .. code-block:: python
+
+        decoder = DaqDecoder(layout)
+        with MappedRecording("run.xdaq") as rec:
+            timestamps, values = rec.signal("engineSpeed", decoder)
+
+    Note
+    ----
+    Arrays obtained from a recording become invalid after :meth:`close`.
+    """
+
+    def __init__(self, filename):
+        if not HAS_NUMPY:
+            raise RuntimeError("MappedRecording requires NumPy.")
+        self.filename = filename
+        self._fp = open(str(filename), "rb")
+        self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.fileHeader = parseFileHeader(self._mmap)
+        self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._buffer = None
+        self._index = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views still alive, the mapping goes away with them.
+            pass
+        self._fp.close()
+
+    @property
+    def index(self):
+        """List of (offset, :class:`~pyxcp.recorder.format.ChunkHeader`).
+        """
+        if self._index is None:
+            self._index = self._buildIndex()
+        return self._index
+
+    def _buildIndex(self):
+        result = []
+        size = len(self._mmap)
+        offset = FILE_HEADER.size
+        while offset + CHUNK_HEADER.size <= size:
+            header = ChunkHeader(*CHUNK_HEADER.unpack_from(self._mmap, offset))
+            end = offset + CHUNK_HEADER.size + syncTableSize(header) + header.storedSize
+            if header.magic != CHUNK_MAGIC or end > size:
+                break
+            result.append((offset, header))
+            offset = end
+        return result
+
+    def __len__(self):
+        return len(self.index)
+
+    def chunk(self, idx: int) -> ChunkView:
+        offset, header = self.index[idx]
+        start = offset + CHUNK_HEADER.size
+        tableSize = syncTableSize(header)
+        end = start + tableSize + header.storedSize
+        if zlib.crc32(self._buffer[start : end]) != header.crc:
+            raise RecordingError("Chunk #{} is corrupted.".format(idx))
+        stored = self._buffer[start + tableSize : end]
+        if header.compression == COMPRESSION_NONE:
+            buffer = stored
+        else:
+            buffer = np.frombuffer(decodePayload(header, stored), dtype=np.uint8)
+        sync = self._buffer[start : start + tableSize].view("<u4") if tableSize else None
+        return ChunkView(header, buffer, sync)
+
+    def iterChunks(self, start: int = 0, stop: int = None):
+        """Lazily iterate over (a range of) chunks.
+        """
+        for idx in range(start, len(self) if stop is None else stop):
+            yield self.chunk(idx)
+
+    def signal(self, name: str, decoder, start: int = 0, stop: int = None):
+        """Extract a single measurement from the whole recording (or a range of chunks).
+
+        Parameters
+        ----------
+        name: str
+        decoder: :class:`pyxcp.daq.decoder.DaqDecoder`
+
+        Returns
+        -------
+        tuple (:class:`numpy.ndarray`, :class:`numpy.ndarray`)
+            Timestamps and values.
+        """
+        pid, _ = decoder.layout.locate(name)
+        timestamps = []
+        values = []
+        for chunk in self.iterChunks(start, stop):
+            ts, data = chunk.decode(decoder, pid)
+            timestamps.append(ts)
+            values.append(data[name])
+        if not values:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=decoder.dtypes[pid][name])
+        return np.concatenate(timestamps), np.concatenate(values)
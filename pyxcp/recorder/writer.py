@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import lzma
+import os
+import pathlib
+from time import perf_counter, perf_counter_ns, time_ns
+import zlib
+
+from pyxcp.daq.drain import DaqDrain
+from pyxcp.logger import Logger
+from pyxcp.recorder.format import (
+    CHUNK_HEADER, CHUNK_MAGIC, CHUNK_SYNC_TABLE, COMPRESSION_LZMA, COMPRESSION_METHODS, COMPRESSION_NONE,
+    COMPRESSION_ZLIB, FILE_HEADER, FILE_MAGIC, FILE_SUFFIX, FORMAT_VERSION, RECORD_HEADER, SYNC_INTERVAL,
+    packSyncTable
+)
+from pyxcp.recorder.index import DEFAULT_INTERVAL, IndexWriter, indexFileName
+
+FILE_BUFFER_SIZE = 1024 * 1024
+
+
+def encodePayload(payload, compression: int, level: int, crc: int = 0):
+    """Compress a chunk payload.
+
+    Runs on the compression workers -- zlib and lzma release the GIL.
+
+    Parameters
+    ----------
+    crc: int
+        Start value of the CRC, i.e. CRC32 of the sync table.
+
+    Returns
+    -------
+    tuple (stored payload, CRC32 of sync table and stored payload)
+    """
+    if compression == COMPRESSION_ZLIB:
+        stored = zlib.compress(payload, level)
+    elif compression == COMPRESSION_LZMA:
+        stored = lzma.compress(payload, format=lzma.FORMAT_XZ, preset=level)
+    else:
+        stored = payload
+    return (stored, zlib.crc32(stored, crc))
+
+
+class DaqRecorder:
+    """Writes DAQ packets to (rotating) recording files on a dedicated thread.
+
+    The recorder is a sink of the :class:`~pyxcp.daq.drain.DaqDrain` of a deque of DAQ elements
+    ``(packet, counter, length, timestamp)``, usually :attr:`pyxcp.transport.base.BaseTransport.daqQueue`;
+    the listener thread isn't involved in any way. Timestamps are required (`CREATE_DAQ_TIMESTAMPS`).
+
+    Parameters
+    ----------
+    filename: str or :class:`pathlib.Path`
+        If rotation is enabled, a running number is inserted, e.g.
+        `run.xdaq` becomes `run_0000.xdaq`, `run_0001.xdaq`, ...
+    queue: :class:`collections.deque`
+        Source of DAQ elements.
+    chunkSize: int
+        A chunk is written if its payload exceeds `chunkSize` bytes...
+    chunkInterval: float
+        ...or if it is older than `chunkInterval` seconds.
+    maxFileSize: int or None
+        Start a new file, if the current one exceeds `maxFileSize` bytes.
+    maxFileDuration: float or None
+        Start a new file after `maxFileDuration` seconds. The current file is closed
+        on time, the next one is opened with the next chunk -- so there are no empty files.
+    fsync: bool
+        Force chunks to disk, survives power failures at the cost of throughput.
+    compression: str or None
+        "zlib" or "lzma", every chunk is compressed on its own, so chunks
+        stay randomly accessible (see :func:`pyxcp.recorder.reader.indexChunks`).
+    compressionLevel: int or None
+        zlib level (0-9) or lzma preset (0-9), None selects a fast setting.
+    workers: int
+        Size of the compression thread pool.
+    indexInterval: int or None
+        Write a sparse time index entry every `indexInterval` packets
+        (see :class:`pyxcp.recorder.index.TimeIndex`), None disables the index file.
+
+    Example
+    -------
+    .. code-block:: python
+
+        with DaqRecorder("run.xdaq", xm.transport.daqQueue) as recorder:
+            ...
+    """
+
+    def __init__(self, filename, queue, chunkSize: int = 4 * 1024 * 1024, chunkInterval: float = 1.0,
+                 maxFileSize: int = None, maxFileDuration: float = None, fsync: bool = False,
+                 compression: str = None, compressionLevel: int = None, workers: int = 2,
+                 indexInterval: int = DEFAULT_INTERVAL):
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError("Invalid compression method '{}' -- choose from {}".format(
+                compression, [k for k in COMPRESSION_METHODS.keys() if k])
+            )
+        pth = pathlib.Path(filename)
+        if not pth.suffix:
+            pth = pth.with_suffix(FILE_SUFFIX)
+        self.path = pth
+        self.queue = queue
+        self.chunkSize = chunkSize
+        self.chunkInterval = chunkInterval
+        self.maxFileSize = maxFileSize
+        self.maxFileDuration = maxFileDuration
+        self.fsync = fsync
+        self.compression = COMPRESSION_METHODS[compression]
+        if compressionLevel is None:
+            compressionLevel = 1 if self.compression == COMPRESSION_ZLIB else 0
+        self.compressionLevel = compressionLevel
+        self.workers = workers
+        self.indexInterval = indexInterval
+        self._index = None
+        self._executor = None
+        self._pending = deque()  # Chunks in compression, written in submission order.
+        self.logger = Logger("DaqRecorder")
+        self.fileNames = []
+        self.packetCount = 0
+        self.chunkCount = 0
+        self._fp = None
+        self._fileStart = None
+        self._fileSize = 0
+        self._timestampsChecked = False
+        self._drain = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def rotating(self) -> bool:
+        return bool(self.maxFileSize or self.maxFileDuration)
+
+    def start(self):
+        if self._drain is not None:
+            return
+        if self.compression != COMPRESSION_NONE:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._openFile()
+        self._payload = bytearray()
+        self._count = 0
+        self._entries = []  # Index entries of current chunk.
+        self._sync = []     # Sync table of current chunk.
+        self._group = (0, 0, 0, 0, 0)   # count, timestamp, offset, min. PID, max. PID
+        self._firstTimestamp = self._lastTimestamp = 0
+        self._chunkStart = perf_counter()
+        self._drain = DaqDrain.forQueue(self.queue)
+        self._drain.attach(self._consume)
+
+    def stop(self):
+        """Write everything queued so far and close the current file.
+        """
+        if self._drain is not None:
+            self._drain.detach(self._consume)
+            self._drain = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._closeFile()
+
+    def _makeFileName(self, index: int) -> pathlib.Path:
+        if not self.rotating:
+            return self.path
+        return self.path.with_name("{}_{:04d}{}".format(self.path.stem, index, self.path.suffix))
+
+    def _openFile(self):
+        name = self._makeFileName(len(self.fileNames))
+        self._fp = open(str(name), "wb", buffering=FILE_BUFFER_SIZE)
+        header = FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, 0, time_ns(), perf_counter_ns())
+        self._fp.write(header)
+        self._fp.flush()
+        if self.indexInterval:
+            self._index = IndexWriter(name, self.indexInterval)
+        elif indexFileName(name).exists():
+            indexFileName(name).unlink()  # Stale.
+        self._fileSize = len(header)
+        self._fileStart = perf_counter()
+        self.fileNames.append(name)
+        self.logger.debug("Recording to '{}'.".format(name))
+
+    def _closeFile(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def _consume(self, elements, final: bool):
+        """Sink of the :class:`~pyxcp.daq.drain.DaqDrain`, state of the current chunk is kept between calls.
+        """
+        recordPack = RECORD_HEADER.pack
+        chunkSize = self.chunkSize
+        indexInterval = self.indexInterval or 0xffffffff
+        if elements and not self._timestampsChecked:
+            self._timestampsChecked = True
+            if not elements[0][3]:
+                self.logger.warn("DAQ packets carry no timestamps (CREATE_DAQ_TIMESTAMPS is off), "
+                    "chunk timestamps and time index are meaningless.")
+
+        payload = self._payload
+        count = self._count
+        entries = self._entries
+        sync = self._sync
+        groupCount, groupTimestamp, groupOffset, minPid, maxPid = self._group
+        firstTimestamp = self._firstTimestamp
+        lastTimestamp = self._lastTimestamp
+        idx = 0
+        while True:
+            while idx < len(elements) and len(payload) < chunkSize:
+                packet, counter, _, timestamp = elements[idx]
+                idx += 1
+                if not count:
+                    firstTimestamp = timestamp
+                pid = packet[0] if packet else 0
+                if not groupCount:
+                    groupTimestamp = timestamp
+                    groupOffset = len(payload)
+                    minPid = maxPid = pid
+                elif pid < minPid:
+                    minPid = pid
+                elif pid > maxPid:
+                    maxPid = pid
+                if not count % SYNC_INTERVAL:
+                    sync.append(len(payload))
+                payload += recordPack(len(packet), counter & 0xffff, timestamp)
+                payload += packet
+                count += 1
+                groupCount += 1
+                if groupCount == indexInterval:
+                    entries.append((groupTimestamp, groupOffset, groupCount, minPid, maxPid))
+                    groupCount = 0
+                lastTimestamp = timestamp
+            now = perf_counter()
+            if count and (len(payload) >= chunkSize or now - self._chunkStart >= self.chunkInterval or final):
+                if groupCount:  # Groups don't span chunks.
+                    entries.append((groupTimestamp, groupOffset, groupCount, minPid, maxPid))
+                    groupCount = 0
+                self._writeChunk(payload, count, firstTimestamp, lastTimestamp, entries, sync)
+                payload = bytearray()
+                entries = []
+                sync = []
+                count = 0
+                self._chunkStart = now
+            elif not count:
+                self._chunkStart = now
+            self._writeCompleted()
+            if idx == len(elements):
+                break
+        if final:
+            self._writeCompleted(backlog=0)
+        else:
+            self._checkRotation()   # Quiet streams rotate on time, too.
+        self._payload = payload
+        self._count = count
+        self._entries = entries
+        self._sync = sync
+        self._group = (groupCount, groupTimestamp, groupOffset, minPid, maxPid)
+        self._firstTimestamp = firstTimestamp
+        self._lastTimestamp = lastTimestamp
+
+    def _writeChunk(self, payload, count, firstTimestamp, lastTimestamp, entries, sync):
+        table = packSyncTable(sync)
+        if self._executor is None:
+            self._storeChunk(table, payload, zlib.crc32(payload, zlib.crc32(table)), len(payload), count,
+                firstTimestamp, lastTimestamp, entries)
+            return
+        future = self._executor.submit(encodePayload, payload, self.compression, self.compressionLevel, zlib.crc32(table))
+        self._pending.append((future, table, len(payload), count, firstTimestamp, lastTimestamp, entries))
+        # Limit memory consumption if compression can't keep up -- only the drain thread waits.
+        self._writeCompleted(backlog=2 * self.workers)
+
+    def _writeCompleted(self, backlog: int = None):
+        """Write compressed chunks in submission order.
+
+        Parameters
+        ----------
+        backlog: int or None
+            Wait until at most `backlog` chunks are pending.
+        """
+        pending = self._pending
+        while pending and (pending[0][0].done() or (backlog is not None and len(pending) > backlog)):
+            future, table, size, count, firstTimestamp, lastTimestamp, entries = pending.popleft()
+            stored, crc = future.result()
+            self._storeChunk(table, stored, crc, size, count, firstTimestamp, lastTimestamp, entries)
+
+    def _storeChunk(self, table, stored, crc, size, count, firstTimestamp, lastTimestamp, entries):
+        if self._fp is None:
+            self._openFile()    # Rotated.
+        header = CHUNK_HEADER.pack(
+            CHUNK_MAGIC, self.compression, CHUNK_SYNC_TABLE, 0, count, len(stored), size,
+            crc, firstTimestamp, lastTimestamp
+        )
+        fp = self._fp
+        fp.write(header)
+        fp.write(table)
+        fp.write(stored)
+        fp.flush()
+        if self.fsync:
+            os.fsync(fp.fileno())
+        if self._index is not None:
+            # Written after the chunk, so the index never refers to missing data.
+            self._index.write(self._fileSize, entries)
+        self._fileSize += len(header) + len(table) + len(stored)
+        self.packetCount += count
+        self.chunkCount += 1
+        self._checkRotation()
+
+    def _checkRotation(self):
+        """Close the current file if it's full or too old, the next chunk opens a new one.
+        """
+        if not self.rotating or self._fp is None or self._fileSize <= FILE_HEADER.size:
+            return  # Files contain at least one chunk.
+        if (self.maxFileSize and self._fileSize >= self.maxFileSize) or \
+                (self.maxFileDuration and perf_counter() - self._fileStart >= self.maxFileDuration):
+            self._closeFile()
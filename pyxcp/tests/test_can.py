@@ -1,10 +1,17 @@
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
 import pytest
 
 from pyxcp.transport.can import (
     setDLC, calculateFilter, CAN_EXTENDED_ID,
     isExtendedIdentifier, stripIdentifier, samplePointToTsegs,
     Identifier, MAX_11_BIT_IDENTIFIER, MAX_29_BIT_IDENTIFIER,
-    IdentifierOutOfRangeError)
+    IdentifierOutOfRangeError, TimestampConverter, CanInterfaceBase)
 
 def testSet0():
     assert setDLC(0) == 0
@@ -162,3 +169,543 @@ def test_identifier_repr_does_the_trick2(capsys):
     i = Identifier(101 | CAN_EXTENDED_ID)
     assert eval(repr(i)) == Identifier(101 | CAN_EXTENDED_ID)
 
+
+def test_timestamp_converter_uses_minimal_latency():
+    conv = TimestampConverter(resolution = 10000)
+    assert conv(100, 5000000) == 5000000
+    # Frame read 1ms late -- offset must not change.
+    assert conv(200, 7000000) == 6000000
+    # Frame with less latency than the first one improves the offset.
+    assert conv(300, 6500000) == 6500000
+    assert conv.offset == 3500000
+
+def test_can_frame_received_uses_driver_timestamps(monkeypatch):
+    from pyxcp.transport.can import Can, Frame
+    from pyxcp.tests.test_master import MockCanInterface
+
+    tr = Can(config = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "MockCanInterface",
+        'CREATE_DAQ_TIMESTAMPS': True})
+    tr.timestampConverter = TimestampConverter(resolution = 1000)
+    hostTimes = iter([50000000, 53000000])   # second frame read with 1ms delay.
+    monkeypatch.setattr("pyxcp.transport.can.perf_counter_ns", lambda: next(hostTimes))
+    tr.frameReceived(Frame(Identifier(2), 3, b'\x00\x01\x02', 1000))
+    tr.frameReceived(Frame(Identifier(2), 3, b'\x01\x01\x02', 3000))
+    first, second = tr.daqQueue
+    assert second[3] - first[3] == 2000000
+    assert tr.first_daq_timestamp == first[3]
+
+
+def test_socketcan_frame_round_trip():
+    from pyxcp.transport.candriver import socketcan
+
+    frame = socketcan.packFrame(Identifier(0x123), b'\x01\x02\x03')
+    assert len(frame) == socketcan.CAN_MTU
+    assert socketcan.unpackFrame(frame) == (0x123, b'\x01\x02\x03')
+    frame = socketcan.packFrame(Identifier(0x4711 | CAN_EXTENDED_ID), bytes(range(48)), fd = True, brs = True)
+    assert len(frame) == socketcan.CANFD_MTU
+    assert frame[5] == socketcan.CANFD_BRS
+    assert socketcan.unpackFrame(frame) == (0x4711 | CAN_EXTENDED_ID, bytes(range(48)))
+    assert socketcan.unpackFrame(struct.pack("=IB3x8s", 0x123 | socketcan.CAN_ERR_FLAG, 8, b'')) is None
+    with pytest.raises(ValueError):
+        socketcan.packFrame(Identifier(0x123), bytes(12))
+
+def test_socketcan_filters():
+    from pyxcp.transport.candriver import socketcan
+
+    assert struct.unpack("=II", socketcan.makeFilters([0x101, 0x102, 0x103])) == (
+        0x100, 0x7fc | socketcan.CAN_EFF_FLAG | socketcan.CAN_RTR_FLAG)
+    assert struct.unpack("=II", socketcan.makeFilters([0x1567 | CAN_EXTENDED_ID])) == (
+        0x1567 | socketcan.CAN_EFF_FLAG, 0x1fffffff | socketcan.CAN_EFF_FLAG | socketcan.CAN_RTR_FLAG)
+
+def vcanAvailable(name = "vcan0"):
+    if not hasattr(socket, "AF_CAN"):
+        return False
+    try:
+        with socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW) as sock:
+            sock.bind((name, ))
+    except OSError:
+        return False
+    return True
+
+@pytest.mark.skipif(not vcanAvailable(), reason = "Requires a 'vcan0' interface.")
+def test_socketcan_vcan():
+    from pyxcp.transport.can import Can
+    from pyxcp.transport.candriver import socketcan
+
+    tr = Can(config = {'CAN_ID_MASTER': 0x101, 'CAN_ID_SLAVE': 0x102, 'CAN_DRIVER': "SocketCAN",
+        'SC_CHANNEL': "vcan0", 'CREATE_DAQ_TIMESTAMPS': True})
+    ecu = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+    ecu.bind(("vcan0", ))
+    try:
+        tr.connect()
+        before = time.perf_counter_ns()
+        ecu.send(socketcan.packFrame(Identifier(0x333), b'\x00\x01'))   # Filtered out by the kernel.
+        for idx in range(100):
+            ecu.send(socketcan.packFrame(Identifier(0x101), bytes([idx, 0x11])))
+        start = time.perf_counter()
+        while len(tr.daqQueue) < 100 and time.perf_counter() - start < 2.0:
+            time.sleep(0.01)
+        assert [element[0] for element in tr.daqQueue] == [bytes([idx, 0x11]) for idx in range(100)]
+        assert all(before - 1000000 <= element[3] <= time.perf_counter_ns() + 1000000 for element in tr.daqQueue)
+        tr.send(b'\xff\x00')
+        ecu.settimeout(1.0)
+        assert socketcan.unpackFrame(ecu.recv(socketcan.CANFD_MTU)) == (0x102, b'\xff\x00')
+    finally:
+        tr.close()
+        ecu.close()
+
+def test_can_fd_send_pads_to_valid_dlc():
+    from pyxcp.transport.can import Can
+    from pyxcp.tests.test_master import MockCanInterface
+
+    tr = Can(config = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "MockCanInterface", 'CAN_FD': True})
+    sent = []
+    tr.canInterface.transmit = lambda payload, fd = False, brs = False: sent.append((payload, fd, brs))
+    tr.send(bytes(5))
+    tr.send(bytes(range(9)))
+    tr.send(bytes(range(50)))
+    assert sent == [(bytes(5), True, True), (bytes(range(9)) + bytes(3), True, True),
+        (bytes(range(50)) + bytes(14), True, True)]
+    assert tr.MAX_DATAGRAM_SIZE == 64
+    tr.max_dlc_required = True
+    tr.send(b'\xff')
+    assert len(sent[-1][0]) == 64
+
+def test_can_fd_fetch_uses_large_cto():
+    from pyxcp.master import Master
+    from pyxcp.tests.test_master import MockCanInterface
+
+    conf = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "MockCanInterface",
+        'CAN_USE_DEFAULT_LISTENER': False, 'CAN_FD': True}
+    with Master("can", config = conf) as xm:
+        canInterface = xm.transport.canInterface
+        canInterface.transmit = lambda payload, fd = False, brs = False: canInterface.receive_callback(
+            canInterface.data.popleft())
+        canInterface.push_packet("FF 3D 00 40 40 00 01 01")   # MAX_CTO = MAX_DTO = 64, no block mode.
+        xm.connect()
+        assert xm.slaveProperties.maxCto == 64
+        data = bytes(range(126))
+        canInterface.push_frame(b'\xff' + data[:63])
+        canInterface.push_frame(b'\xff' + data[63:])
+        assert xm.fetch(len(data)) == data
+        assert not canInterface.data
+
+
+class QueueCanInterface(CanInterfaceBase):
+    """Driver blocking in :meth:`read`, frames are put into `frames`.
+    """
+
+    def __init__(self):
+        self.frames = queue.Queue()
+        self.reads = 0
+
+    def init(self, parent, receive_callback):
+        pass
+
+    def transmit(self, payload, fd = False, brs = False):
+        pass
+
+    def close(self):
+        pass
+
+    def connect(self):
+        pass
+
+    def read(self, timeout = 0.0):
+        self.reads += 1
+        try:
+            return self.frames.get(timeout = timeout)
+        except queue.Empty:
+            return None
+
+    def getTimestampResolution(self):
+        return None
+
+def test_can_listener_blocks_in_driver():
+    from pyxcp.transport.can import Can, Frame
+
+    tr = Can(config = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "QueueCanInterface"})
+    tr.READ_TIMEOUT = 0.05
+    try:
+        tr.connect()
+        time.sleep(0.3)
+        tr.canInterface.frames.put(Frame(Identifier(1), 2, b'\x00\x01', 0))
+        start = time.perf_counter()
+        while not tr.daqQueue and time.perf_counter() - start < 1.0:
+            time.sleep(0.01)
+        assert tr.daqQueue[0][0] == b'\x00\x01'
+        assert tr.canInterface.reads < 20
+    finally:
+        tr.close()
+
+
+class BatchCanInterface(QueueCanInterface):
+    """Batch capable variant, :meth:`read` is never called by the listener.
+    """
+
+    def read_many(self, max_frames, timeout = 0.0):
+        self.reads += 1
+        try:
+            frames = [self.frames.get(timeout = timeout)]
+        except queue.Empty:
+            return []
+        while len(frames) < max_frames and not self.frames.empty():
+            frames.append(self.frames.get())
+        return frames
+
+def test_can_listener_reads_batches():
+    from pyxcp.transport.can import Can
+
+    tr = Can(config = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "QueueCanInterface",
+        'CREATE_DAQ_TIMESTAMPS': True})
+    tr.canInterface = BatchCanInterface()
+    tr.canInterface.getTimestampResolution = lambda: 1000
+    for idx in range(500):
+        tr.canInterface.frames.put((1, bytes([idx % 200, idx // 200]), idx))
+    try:
+        tr.connect()
+        start = time.perf_counter()
+        while len(tr.daqQueue) < 500 and time.perf_counter() - start < 2.0:
+            time.sleep(0.01)
+        assert [element[0] for element in tr.daqQueue] == [bytes([idx % 200, idx // 200]) for idx in range(500)]
+        assert tr.daqQueue[499][3] - tr.daqQueue[0][3] == 499 * 1000
+        assert tr.canInterface.reads <= 10
+    finally:
+        tr.close()
+
+def test_download_block_sends_block_at_once():
+    from pyxcp.master import Master
+    from pyxcp.tests.test_master import MockCanInterface
+
+    conf = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "MockCanInterface",
+        'CAN_USE_DEFAULT_LISTENER': False}
+    with Master("can", config = conf) as xm:
+        canInterface = xm.transport.canInterface
+        canInterface.push_packet("FF 3D 00 08 08 00 01 01")
+        xm.connect()
+        xm.slaveProperties.update(masterBlockMode = True, maxBs = 4, minSt = 0)
+        batches = []
+        single = []
+        canInterface.transmit_many = lambda frames, fd = False, brs = False: batches.append(list(frames))
+        canInterface.transmit = lambda payload, fd = False, brs = False: (
+            single.append(payload), canInterface.receive_callback(b'\xff'))
+        data = bytes(range(30))
+        assert xm.downloadBlock(data) == b''
+        assert batches == [
+            [bytes([0xf0, 24]) + data[0: 6], bytes([0xef, 18]) + data[6: 12], bytes([0xef, 12]) + data[12: 18]],
+        ]
+        assert single == [bytes([0xef, 6]) + data[18: 24], bytes([0xf0, 6]) + data[24: 30]]
+
+def test_download_block_respects_address_granularity():
+    from pyxcp.master import Master
+    from pyxcp.tests.test_master import MockCanInterface
+
+    conf = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "MockCanInterface",
+        'CAN_USE_DEFAULT_LISTENER': False}
+    with Master("can", config = conf) as xm:
+        canInterface = xm.transport.canInterface
+        canInterface.push_packet("FF 3D 04 08 08 00 01 01")    # AG = DWORD.
+        xm.connect()
+        xm.slaveProperties.update(masterBlockMode = True, maxBs = 4, minSt = 0)
+        batches = []
+        single = []
+        canInterface.transmit_many = lambda frames, fd = False, brs = False: batches.append(list(frames))
+        canInterface.transmit = lambda payload, fd = False, brs = False: (
+            single.append(payload), canInterface.receive_callback(b'\xff'))
+        data = bytes(range(24))
+        assert xm.downloadBlock(data) == b''
+        assert batches == [
+            [bytes([0xf0, 4, 0, 0]) + data[0: 4], bytes([0xef, 3, 0, 0]) + data[4: 8],
+             bytes([0xef, 2, 0, 0]) + data[8: 12]],
+            [bytes([0xf0, 2, 0, 0]) + data[16: 20]],
+        ]
+        assert single == [bytes([0xef, 1, 0, 0]) + data[12: 16], bytes([0xef, 1, 0, 0]) + data[20: 24]]
+        with pytest.raises(ValueError):
+            xm.downloadBlock(data[: 23])
+
+def test_can_daq_identifiers_route_by_id():
+    from collections import deque
+    from pyxcp.transport.can import Can, Frame
+
+    tr = Can(config = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "QueueCanInterface",
+        'CAN_ID_DAQ': {"0": 0x10, "1": 0x11 | CAN_EXTENDED_ID}})
+    filters = []
+    tr.canInterface.setFilters = filters.append
+    assert tr.receiveIds == [1, 0x10, 0x11 | CAN_EXTENDED_ID]
+    fast = deque()
+    tr.setDaqId(2, 0x12, fast)
+    assert filters == [[1, 0x10, 0x12, 0x11 | CAN_EXTENDED_ID]]
+    tr.framesReceived([(0x10, b'\xfe\x01', 0), (1, b'\xff\x00', 0), (0x12, b'\x05\x02', 0)])
+    tr.frameReceived(Frame(Identifier(0x11 | CAN_EXTENDED_ID), 2, b'\xfd\x03', 0))
+    assert [element[0] for element in tr.daqQueue] == [b'\xfe\x01', b'\xfd\x03']  # No PID classification.
+    assert list(tr.resQueue) == [b'\xff\x00']
+    assert [element[0] for element in fast] == [b'\x05\x02']
+    tr.setDaqId(2, 0x13)
+    assert 0x12 not in tr.daqRoutes
+    with pytest.raises(ValueError):
+        tr.setDaqId(3, 0x10, fast)
+    with pytest.raises(ValueError):
+        tr.setDaqId(3, 1)
+
+def test_master_set_daq_id():
+    from pyxcp.master import Master
+    from pyxcp.tests.test_master import MockCanInterface
+
+    conf = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "MockCanInterface",
+        'CAN_USE_DEFAULT_LISTENER': False}
+    with Master("can", config = conf) as xm:
+        canInterface = xm.transport.canInterface
+        sent = []
+        canInterface.push_packet("FF 3D 00 08 08 00 01 01")
+        xm.connect()
+        canInterface.transmit = lambda payload, fd = False, brs = False: (
+            sent.append(payload), canInterface.receive_callback(canInterface.data.popleft()))
+        canInterface.push_packet("FF")
+        xm.setDaqId(3, 0x123)
+        assert sent[-1] == bytes([0xf2, 0xfd, 0x03, 0x00, 0x23, 0x01, 0x00, 0x00])
+        assert xm.transport.daqIds == {3: 0x123}
+        canInterface.push_packet("FF 00 00 00 23 01 00 00")
+        res = xm.getDaqId(3)
+        assert sent[-1] == bytes([0xf2, 0xfe, 0x03, 0x00])
+        assert res.canIdFixed is False
+        assert res.canId == 0x123
+
+
+class LoopbackCanInterface(BatchCanInterface):
+    """Records transmitted frames, see :meth:`BatchCanInterface.read_many` for reception.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self.filters = None
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+    def close(self):
+        self.connected = False
+
+    def setFilters(self, ids):
+        self.filters = ids
+
+    def transmitTo(self, identifier, payload, fd = False, brs = False):
+        self.sent.append((identifier.raw_id, payload))
+
+class SocketPairCanInterface(QueueCanInterface):
+    """Frames are sent through a socket pair, i.e. reception survives a fork.
+    """
+
+    FRAME_ID = struct.Struct("<I")
+
+    def __init__(self):
+        super().__init__()
+        self.rx, self.tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def inject(self, rawId, data):
+        self.tx.send(self.FRAME_ID.pack(rawId) + data)
+
+    def read_many(self, max_frames, timeout = 0.0):
+        frames = []
+        self.rx.settimeout(timeout)
+        while len(frames) < max_frames:
+            try:
+                datagram = self.rx.recv(128)
+            except (socket.timeout, BlockingIOError):
+                break
+            frames.append((self.FRAME_ID.unpack_from(datagram)[0], datagram[self.FRAME_ID.size: ], 0))
+            self.rx.setblocking(False)
+        return frames
+
+    def close(self):
+        self.rx.close()
+        self.tx.close()
+
+@pytest.mark.skipif(not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"),
+    reason = "Listener process requires fork().")
+def test_listener_process_routes_daq_identifiers():
+    from collections import deque
+    from pyxcp.daq.drain import DaqDrain
+    from pyxcp.transport.can import Can
+
+    tr = Can(config = {'CAN_ID_MASTER': 1, 'CAN_ID_SLAVE': 2, 'CAN_DRIVER': "QueueCanInterface",
+        'LISTENER_PROCESS': True})
+    tr.canInterface = driver = SocketPairCanInterface()
+    routed = deque()
+    tr.setDaqId(0, 0x10)
+    tr.setDaqId(1, 0x11, routed)
+    try:
+        tr.connect()
+        for idx in range(20):
+            driver.inject(0x11 if idx % 2 else 0x10, bytes([idx, 0]))
+        driver.inject(1, b'\xff\x00')
+        start = time.perf_counter()
+        while (len(tr.daqQueue) < 10 or len(routed) < 10 or not tr.resQueue) and time.perf_counter() - start < 5.0:
+            time.sleep(0.01)
+        assert [element[0] for element in tr.daqQueue] == [bytes([idx, 0]) for idx in range(0, 20, 2)]
+        assert [element[0] for element in routed] == [bytes([idx, 0]) for idx in range(1, 20, 2)]
+        assert list(tr.resQueue) == [b'\xff\x00']
+        assert tr.daqStatistics.snapshot().total.received == 20
+
+        received = []
+        def sink(elements, final):
+            received.extend((type(element[0]), bytes(element[0])) for element in elements)
+        drain = DaqDrain.forQueue(routed)
+        drain.attach(sink)
+        time.sleep(0.05)    # Let the drain pick up the sink.
+        driver.inject(0x11, b'\x21\x00')
+        start = time.perf_counter()
+        while len(received) < 11 and time.perf_counter() - start < 5.0:
+            time.sleep(0.01)
+        drain.detach(sink)
+        assert [packet for _, packet in received] == [bytes([idx, 0]) for idx in range(1, 20, 2)] + [b'\x21\x00']
+        assert received[-1][0] is memoryview     # Straight from the ring.
+        assert not routed
+    finally:
+        tr.close()
+    assert not any(thread.name == "DaqDrain" for thread in threading.enumerate())
+
+def test_can_bus_demultiplexes_slaves():
+    from pyxcp.transport.can import Can
+    from pyxcp.transport.canbus import CanBus
+
+    bus = CanBus({"CAN_DRIVER": "QueueCanInterface"}, name = "test")
+    bus.canInterface = driver = LoopbackCanInterface()
+    slaves = [Can(config = {'CAN_DRIVER': "CanBusPort", 'CAN_BUS': "test",
+        'CAN_ID_MASTER': 0x101 + 0x100 * idx, 'CAN_ID_SLAVE': 0x100 + 0x100 * idx}) for idx in range(3)]
+    try:
+        for slave in slaves:
+            slave.connect()
+        assert driver.connected
+        assert bus.listener.is_alive()
+        assert all(not slave.listener.is_alive() for slave in slaves)
+        slaves[2].setDaqId(0, 0x310)
+        assert driver.filters == [0x101, 0x201, 0x301, 0x310]
+        for idx in range(30):
+            driver.frames.put((0x101 + 0x100 * (idx % 3), bytes([idx, 0]), 0))
+        driver.frames.put((0x310, b'\xff\x01', 0))
+        driver.frames.put((0x555, b'\xff\x02', 0))
+        driver.frames.put((0x201, b'\xff\x03', 0))
+        start = time.perf_counter()
+        while not slaves[1].resQueue and time.perf_counter() - start < 2.0:
+            time.sleep(0.01)
+        for idx, slave in enumerate(slaves):
+            assert [element[0][0] for element in slave.daqQueue][: 10] == list(range(idx, 30, 3))
+        assert slaves[2].daqQueue[-1][0] == b'\xff\x01'
+        assert list(slaves[1].resQueue) == [b'\xff\x03']
+        assert bus.unroutedCount == 1
+        slaves[1].send(b'\xff\x00')
+        assert driver.sent == [(0x200, b'\xff\x00')]
+        with pytest.raises(ValueError):
+            Can(config = {'CAN_DRIVER': "CanBusPort", 'CAN_BUS': "test",
+                'CAN_ID_MASTER': 0x101, 'CAN_ID_SLAVE': 0x100}).connect()
+        slaves[0].close()
+        assert driver.connected
+        slaves[1].close()
+        slaves[2].close()
+        assert not driver.connected
+        assert bus.listener is None
+    finally:
+        bus.close()
+
+def test_get_slave_id_broadcast():
+    from pyxcp.master import Master
+    from pyxcp.types import CanSlave
+
+    conf = {'CAN_ID_MASTER': 0x101, 'CAN_ID_SLAVE': 0x100, 'CAN_ID_BROADCAST': 0x7ff,
+        'CAN_DRIVER': "QueueCanInterface"}
+    with Master("can", config = conf) as xm:
+        driver = xm.transport.canInterface = LoopbackCanInterface()
+        driver.filters = [0x101]
+
+        def respond(identifier, payload, fd = False, brs = False):
+            driver.sent.append((identifier.raw_id, payload))
+            assert driver.filters is None
+            driver.frames.put((0x101, b'\xff\x58\x43\x50\x00\x01\x00\x00', 0))
+            driver.frames.put((0x201, b'\xff\x58\x43\x50\x00\x02\x00\x00', 0))
+            driver.frames.put((0x301, b'\x10\x00', 0))  # Unrelated DAQ traffic.
+            driver.frames.put((0x80000401, b'\xff\x58\x43\x50\x00\x04\x00\x80', 0))
+        driver.transmitTo = respond
+        start = time.perf_counter()
+        slaves = xm.getSlaveID(0, window = 0.1)
+        assert time.perf_counter() - start < 0.5
+        assert driver.sent == [(0x7ff, bytes([0xf2, 0xff, 0x58, 0x43, 0x50, 0x00]))]
+        assert slaves == [CanSlave(0x101, 0x100), CanSlave(0x201, 0x200), CanSlave(0x80000401, 0x80000400)]
+        assert driver.filters == [0x101]
+        assert not xm.transport.daqQueue
+        driver.frames.put((0x101, b'\x00\x01', 0))
+        start = time.perf_counter()
+        while not xm.transport.daqQueue and time.perf_counter() - start < 1.0:
+            time.sleep(0.01)
+        assert xm.transport.daqQueue[0][0] == b'\x00\x01'
+
+def test_frame_bits():
+    from pyxcp.transport.can import frameBits, frameDuration
+
+    assert frameBits(0) == (55, 0)
+    assert frameBits(8) == (135, 0)
+    assert frameBits(8, extended = True) == (160, 0)
+    assert frameBits(8, stuffing = False) == (111, 0)
+    assert frameBits(64, extended = True, fd = True, stuffing = False) == (48, 543)
+    assert frameDuration(8, bitrate = 500000.0) == 135 / 500000.0
+    nominal, data = frameBits(64, fd = True)
+    assert frameDuration(64, fd = True, brs = True) == nominal / 500000.0 + data / 2000000.0
+
+def test_virtual_bus_paces_and_connects_master():
+    from pyxcp.master import Master
+    from pyxcp.transport.candriver.virtual import VirtualBus, VirtualNode
+
+    bus = VirtualBus("test", bitrate = 1000000.0)
+    requests = []
+
+    def slave(node, rawId, data):
+        requests.append((rawId, data))
+        node.send(0x101, bytes([0xff, 0x3d, 0x00, 0x08, 0x08, 0x00, 0x01, 0x01]))
+    slaveNode = VirtualNode(bus, ids = [0x100], callback = slave)
+    try:
+        with Master("can", config = {'CAN_DRIVER': "VirtualCAN", 'VC_BUS': "test",
+                'CAN_ID_MASTER': 0x101, 'CAN_ID_SLAVE': 0x100}) as xm:
+            xm.connect()
+            assert requests == [(0x100, b'\xff\x00')]
+            assert xm.slaveProperties.maxCto == 8
+            assert bus.frameCount == 2
+        listener = VirtualNode(bus, ids = [0x200])
+        bus.reset()
+        start = time.perf_counter()
+        for _ in range(100):
+            slaveNode.send(0x200, bytes(8))
+        assert time.perf_counter() - start >= 100 * 135e-6
+        assert bus.busyNs == 100 * 135000
+        assert 0.0 < bus.load() <= 1.0
+        frames = listener.receive(1000)
+        assert len(frames) == 100
+        assert frames[-1][2] - frames[0][2] >= 99 * 135000
+    finally:
+        bus.close()
+
+
+def test_virtual_bus_delivers_concurrent_senders_in_order():
+    from pyxcp.transport.candriver.virtual import VirtualBus, VirtualNode
+
+    bus = VirtualBus("ordered", bitrate = 1000000.0)
+    try:
+        senders = [VirtualNode(bus, ids = []) for _ in range(4)]
+        listener = VirtualNode(bus, ids = [0x200 + i for i in range(4)])
+
+        def send(idx):
+            for counter in range(50):
+                senders[idx].send(0x200 + idx, bytes([idx, counter]))
+        threads = [threading.Thread(target = send, args = (i, )) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        frames = listener.receive(1000)
+        assert len(frames) == 200
+        timestamps = [ts for _, _, ts in frames]
+        assert timestamps == sorted(timestamps)
+        for idx in range(4):
+            assert [data[1] for rawId, data, _ in frames if rawId == 0x200 + idx] == list(range(50))
+    finally:
+        bus.close()
@@ -0,0 +1,142 @@
+import time
+
+import pytest
+
+from pyxcp.clocksync import ClockSync, LinearFit, TimestampConverter, unwrapTicks
+
+
+class FakeMaster:
+    """Slave clock running at 1 tick / µs (+50ppm), starting at `start`.
+
+    Also acts as host clock, every call advances host time by 1ms.
+    """
+
+    def __init__(self, start=0, nsPerTick=1000.0 * (1.0 + 50e-6), offset=123456789):
+        self.nsPerTick = nsPerTick
+        self.offset = offset
+        self.start = start
+        self.now = 0
+
+    def perf_counter_ns(self):
+        self.now += 1000000
+        return self.now
+
+    def getDaqClock(self):
+        return (self.start + int((self.now - self.offset) / self.nsPerTick)) & 0xffffffff
+
+
+def test_unwrap_ticks():
+    assert unwrapTicks(5, 0x100000000 - 5) == 0x100000005
+    assert unwrapTicks(0xfffffffe, 0x100000003) == 0xfffffffe
+    assert unwrapTicks(0x10, 0x1fff0, width=2) == 0x20010
+
+
+def test_linear_fit_exact():
+    fit = LinearFit(forgettingFactor=1.0)
+    for x in range(0, 10000, 100):
+        fit.update(x, 3 * x + 1000)
+    slope, intercept = fit.coefficients()
+    assert slope == pytest.approx(3.0)
+    assert intercept == pytest.approx(1000.0)
+
+
+def test_linear_fit_requires_two_samples():
+    fit = LinearFit()
+    fit.update(10, 10)
+    assert not fit.valid
+    with pytest.raises(ValueError):
+        fit.coefficients()
+
+
+def test_add_sample_rejects_slow_round_trips():
+    cs = ClockSync(None)
+    assert cs.addSample(1000, 1000000, rtt=100)
+    assert not cs.addSample(2000, 2000000, rtt=1000)
+    assert cs.addSample(3000, 3000000, rtt=150)
+
+
+def test_fit_across_wrap_around():
+    cs = ClockSync(None)
+    nsPerTick = 1000.0
+    for i in range(20):
+        ticks = 0xffff0000 + i * 10000
+        cs.addSample(ticks & 0xffffffff, int(ticks * nsPerTick), rtt=10)
+    slope, intercept = cs.coefficients
+    assert slope == pytest.approx(nsPerTick)
+    assert cs.toHost(0xffff0000 + 200000) == pytest.approx((0xffff0000 + 200000) * nsPerTick, rel=1e-9)
+
+
+def test_sample_uses_fake_master(monkeypatch):
+    master = FakeMaster(start=0xfffff000)
+    monkeypatch.setattr("pyxcp.clocksync.perf_counter_ns", master.perf_counter_ns)
+    cs = ClockSync(master, burstSize=4)
+    for _ in range(10):
+        cs.sample()
+    assert cs.valid
+    assert cs.nsPerTick == pytest.approx(master.nsPerTick, rel=1e-6)
+    assert cs.drift(1000.0) == pytest.approx(50.0, abs=1.0)
+
+
+def test_apply_to_batch_with_host_references():
+    cs = ClockSync(None)
+    for i in range(10):
+        cs.addSample(i * 1000000, i * 1000000000, rtt=10)  # 1 tick == 1µs
+    ticks = [(t * 1000) & 0xffff for t in range(1, 6)]      # 2 byte DTO timestamps, 1ms apart
+    hostNs = [t * 1000000 + 5000 for t in range(1, 6)]     # arrived 5µs later
+    result = cs.applyToBatch(ticks, width=2, hostNs=hostNs)
+    assert result == [t * 1000000 for t in range(1, 6)]
+
+
+def test_apply_to_batch_numpy():
+    np = pytest.importorskip("numpy")
+    cs = ClockSync(None)
+    for i in range(10):
+        cs.addSample(i * 1000, i * 1000000, rtt=10)
+    result = cs.applyToBatch(np.array([9000, 9500], dtype="uint32"))
+    assert result.tolist() == pytest.approx([9000000.0, 9500000.0])
+
+
+def test_linear_fit_line_is_precise_for_large_values():
+    fit = LinearFit(forgettingFactor=1.0)
+    base = 1700000000 * 1000000000     # Wall-clock nano seconds.
+    for x in range(0, 10000000000, 1000000000):
+        fit.update(base + x, base + x + x // 10000 + 5000)
+    x, y, slope = fit.line()
+    assert slope == pytest.approx(1.0001)
+    assert abs(y + int(slope * (base + 20000000000 - x)) - (base + 20002005000)) < 10
+
+
+def latency(i):
+    """Reception latency (0 .. 2ms) of the `i`-th frame, every 50th frame is read immediately.
+    """
+    return 0 if i % 50 == 0 else (i * 7919) % 2000000
+
+
+def test_timestamp_converter_follows_drift():
+    conv = TimestampConverter(resolution=1000)
+    for i in range(6000):   # A minute, host clock running 100ppm faster.
+        ns = i * 10000000
+        host = ns + ns // 10000 + 5000000
+        result = conv(ns // 1000, host + latency(i))
+    assert abs(result - host) < 10000   # Would be 6ms, if the offset only ever moved down.
+    assert conv.steps == 0
+
+
+def test_timestamp_converter_recovers_from_clock_steps():
+    conv = TimestampConverter(resolution=1)
+    for i in range(300):
+        conv(i * 10000000, i * 10000000 + 1000 + latency(i))
+    for i in range(300):    # Wall-clock set back by a second.
+        ns = 2000000000 + i * 10000000
+        host = 3000000000 + i * 10000000
+        result = conv(ns, host + latency(i))
+    assert conv.steps == 1
+    assert abs(result - host) < 10000
+
+
+def test_timestamp_converter_samples_readable_clock():
+    wallOffset = 1700000000 * 1000000000
+    conv = TimestampConverter(resolution=1, clock=lambda: time.perf_counter_ns() + wallOffset)
+    received = time.perf_counter_ns()
+    time.sleep(0.01)    # Read late.
+    assert abs(conv(received + wallOffset, time.perf_counter_ns()) - received) < 1000000
@@ -0,0 +1,216 @@
+import io
+import struct
+
+import pytest
+
+from pyxcp.daq import DaqLayout, DaqList, Measurement, Odt
+
+LAYOUT = {
+    "byteOrder": "INTEL",
+    "daqLists": [
+        {
+            "number": 0, "eventChannel": 1, "firstPid": 0, "timestampSize": 2,
+            "odts": [
+                [["speed", 0, "U16"], ["throttle", 2, "F32"]],
+                [["lambda", 0, "F32"], ["gear", 4, "I8"]],
+            ]
+        },
+        {
+            "number": 1, "eventChannel": 2, "firstPid": 2,
+            "odts": [
+                [["counter", 0, "U32"]],
+            ]
+        },
+    ]
+}
+
+
+def makeLayout():
+    return DaqLayout.fromDict(LAYOUT)
+
+
+def test_layout_pid_map():
+    layout = makeLayout()
+    assert sorted(layout.pidMap.keys()) == [0, 1, 2]
+    daqList, odtNumber = layout.lookup(1)
+    assert daqList.number == 0
+    assert odtNumber == 1
+    assert daqList.packetSize(0) == 1 + 2 + 6
+    assert daqList.packetSize(1) == 1 + 5
+    assert layout.locate("counter") == (2, Measurement("counter", 0, "U32"))
+
+
+def test_layout_dict_round_trip():
+    assert makeLayout().toDict()["daqLists"][0]["odts"] == LAYOUT["daqLists"][0]["odts"]
+
+
+def test_layout_from_json_file():
+    import json
+    fp = io.StringIO(json.dumps(LAYOUT))
+    fp.name = "layout.json"
+    layout = DaqLayout.fromFile(fp)
+    assert len(layout.daqLists) == 2
+
+
+def test_layout_duplicate_pid_raises():
+    with pytest.raises(ValueError):
+        DaqLayout([
+            DaqList(0, 0, [Odt([Measurement("a", 0, "U8")])], firstPid = 0),
+            DaqList(1, 0, [Odt([Measurement("b", 0, "U8")])], firstPid = 0),
+        ])
+
+
+def test_layout_invalid_data_type_raises():
+    with pytest.raises(ValueError):
+        Odt([Measurement("a", 0, "U12")])
+
+
+def test_decoder_vectorized():
+    np = pytest.importorskip("numpy")
+    from pyxcp.daq.decoder import DaqDecoder
+
+    decoder = DaqDecoder(makeLayout())
+    packets = b''.join(struct.pack("<BHHf", 0, 10 * i, i, 0.5 * i) for i in range(5))
+    arr = np.frombuffer(packets, dtype = np.uint8).reshape(5, 9)
+    values = decoder.decode(0, arr)
+    assert values["speed"].tolist() == [0, 1, 2, 3, 4]
+    assert values["timestamp"].tolist() == [0, 10, 20, 30, 40]
+    assert values["throttle"].tolist() == [0.0, 0.5, 1.0, 1.5, 2.0]
+    assert np.shares_memory(values, arr)
+
+
+def test_decoder_single_packet():
+    pytest.importorskip("numpy")
+    from pyxcp.daq.decoder import DaqDecoder
+
+    decoder = DaqDecoder(makeLayout())
+    pid, value = decoder.decodeBytes(struct.pack("<BfbBB", 1, 0.25, -3, 0, 0))
+    assert pid == 1
+    assert value["lambda"] == 0.25
+    assert value["gear"] == -3
+
+
+def test_layout_dto_counter():
+    np = pytest.importorskip("numpy")
+    from pyxcp.daq.decoder import DaqDecoder
+
+    data = dict(LAYOUT, daqLists = [dict(LAYOUT["daqLists"][0], dtoCounter = True)])
+    layout = DaqLayout.fromDict(data)
+    daqList = layout.daqLists[0]
+    assert daqList.timestampOffset == 2
+    assert daqList.headerSize(0) == 1 + 1 + 2
+    assert daqList.headerSize(1) == 1
+    assert layout.toDict()["daqLists"][0]["dtoCounter"] is True
+    decoder = DaqDecoder(layout)
+    packet = struct.pack("<BBHHf", 0, 7, 1234, 42, 1.5)
+    values = decoder.decode(0, np.frombuffer(packet, dtype = np.uint8).reshape(1, -1))
+    assert values["timestamp"].tolist() == [1234]
+    assert values["speed"].tolist() == [42]
+    assert values["throttle"].tolist() == [1.5]
+
+
+def test_statistics_dto_counter_and_overload():
+    from pyxcp.daq.stats import DaqStatistics
+
+    data = dict(LAYOUT)
+    data["daqLists"] = [dict(LAYOUT["daqLists"][0], dtoCounter = True), LAYOUT["daqLists"][1]]
+    stats = DaqStatistics(DaqLayout.fromDict(data), overloadMsb = True)
+    for ctr in (250, 251, 253, 254, 3):    # 252 and 255..2 are missing.
+        stats.daqReceived(bytes([0, ctr, 0, 0]))
+        stats.daqReceived(bytes([1, 0]))
+    stats.daqReceived(bytes([0x82, 0]))
+    stats.daqDropped(bytes([2, 0]))
+    snapshot = stats.snapshot()
+    assert snapshot.daqLists[0] == (10, 5, 0, 0)
+    assert snapshot.daqLists[1] == (1, 0, 1, 1)
+    assert snapshot.total == (11, 5, 1, 1)
+    assert snapshot.daqLists[0].lost == 5
+    stats.reset()
+    assert stats.snapshot().total == (0, 0, 0, 0)
+
+
+def test_statistics_loss_callback():
+    from pyxcp.daq.stats import DaqStatistics
+
+    stats = DaqStatistics()
+    calls = []
+    stats.onLoss(calls.append, threshold = 3)
+    for counter in (0, 1, 3, 4, 7, 8):
+        stats.counterReceived(counter)
+        stats.daqReceived(bytes([5, 0]))
+    assert len(calls) == 1
+    assert calls[0].transportGaps == 3
+    assert calls[0].daqLists == {5: (4, 0, 0, 0)}
+    stats.counterReceived(0xfffe)
+    stats.counterReceived(0)        # Wraps around, 0xffff is missing.
+    assert stats.transportGaps == 3 + (0xfffe - 9) + 1
+
+def test_planner_event_cycle_time():
+    from pyxcp import types
+    from pyxcp.daq.planner import eventCycleTime
+
+    info = types.GetEventChannelInfoResponse.parse(bytes([0x04, 1, 0, 10, 6, 0]), byteOrder = types.ByteOrder.INTEL)
+    assert eventCycleTime(info) == pytest.approx(0.01)
+    info = types.GetEventChannelInfoResponse.parse(bytes([0x04, 1, 0, 0, 6, 0]), byteOrder = types.ByteOrder.INTEL)
+    assert eventCycleTime(info) is None
+
+def test_planner_repacks_and_raises_prescalers():
+    from pyxcp.daq.planner import BusLoadPlanner, Suggestion
+
+    layout = DaqLayout([
+        DaqList(0, 0, [Odt([Measurement("a", 0, "U16")]), Odt([Measurement("b", 0, "U16")]),
+            Odt([Measurement("c", 0, "U16")])]),
+        DaqList(1, 1, [Odt([Measurement("d", 0, "U32")])], firstPid = 3),
+        DaqList(2, 2, [Odt([Measurement("e", 0, "U8")])], firstPid = 4),
+    ])
+    planner = BusLoadPlanner(bitrate = 500000.0, targetLoad = 0.1)
+    planner.setEventCycle(0, 0.001)
+    planner.setEventCycle(1, 0.01)
+    planner.setEventCycle(2, None)
+    estimate = planner.estimate(layout)
+    assert estimate.daqLists[0] == pytest.approx(3 * 85 / 500000.0 / 0.001)
+    assert estimate.daqLists[1] == pytest.approx(105 / 500000.0 / 0.01)
+    assert estimate.unknown == [2]
+    plan = planner.plan(layout)
+    assert plan.feasible
+    assert plan.suggestions == [Suggestion(0, "repack", 3, 1), Suggestion(0, "prescaler", 1, 4)]
+    assert [m.offset for m in plan.layout.daqLists[0].odts[0].measurements] == [0, 2, 4]
+    assert plan.estimate.total == pytest.approx(125 / 500000.0 / 0.004 + 105 / 500000.0 / 0.01)
+    assert layout.daqLists[0].prescaler == 1 and len(layout.daqLists[0].odts) == 3
+    planner.targetLoad = 0.0001
+    assert not planner.plan(layout).feasible
+
+def test_drain_fans_out_to_all_sinks():
+    from collections import deque
+    from pyxcp.daq.drain import DRAINS, DaqDrain
+
+    queue = deque()
+    drain = DaqDrain.forQueue(queue)
+    assert DaqDrain.forQueue(queue) is drain
+    seen = {"a": [], "b": [], "final": []}
+
+    def sinkA(elements, final):
+        seen["a"].extend(elements)
+        if final:
+            seen["final"].append("a")
+
+    def sinkB(elements, final):
+        seen["b"].extend(elements)
+
+    def broken(elements, final):
+        raise ValueError("broken")
+
+    drain.attach(sinkA)
+    drain.attach(sinkB)
+    drain.attach(broken)
+    with pytest.raises(ValueError):
+        drain.attach(sinkA)
+    queue.extend(range(10000))
+    drain.detach(sinkA)
+    assert seen["a"] == list(range(10000))
+    assert seen["final"] == ["a"]
+    assert drain.sinks == (sinkB, )
+    drain.detach(sinkB)
+    assert seen["b"] == list(range(10000))
+    assert not drain.running
+    assert id(queue) not in DRAINS
@@ -0,0 +1,134 @@
+from collections import deque
+import threading
+import time
+
+import pytest
+
+from pyxcp.daq.dispatcher import DaqDispatcher
+from pyxcp.tests.test_daq import makeLayout
+
+
+def makeElements(pids, count):
+    return [(bytes([pids[i % len(pids)], i & 0xff]), i, 2, i) for i in range(count)]
+
+
+def test_routing_by_daq_list_and_event_channel():
+    queue = deque(makeElements([0, 1, 2, 9], 400))
+    received = {"all": [], "daq0": [], "ev2": []}
+    dispatcher = DaqDispatcher(queue, makeLayout())
+    dispatcher.subscribe(received["all"].extend)
+    dispatcher.subscribe(received["daq0"].extend, daqList = 0)
+    dispatcher.subscribe(received["ev2"].extend, eventChannel = 2)
+    with dispatcher:
+        pass
+    assert len(received["all"]) == 400
+    assert {e[0][0] for e in received["daq0"]} == {0, 1}
+    assert len(received["daq0"]) == 200
+    assert {e[0][0] for e in received["ev2"]} == {2}
+    assert [e[1] for e in received["ev2"]] == list(range(2, 400, 4))
+
+
+def test_overload_bit_is_ignored_for_routing():
+    queue = deque(makeElements([0, 0x81, 2], 30))
+    daq0 = []
+    dispatcher = DaqDispatcher(queue, makeLayout(), overloadMsb = True)
+    dispatcher.subscribe(daq0.extend, daqList = 0)
+    with dispatcher:
+        pass
+    assert [e[0][0] for e in daq0] == [0, 0x81] * 10
+
+
+def test_unsubscribe_counts_pending_batch_as_dropped():
+    queue = deque()
+    received = []
+    with DaqDispatcher(queue) as dispatcher:
+        sub = dispatcher.subscribe(received.extend, batchSize = 100, batchInterval = 10.0)
+        queue.extend(makeElements([0], 30))
+        while queue:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        dispatcher.unsubscribe(sub)
+        queue.extend(makeElements([0], 5))
+    assert not received
+    assert sub.droppedCount == 30
+    assert sub.deliveredCount == 0
+
+
+def test_batches_by_size_and_interval():
+    queue = deque()
+    batches = []
+    with DaqDispatcher(queue) as dispatcher:
+        dispatcher.subscribe(batches.append, batchSize = 10, batchInterval = 0.05)
+        queue.extend(makeElements([0], 25))
+        time.sleep(0.2)
+        assert [len(b) for b in batches] == [10, 10, 5]
+
+
+def test_subscribe_without_layout_raises():
+    with pytest.raises(ValueError):
+        DaqDispatcher(deque()).subscribe(print, daqList = 0)
+
+
+def slowConsumer(release):
+    def callback(batch):
+        release.wait(5)
+    return callback
+
+
+@pytest.mark.parametrize("policy", ["drop", "coalesce"])
+def test_slow_subscriber_policies(policy):
+    queue = deque()
+    release = threading.Event()
+    fast = []
+    with DaqDispatcher(queue, workers = 2) as dispatcher:
+        slow = dispatcher.subscribe(slowConsumer(release), batchSize = 10, policy = policy, maxPending = 2)
+        dispatcher.subscribe(fast.extend, batchSize = 10)
+        queue.extend(makeElements([0], 100))
+        start = time.perf_counter()
+        while len(fast) < 100 and time.perf_counter() - start < 2:
+            time.sleep(0.01)
+        assert len(fast) == 100     # Not delayed by the slow subscriber.
+        release.set()
+    assert slow.droppedCount >= 70  # At most one batch in delivery plus two pending.
+    assert slow.droppedCount + slow.deliveredCount == 100
+
+
+def test_block_policy_loses_nothing():
+    queue = deque(makeElements([0], 200))
+    received = []
+
+    def callback(batch):
+        time.sleep(0.002)
+        received.extend(batch)
+
+    dispatcher = DaqDispatcher(queue)
+    sub = dispatcher.subscribe(callback, batchSize = 5, policy = "block", maxPending = 1)
+    with dispatcher:
+        pass
+    assert [e[1] for e in received] == list(range(200))
+    assert sub.droppedCount == 0
+
+
+def test_failing_callback_doesnt_stop_delivery():
+    queue = deque(makeElements([0], 30))
+    received = []
+
+    def callback(batch):
+        received.extend(batch)
+        raise RuntimeError("boom")
+
+    dispatcher = DaqDispatcher(queue)
+    dispatcher.subscribe(callback, batchSize = 10)
+    with dispatcher:
+        pass
+    assert len(received) == 30
+
+
+def test_dispatchers_sharing_a_queue_see_all_packets():
+    queue = deque()
+    first, second = [], []
+    with DaqDispatcher(queue) as one, DaqDispatcher(queue) as two:
+        one.subscribe(first.extend)
+        two.subscribe(second.extend)
+        queue.extend(makeElements([0, 1], 1000))
+    assert first == second == makeElements([0, 1], 1000)
@@ -0,0 +1,117 @@
+import os
+import socket
+import struct
+import sys
+import time
+
+import pytest
+
+from pyxcp.transport.eth import Eth
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason = "SO_TIMESTAMPNS is Linux only.")
+def test_udp_kernel_timestamps():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    tr = Eth(config = {"HOST": "localhost", "PORT": port, "PROTOCOL": "UDP",
+        "KERNEL_TIMESTAMPS": True, "CREATE_DAQ_TIMESTAMPS": True})
+    try:
+        tr.connect()
+        before = time.perf_counter_ns()
+        packet = b'\x00\x11\x22\x33'
+        server.sendto(struct.pack("<HH", len(packet), 1) + packet, tr.sock.getsockname())
+        start = time.perf_counter()
+        while not tr.daqQueue and time.perf_counter() - start < 2.0:
+            time.sleep(0.01)
+        after = time.perf_counter_ns()
+        response, counter, length, timestamp = tr.daqQueue.popleft()
+        assert response == packet
+        assert counter == 1
+        # Allow some slack, wall-clock and monotonic clock are sampled separately.
+        assert before - 1000000 <= timestamp <= after + 1000000
+    finally:
+        tr.close()
+        server.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason = "Listener process requires fork().")
+def test_udp_listener_process():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    tr = Eth(config = {"HOST": "localhost", "PORT": port, "PROTOCOL": "UDP",
+        "LISTENER_PROCESS": True, "CREATE_DAQ_TIMESTAMPS": True})
+    try:
+        tr.connect()
+        assert tr.listenerProcess.ringName
+        before = time.perf_counter_ns()
+        packets = [bytes([pid, 0x11, 0x22, 0x33]) for pid in range(100)]
+        for counter, packet in enumerate(packets):
+            server.sendto(struct.pack("<HH", len(packet), counter) + packet, tr.sock.getsockname())
+        server.sendto(struct.pack("<HH", 2, 100) + b"\xff\x00", tr.sock.getsockname())
+        server.sendto(struct.pack("<HH", 2, 101) + b"\xfd\x01", tr.sock.getsockname())
+        start = time.perf_counter()
+        while (len(tr.daqQueue) < 100 or not tr.resQueue or not tr.evQueue) and time.perf_counter() - start < 5.0:
+            time.sleep(0.01)
+        assert [element[0] for element in tr.daqQueue] == packets
+        assert [element[1] for element in tr.daqQueue] == list(range(100))
+        assert all(before <= element[3] <= time.perf_counter_ns() for element in tr.daqQueue)
+        assert tr.first_daq_timestamp == tr.daqQueue[0][3]
+        assert list(tr.resQueue) == [b"\xff\x00"]
+        assert list(tr.evQueue) == [b"\xfd\x01"]
+    finally:
+        tr.close()
+        server.close()
+    assert tr.listenerProcess.ringName is None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason = "Listener process requires fork().")
+def test_listener_process_forwards_statistics():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    tr = Eth(config = {"HOST": "localhost", "PORT": port, "PROTOCOL": "UDP", "LISTENER_PROCESS": True})
+    try:
+        tr.connect()
+        with pytest.raises(RuntimeError):
+            tr.checkReceivePathMutable("Changing routes")
+        for counter in (0, 1, 5, 6):
+            server.sendto(struct.pack("<HH", 2, counter) + b"\x00\x00", tr.sock.getsockname())
+        start = time.perf_counter()
+        while len(tr.daqQueue) < 4 and time.perf_counter() - start < 5.0:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        assert len(tr.daqQueue) == 4
+        snapshot = tr.daqStatistics.snapshot()
+        assert snapshot.transportGaps == 3
+        assert snapshot.daqLists[0].received == 4
+    finally:
+        tr.close()
+        server.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason = "Listener process requires fork().")
+def test_listener_process_refuses_to_fork_with_threads():
+    import threading
+
+    tr = Eth(config = {"HOST": "localhost", "PORT": 5555, "PROTOCOL": "UDP", "LISTENER_PROCESS": True})
+    stop = threading.Event()
+    thread = threading.Thread(target = stop.wait, name = "Busy")
+    thread.start()
+    try:
+        with pytest.raises(RuntimeError, match = "Busy"):
+            tr.listenerProcess.start()
+        assert not tr.listenerProcess.running
+    finally:
+        stop.set()
+        thread.join()
+        tr.close()
+
+
+def test_get_slave_id_requires_can():
+    from pyxcp.master import Master
+
+    with Master("eth", config = {"HOST": "localhost", "PORT": 5555, "PROTOCOL": "UDP"}) as xm:
+        with pytest.raises(NotImplementedError, match = "CAN"):
+            xm.getSlaveID(0)
@@ -0,0 +1,484 @@
+from collections import deque
+import struct
+import time
+
+import pytest
+
+from pyxcp.recorder import (
+    DaqRecorder, MappedRecording, TimeIndex, indexChunks, readChunk, readChunks, readRecords, readTimeRange
+)
+from pyxcp.recorder.index import indexFileName
+from pyxcp.recorder.reader import iterRecords
+from pyxcp.recorder.format import FILE_HEADER, CHUNK_HEADER, RecordingError
+
+
+def makeElements(count, size = 8):
+    return [(bytes([i & 0xff]) * size, i & 0xffff, size, 1000 * i) for i in range(count)]
+
+
+def test_round_trip(tmp_path):
+    elements = makeElements(1000)
+    queue = deque(elements)
+    with DaqRecorder(tmp_path / "run", queue, chunkSize = 1024) as recorder:
+        pass
+    assert recorder.fileNames == [tmp_path / "run.xdaq"]
+    assert recorder.packetCount == 1000
+    assert recorder.chunkCount > 1
+    assert list(readRecords(*recorder.fileNames)) == elements
+
+
+def test_chunk_headers(tmp_path):
+    queue = deque(makeElements(100))
+    with DaqRecorder(tmp_path / "run.xdaq", queue, chunkSize = 256) as recorder:
+        pass
+    headers = [h for h, _ in readChunks(recorder.fileNames[0])]
+    assert sum(h.recordCount for h in headers) == 100
+    assert headers[0].firstTimestamp == 0
+    assert headers[-1].lastTimestamp == 99000
+
+
+def test_truncated_file_loses_only_last_chunk(tmp_path):
+    elements = makeElements(100)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 200) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    data = fname.read_bytes()
+    fname.write_bytes(data[: -10])
+    records = list(readRecords(fname))
+    assert 0 < len(records) < 100
+    assert records == elements[: len(records)]
+
+
+def test_size_based_rotation(tmp_path):
+    elements = makeElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 512, maxFileSize = 4096) as recorder:
+        pass
+    assert len(recorder.fileNames) > 1
+    assert recorder.fileNames[0].name == "run_0000.xdaq"
+    assert list(readRecords(*recorder.fileNames)) == elements
+
+
+def test_rotation_creates_no_empty_files(tmp_path):
+    elements = makeElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 512, maxFileSize = 4096) as recorder:
+        pass
+    for fname in recorder.fileNames:
+        assert indexChunks(fname)
+        assert TimeIndex.open(fname).entries
+
+
+def test_duration_based_rotation_of_quiet_stream(tmp_path):
+    queue = deque(makeElements(10))
+    recorder = DaqRecorder(tmp_path / "run.xdaq", queue, chunkInterval = 0.01, maxFileDuration = 0.1)
+    recorder.start()
+    time.sleep(0.3)
+    assert recorder._fp is None     # Closed on time, although nothing arrived.
+    assert len(recorder.fileNames) == 1
+    queue.extend(makeElements(5))
+    recorder.stop()
+    assert len(recorder.fileNames) == 2
+    assert list(readRecords(recorder.fileNames[1])) == makeElements(5)
+
+
+def test_records_appended_while_running(tmp_path):
+    queue = deque()
+    recorder = DaqRecorder(tmp_path / "run.xdaq", queue, chunkInterval = 0.01)
+    recorder.start()
+    elements = makeElements(50)
+    for element in elements:
+        queue.append(element)
+    recorder.stop()
+    assert list(readRecords(*recorder.fileNames)) == elements
+
+
+def test_recorders_sharing_a_queue_see_all_records(tmp_path):
+    queue = deque()
+    first = DaqRecorder(tmp_path / "first.xdaq", queue)
+    second = DaqRecorder(tmp_path / "second.xdaq", queue)
+    first.start()
+    second.start()
+    elements = makeElements(500)
+    queue.extend(elements)
+    first.stop()
+    queue.extend(elements)
+    second.stop()
+    assert list(readRecords(*first.fileNames)) == elements
+    assert list(readRecords(*second.fileNames)) == elements + elements
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma"])
+def test_compressed_round_trip(tmp_path, compression):
+    elements = makeElements(2000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 2048, compression = compression) as recorder:
+        pass
+    headers = [h for h, _ in readChunks(recorder.fileNames[0])]
+    assert all(h.storedSize < h.size for h in headers)
+    assert list(readRecords(*recorder.fileNames)) == elements
+
+
+def test_invalid_compression_raises(tmp_path):
+    with pytest.raises(ValueError):
+        DaqRecorder(tmp_path / "run.xdaq", deque(), compression = "zip")
+
+
+def test_random_chunk_access(tmp_path):
+    elements = makeElements(2000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 2048, compression = "zlib") as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    index = indexChunks(fname)
+    assert len(index) == recorder.chunkCount
+    offset, header = index[len(index) // 2]
+    skipped = sum(h.recordCount for _, h in index[: len(index) // 2])
+    _, payload = readChunk(fname, offset)
+    records = list(iterRecords(payload))
+    assert records == elements[skipped : skipped + header.recordCount]
+
+
+def makeDaqElements(count):
+    """Two interleaved ODTs with different sizes, plus a sporadic third one."""
+    elements = []
+    for i in range(count):
+        elements.append((struct.pack("<BHHf", 0, i & 0xffff, i & 0xffff, 0.5 * i), 0, 9, 1000 * i))
+        elements.append((struct.pack("<Bfb", 1, 0.25 * i, i % 7), 0, 6, 1000 * i + 1))
+        if i % 3 == 0:
+            elements.append((struct.pack("<BI", 2, i), 0, 5, 1000 * i + 2))
+    return elements
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_mapped_recording_signal(tmp_path, compression):
+    np = pytest.importorskip("numpy")
+    from pyxcp.daq.decoder import DaqDecoder
+    from pyxcp.tests.test_daq import makeLayout
+
+    elements = makeDaqElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 4096, compression = compression) as recorder:
+        pass
+    decoder = DaqDecoder(makeLayout())
+    with MappedRecording(recorder.fileNames[0]) as rec:
+        assert len(rec) == recorder.chunkCount
+        timestamps, speed = rec.signal("speed", decoder)
+        assert speed.tolist() == list(range(1000))
+        assert timestamps.tolist() == [1000 * i for i in range(1000)]
+        _, counter = rec.signal("counter", decoder)
+        assert counter.tolist() == list(range(0, 1000, 3))
+        del timestamps, speed, counter
+
+
+def test_mapped_recording_zero_copy(tmp_path):
+    np = pytest.importorskip("numpy")
+
+    periodic = [e for e in makeDaqElements(100) if e[0][0] != 2]
+    with DaqRecorder(tmp_path / "run.xdaq", deque(periodic)) as recorder:
+        pass
+    with MappedRecording(recorder.fileNames[0]) as rec:
+        chunk = rec.chunk(0)
+        assert len(chunk) == 200
+        odt0 = chunk.packets(0)
+        assert odt0.shape == (100, 9)
+        assert np.shares_memory(odt0, chunk.buffer)    # equidistant -- strided view
+        assert odt0[:, 1].tolist() == list(range(100))
+        del odt0, chunk
+
+
+def test_mapped_recording_gathers_irregular_packets(tmp_path):
+    np = pytest.importorskip("numpy")
+
+    with DaqRecorder(tmp_path / "run.xdaq", deque(makeDaqElements(100))) as recorder:
+        pass
+    with MappedRecording(recorder.fileNames[0]) as rec:
+        chunk = rec.chunk(0)
+        odt0 = chunk.packets(0)
+        assert odt0.shape == (100, 9)
+        assert not np.shares_memory(odt0, chunk.buffer)
+        assert chunk.packets(2).shape == (34, 5)
+        with pytest.raises(RecordingError):
+            chunk.packets(0, allowCopy = False)
+        del odt0, chunk
+
+
+def test_chunk_view_sync_table(tmp_path):
+    np = pytest.importorskip("numpy")
+    from pyxcp.recorder.reader import ChunkView
+
+    elements = makeDaqElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements)) as recorder:
+        pass
+    with MappedRecording(recorder.fileNames[0]) as rec:
+        chunk = rec.chunk(0)
+        assert len(chunk.sync) == (len(elements) + 63) // 64
+        assert chunk.timestamps.tolist() == [e[3] for e in elements]
+        assert chunk.lengths.tolist() == [len(e[0]) for e in elements]
+        assert chunk.pids.tolist() == [e[0][0] for e in elements]
+        walked = ChunkView(chunk.header, chunk.buffer)    # No sync table.
+        assert walked.offsets.tolist() == chunk.offsets.tolist()
+        broken = ChunkView(chunk.header, chunk.buffer, chunk.sync + 1)
+        assert broken.offsets.tolist() == chunk.offsets.tolist()
+        del chunk, walked, broken
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_time_index_written_by_recorder(tmp_path, compression):
+    elements = makeElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 1024, compression = compression,
+                     indexInterval = 16) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    index = TimeIndex.load(fname)
+    assert sum(e.recordCount for e in index.entries) == 1000
+    assert index.entries == TimeIndex.build(fname, 16, save = False).entries
+
+
+def test_stale_or_short_time_index_is_rebuilt(tmp_path):
+    with DaqRecorder(tmp_path / "run.xdaq", deque(makeElements(1000)), chunkSize = 1024, indexInterval = 16) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    expected = TimeIndex.load(fname).entries
+    idxName = indexFileName(fname)
+    data = idxName.read_bytes()
+    idxName.write_bytes(data[: len(data) // 2])     # Short.
+    assert TimeIndex.open(fname, 16).entries == expected
+    with DaqRecorder(tmp_path / "other.xdaq", deque(makeElements(500)), chunkSize = 1024, indexInterval = 16) as other:
+        pass
+    idxName.write_bytes(indexFileName(other.fileNames[0]).read_bytes())   # Stale.
+    assert TimeIndex.open(fname, 16).entries == expected
+    idxName.write_bytes(b"")
+    assert TimeIndex.open(fname, 16).entries == expected
+    assert TimeIndex.load(fname).entries == expected
+
+
+def test_valid_time_index_is_opened_without_scan(tmp_path, monkeypatch):
+    import pyxcp.recorder.index as index
+
+    with DaqRecorder(tmp_path / "run.xdaq", deque(makeElements(1000)), chunkSize = 1024, indexInterval = 16) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    expected = TimeIndex.load(fname).entries
+    scans = []
+    monkeypatch.setattr(index, "indexChunks", lambda filename: scans.append(filename) or indexChunks(filename))
+    assert TimeIndex.open(fname, 16).entries == expected
+    assert list(readTimeRange(fname, 42000, 42000)) == [makeElements(43)[42]]
+    assert not scans
+    data = fname.read_bytes()
+    fname.write_bytes(data[: -10])  # Last chunk truncated.
+    rebuilt = TimeIndex.open(fname, 16)
+    assert scans
+    assert rebuilt.entries == TimeIndex.build(fname, 16, save = False).entries
+    assert len(rebuilt) < len(expected)
+
+
+def test_time_index_older_than_recording_is_scanned(tmp_path, monkeypatch):
+    import os
+    import pyxcp.recorder.index as index
+
+    with DaqRecorder(tmp_path / "run.xdaq", deque(makeElements(1000)), chunkSize = 1024, indexInterval = 16) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    expected = TimeIndex.load(fname).entries
+    stat = os.stat(str(fname))
+    os.utime(str(indexFileName(fname)), ns = (stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))
+    scans = []
+    monkeypatch.setattr(index, "indexChunks", lambda filename: scans.append(filename) or indexChunks(filename))
+    assert TimeIndex.open(fname, 16).entries == expected
+    assert len(scans) == 1
+    assert TimeIndex.open(fname, 16).entries == expected
+    assert len(scans) == 1     # Found valid, touched.
+
+
+def test_time_range_query(tmp_path):
+    elements = makeElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 1024, indexInterval = 16) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    assert list(readTimeRange(fname, 100500, 200000)) == elements[101 : 201]
+    assert list(readTimeRange(fname, 990000)) == elements[990 : ]
+    assert list(readTimeRange(fname, 0, 255000, pids = {3, 250})) == [elements[3], elements[250]]
+
+
+def test_missing_time_index_is_rebuilt(tmp_path):
+    elements = makeElements(500)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 1024, indexInterval = None) as recorder:
+        pass
+    fname = recorder.fileNames[0]
+    assert not indexFileName(fname).exists()
+    assert list(readTimeRange(fname, 42000, 42000)) == [elements[42]]
+    assert indexFileName(fname).exists()
+    assert len(TimeIndex.load(fname)) > 1
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_convert_recording(tmp_path, workers):
+    pytest.importorskip("numpy")
+    from pyxcp.recorder.convert import convertRecording
+    from pyxcp.tests.test_daq import makeLayout
+
+    elements = makeDaqElements(1000)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 1024, maxFileSize = 8192) as recorder:
+        pass
+    assert len(recorder.fileNames) > 1
+    columns = convertRecording(makeLayout(), recorder.fileNames, workers = workers, chunksPerTask = 3)
+    timestamps, values = columns[0]
+    assert values["speed"].tolist() == list(range(1000))
+    assert timestamps.tolist() == [1000 * i for i in range(1000)]
+    assert values["daq0.timestamp"].tolist() == list(range(1000))
+    _, values = columns[2]
+    assert values["counter"].tolist() == list(range(0, 1000, 3))
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_convert_recording_to_npz(tmp_path, workers):
+    np = pytest.importorskip("numpy")
+    from pyxcp.recorder.convert import convertRecording, convertRecordingTo
+    from pyxcp.tests.test_daq import makeLayout
+
+    with DaqRecorder(tmp_path / "run.xdaq", deque(makeDaqElements(1000)), chunkSize = 1024, maxFileSize = 8192) as recorder:
+        pass
+    output = tmp_path / "out" / "run.npz"
+    assert convertRecordingTo(makeLayout(), recorder.fileNames, output, workers = workers, chunksPerTask = 3) == 3
+    assert [p.name for p in output.parent.iterdir()] == ["run.npz"]   # Parts are gone.
+    columns = convertRecording(makeLayout(), recorder.fileNames, workers = 0)
+    with np.load(str(output)) as data:
+        for timestamps, values in columns.values():
+            for name, expected in values.items():
+                assert data[name].dtype == expected.dtype
+                assert data[name].tolist() == expected.tolist()
+                assert data["{}.timestamp".format(name)].tolist() == timestamps.tolist()
+
+
+def test_convert_command_line(tmp_path):
+    np = pytest.importorskip("numpy")
+    import json
+    from pyxcp.recorder.convert import main
+    from pyxcp.tests.test_daq import LAYOUT
+
+    with DaqRecorder(tmp_path / "run.xdaq", deque(makeDaqElements(100)), chunkSize = 512) as recorder:
+        pass
+    layoutFile = tmp_path / "layout.json"
+    layoutFile.write_text(json.dumps(LAYOUT))
+    main([str(layoutFile), str(recorder.fileNames[0]), "-o", str(tmp_path / "run.npz"), "-j", "2"])
+    with np.load(str(tmp_path / "run.npz")) as data:
+        assert data["lambda"].tolist() == [0.25 * i for i in range(100)]
+        assert data["lambda.timestamp"].tolist() == [1000 * i + 1 for i in range(100)]
+
+
+def test_pyramid(tmp_path):
+    np = pytest.importorskip("numpy")
+    from pyxcp.daq.decoder import DaqDecoder
+    from pyxcp.recorder.pyramid import Pyramid, buildPyramid
+    from pyxcp.tests.test_daq import makeLayout
+
+    elements = makeDaqElements(1234)
+    with DaqRecorder(tmp_path / "run.xdaq", deque(elements), chunkSize = 1000) as recorder:
+        pass
+    pyramid = buildPyramid(recorder.fileNames[0], DaqDecoder(makeLayout()))
+    assert (tmp_path / "run.xpyr").is_dir()
+    assert "speed" in Pyramid(recorder.fileNames[0]).signals
+    speed = np.arange(1234)
+    for factor in (10, 100, 1000):
+        level = pyramid.level("speed", factor)
+        count = -(-1234 // factor)
+        assert len(level["min"]) == count
+        assert level["min"].tolist() == [speed[i : i + factor].min() for i in range(0, 1234, factor)]
+        assert level["max"].tolist() == [speed[i : i + factor].max() for i in range(0, 1234, factor)]
+        assert np.allclose(level["mean"], [speed[i : i + factor].mean() for i in range(0, 1234, factor)])
+        assert level["timestamp"].tolist() == [1000 * i for i in range(0, 1234, factor)]
+    factor, data = pyramid.query("speed", pixels = 100)
+    assert factor == 10
+    factor, data = pyramid.query("speed", 100000, 600000, pixels = 5)
+    assert factor == 100
+    assert data["timestamp"].tolist() == [100000 * i for i in range(1, 7)]
+
+
+def readMdf4(fname):
+    """Minimal MDF4 reader: (finalized, {record ID: (cycle count, channel names, [records])})."""
+    from pyxcp.recorder.mdf4 import BLOCK_HEADER, CG_DATA
+
+    data = fname.read_bytes()
+
+    def block(offset):
+        blockId, length, linkCount = BLOCK_HEADER.unpack_from(data, offset)
+        links = struct.unpack_from("<{}Q".format(linkCount), data, offset + BLOCK_HEADER.size)
+        body = data[offset + BLOCK_HEADER.size + 8 * linkCount : offset + length]
+        return blockId, links, body
+
+    def text(offset):
+        return block(offset)[2].rstrip(b"\x00").decode("utf-8")
+
+    _, hdLinks, _ = block(64)
+    blockId, dgLinks, dgData = block(hdLinks[0])
+    assert blockId == b"##DG"
+    groups = {}
+    cg = dgLinks[1]
+    while cg:
+        _, cgLinks, cgData = block(cg)
+        recordId, cycleCount, _, _, dataBytes, _ = CG_DATA.unpack_from(cgData)
+        names = []
+        cn = cgLinks[1]
+        while cn:
+            _, cnLinks, _ = block(cn)
+            names.append(text(cnLinks[2]))
+            cn = cnLinks[0]
+        groups[recordId] = (cycleCount, names, dataBytes, [])
+        cg = cgLinks[0]
+    blockId, dlLinks, _ = block(dgLinks[2])
+    assert blockId == b"##DL"
+    records = b"".join(block(dt)[2] for dt in dlLinks[1:])
+    offset = 0
+    while offset < len(records):
+        recordId = records[offset]
+        dataBytes = groups[recordId][2]
+        groups[recordId][3].append(records[offset : offset + 1 + dataBytes])
+        offset += 1 + dataBytes
+    return data[:8] == b"MDF     ", groups
+
+
+def test_mdf4_writer(tmp_path):
+    from pyxcp.recorder.mdf4 import Mdf4Writer
+    from pyxcp.tests.test_daq import makeLayout
+
+    elements = makeDaqElements(1000)
+    elements.append((b"\x07\x00", 0, 2, 0))     # Unknown PID.
+    writer = Mdf4Writer(tmp_path / "run.mf4", makeLayout(), blockSize = 1000)
+    assert (tmp_path / "run.mf4").read_bytes()[:8] == b"UnFinMF "
+    writer.extend(elements)
+    writer.close()
+    assert writer.droppedCount == 1
+    finalized, groups = readMdf4(tmp_path / "run.mf4")
+    assert finalized
+    assert sorted(groups.keys()) == [0, 1, 2]
+    cycleCount, names, dataBytes, records = groups[0]
+    assert cycleCount == len(records) == 1000
+    assert names == ["time", "daq0.timestamp", "speed", "throttle"]
+    assert dataBytes == 8 + 8
+    speed, throttle, time = struct.unpack("<3xHfq", records[123])
+    assert (speed, throttle) == (123, 61.5)
+    assert time == 123000 - writer.startCounter
+    assert groups[2][0] == 334
+    assert groups[2][1] == ["time", "counter"]
+
+
+def test_mdf4_writer_drains_queue(tmp_path):
+    from pyxcp.recorder.mdf4 import Mdf4Writer
+    from pyxcp.tests.test_daq import makeLayout
+
+    queue = deque()
+    with Mdf4Writer(tmp_path / "run.mf4", makeLayout(), queue) as writer:
+        queue.extend(makeDaqElements(100))
+    assert not queue
+    _, groups = readMdf4(tmp_path / "run.mf4")
+    assert [groups[pid][0] for pid in (0, 1, 2)] == [100, 100, 34]
+
+
+def test_mdf4_writer_and_recorder_share_queue(tmp_path):
+    from pyxcp.recorder.mdf4 import Mdf4Writer
+    from pyxcp.tests.test_daq import makeLayout
+
+    queue = deque()
+    elements = makeDaqElements(100)
+    with DaqRecorder(tmp_path / "run.xdaq", queue) as recorder:
+        with Mdf4Writer(tmp_path / "run.mf4", makeLayout(), queue):
+            queue.extend(elements)
+    _, groups = readMdf4(tmp_path / "run.mf4")
+    assert [groups[pid][0] for pid in (0, 1, 2)] == [100, 100, 34]
+    assert [record[0] for record in readRecords(*recorder.fileNames)] == [e[0] for e in elements]
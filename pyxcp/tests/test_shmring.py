@@ -0,0 +1,152 @@
+from collections import deque
+import multiprocessing as mp
+import os
+import time
+
+import pytest
+
+shmring = pytest.importorskip("pyxcp.daq.shmring")
+if not shmring.HAS_SHARED_MEMORY:
+    pytest.skip("multiprocessing.shared_memory not available", allow_module_level = True)
+
+from pyxcp.daq.shmring import RingConsumer, RingPublisher
+
+
+def makeElements(count, size = 10):
+    return [(bytes([i & 0xff]) * size, i & 0xffff, size, 1000 * i) for i in range(count)]
+
+
+def toTuples(elements):
+    return [(bytes(p), c, l, t) for p, c, l, t in elements]
+
+
+def test_single_consumer():
+    with RingPublisher(size = 4096) as publisher:
+        with RingConsumer(publisher.name) as consumer:
+            assert consumer.read() == []
+            elements = makeElements(50)
+            assert publisher.publishMany(elements) == 0
+            assert toTuples(consumer.read(maxCount = 20)) == elements[: 20]
+            assert toTuples(consumer.read()) == elements[20 :]
+            assert consumer.read() == []
+
+
+def test_wrap_around():
+    elements = makeElements(1000)
+    received = []
+    with RingPublisher(size = 1000) as publisher:
+        with RingConsumer(publisher.name) as consumer:
+            for idx in range(0, 1000, 7):
+                assert publisher.publishMany(elements[idx : idx + 7]) == 0
+                received.extend(toTuples(consumer.read()))
+    assert received == elements
+
+
+def test_multiple_consumers_have_own_cursors():
+    elements = makeElements(30)
+    with RingPublisher(size = 4096) as publisher:
+        first = RingConsumer(publisher.name)
+        second = RingConsumer(publisher.name)
+        assert (first.slot, second.slot) == (0, 1)
+        publisher.publishMany(elements)
+        assert toTuples(first.read()) == elements
+        assert toTuples(second.read(maxCount = 10)) == elements[: 10]
+        assert toTuples(second.read()) == elements[10 :]
+        first.close()
+        second.close()
+
+
+def test_slow_consumer_causes_drops():
+    elements = makeElements(100)
+    with RingPublisher(size = 256) as publisher:
+        with RingConsumer(publisher.name) as consumer:
+            dropped = publisher.publishMany(elements)
+            assert dropped > 0
+            assert consumer.droppedCount == dropped
+            assert len(consumer.read()) == 100 - dropped
+            consumer.release()
+            assert publisher.publish(*elements[0])
+
+
+def test_oversized_packet_is_dropped():
+    with RingPublisher(size = 256) as publisher:
+        with RingConsumer(publisher.name) as consumer:
+            assert not publisher.publish(bytes(200), 1, 200, 100)
+            assert publisher.publish(b"\x01\x02", 2, 2, 200)
+            assert publisher.droppedCount == 1
+            assert consumer.droppedCount == 1
+            assert toTuples(consumer.read()) == [(b"\x01\x02", 2, 2, 200)]
+
+
+def test_oversized_packet_doesnt_stop_publisher():
+    queue = deque()
+    with RingPublisher(size = 256, queue = queue) as publisher:
+        consumer = RingConsumer(publisher.name)
+        queue.append((bytes(200), 1, 200, 100))
+        queue.extend(makeElements(3))
+        received = []
+        while len(received) < 3:
+            received.extend(toTuples(consumer.read(timeout = 1.0)))
+        assert publisher.droppedCount == 1
+    assert received == makeElements(3)
+    consumer.close()
+
+
+def test_detached_consumer_doesnt_block():
+    with RingPublisher(size = 256) as publisher:
+        RingConsumer(publisher.name).close()
+        assert publisher.publishMany(makeElements(100)) == 0
+
+
+def test_queue_drained_by_publisher():
+    queue = deque()
+    with RingPublisher(size = 4096, queue = queue) as publisher:
+        consumer = RingConsumer(publisher.name)
+        queue.extend(makeElements(20))
+        received = []
+        while len(received) < 20:
+            received.extend(toTuples(consumer.read(timeout = 1.0)))
+    assert received == makeElements(20)
+    assert consumer.closed
+    consumer.close()
+
+
+def consume(name, result):
+    total = 0
+    with RingConsumer(name, slot = 0) as consumer:
+        while not consumer.closed:
+            for packet, counter, length, timestamp in consumer.read(timeout = 0.1):
+                total += packet[0] + length
+    result.put(total)
+
+
+def test_consumer_process():
+    ctx = mp.get_context("spawn")
+    elements = makeElements(5000)
+    result = ctx.Queue()
+    publisher = RingPublisher(size = 8192)
+    proc = ctx.Process(target = consume, args = (publisher.name, result))
+    proc.start()
+    while not shmring.U64.unpack_from(publisher._buf, publisher._slotOffset(0))[0]:
+        time.sleep(0.001)   # Wait for consumer to attach.
+    for element in elements:
+        while not publisher.publish(*element):
+            time.sleep(0.0001)
+    publisher.close()
+    assert result.get(timeout = 10) == sum(p[0] + l for p, _, l, _ in elements)
+    proc.join(10)
+
+
+def reportTrackerId(result):
+    result.put(shmring.trackerId())
+
+
+@pytest.mark.skipif(os.name != "posix", reason = "shared memory is tracked on POSIX only")
+def test_child_processes_share_resource_tracker():
+    ctx = mp.get_context("spawn")
+    result = ctx.Queue()
+    with RingPublisher(size = 4096):
+        proc = ctx.Process(target = reportTrackerId, args = (result, ))
+        proc.start()
+        assert result.get(timeout = 10) == shmring.trackerId() != 0
+        proc.join(10)
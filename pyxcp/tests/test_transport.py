@@ -4,6 +4,7 @@ from unittest import mock
 import pytest
 
 import pyxcp.transport.base as tr
+import pyxcp.types as types
 from pyxcp.tests.test_master import MockCanInterface
 
 def test_factory_works():
@@ -44,3 +45,197 @@ def test_transport_classes():
     assert issubclass(transports.get("eth"), tr.BaseTransport)
     assert issubclass(transports.get("sxi"), tr.BaseTransport)
 
+
+
+def makeTransport(**config):
+    config.update(PROTOCOL = "UDP")
+    return tr.createTransport("eth", config = config)
+
+
+def test_event_handlers():
+    transport = makeTransport()
+    events = []
+    overloads = []
+    transport.addEventHandler(lambda code, data: events.append((code, data)))
+    transport.addEventHandler(lambda code, data: overloads.append(code), types.Event.EV_DAQ_OVERLOAD)
+    transport.processResponse(b"\xfd\x06", 2, 1)
+    transport.processResponse(b"\xfd\x07\x01", 3, 2)
+    transport.processResponse(b"\xfd\x42", 2, 3)
+    assert events == [
+        (types.Event.EV_DAQ_OVERLOAD, b""), (types.Event.EV_SESSION_TERMINATED, b"\x01"), (0x42, b"")
+    ]
+    assert overloads == [types.Event.EV_DAQ_OVERLOAD]
+    transport.close()
+
+
+def test_service_handler_and_failing_handler():
+    transport = makeTransport()
+    texts = []
+
+    def failing(code, data):
+        raise RuntimeError("boom")
+
+    transport.addServiceHandler(failing)
+    transport.addServiceHandler(lambda code, data: texts.append(data.decode()), types.ServiceRequest.SERV_TEXT)
+    transport.processResponse(b"\xfc\x01hello", 7, 1)
+    transport.processResponse(b"\xfc\x00", 2, 2)
+    assert texts == ["hello"]
+    transport.removeServiceHandler(failing)
+    assert len(transport.servQueue.handlers) == 1
+    transport.close()
+
+
+def test_event_queues_are_bounded():
+    transport = makeTransport(EVENT_QUEUE_SIZE = 4)
+    for idx in range(10):
+        transport.processResponse(bytes([0xfd, idx]), 2, idx)
+        transport.processResponse(bytes([0xfc, 0x01, idx]), 3, idx)
+    assert [ev[1] for ev in transport.evQueue] == [6, 7, 8, 9]
+    assert len(transport.servQueue) == 4
+    transport.close()
+
+
+def test_daq_statistics():
+    transport = makeTransport(DAQ_QUEUE_SIZE = 4)
+    for counter in range(10):
+        if counter != 5:
+            transport.processResponse(bytes([counter % 2, 0]), 2, counter)
+    transport.processResponse(b"\xfd\x06", 2, 10)
+    snapshot = transport.daqStatistics.snapshot()
+    assert len(transport.daqQueue) == 4
+    assert snapshot.daqLists == {0: (5, 0, 0, 3), 1: (4, 0, 0, 2)}
+    assert snapshot.transportGaps == 1
+    assert snapshot.overloadEvents == 1
+    transport.close()
+
+def test_sxi_frames_with_checksum_and_resync():
+    from pyxcp.transport.sxi import SxI
+
+    tr = SxI(config = {"HEADER_FORMAT": "HEADER_LEN_CTR_BYTE", "CHECKSUM": "CHECKSUM_BYTE",
+        "CREATE_DAQ_TIMESTAMPS": True})
+    assert tr.COUNTER_MASK == 0xff
+    frame = tr.HEADER.pack(2, 1) + b'\xff\x01'
+    frame += tr.tail(frame)
+    assert frame == b'\x02\x01\xff\x01\x03'
+    daq = tr.HEADER.pack(3, 2) + b'\x00\x02\x03'
+    daq += tr.tail(daq)
+    corrupted = bytearray(daq)
+    corrupted[-1] ^= 0x01
+    buffer = bytearray(b'\x00\x00' + bytes(corrupted) + frame + daq + daq[: 3])
+    consumed = tr.framesReceived(buffer, 1000)
+    assert consumed == len(buffer) - 3
+    assert list(tr.resQueue) == [b'\xff\x01']
+    assert list(tr.daqQueue) == [(b'\x00\x02\x03', 2, 3, 1000)]
+    assert tr.framingErrors >= 2
+
+def test_sxi_checksum_word_fills_odd_frames():
+    from pyxcp.transport.sxi import SxI
+
+    tr = SxI(config = {"HEADER_FORMAT": "HEADER_LEN_FILL_WORD", "CHECKSUM": "CHECKSUM_WORD"})
+    assert tr.COUNTER_MASK is None
+    frame = tr.HEADER.pack(1, 0) + b'\xff'
+    assert tr.tail(frame) == b'\x00\x00\x01'    # 0x0001 + 0x0000 + 0x00ff
+    assert tr.tailSize(1) == 3
+    assert tr.framesReceived(bytearray(frame + tr.tail(frame))) == 8
+    assert list(tr.resQueue) == [b'\xff']
+    with pytest.raises(ValueError):
+        SxI(config = {"HEADER_FORMAT": "HEADER_LEN_DWORD"})
+
+def test_sxi_frame_length_bounded_by_max_cto():
+    from types import SimpleNamespace
+    from pyxcp.transport.sxi import SxI
+
+    tr = SxI()
+    frame = tr.HEADER.pack(2, 7) + b'\x00\x01'
+    buffer = bytearray(b'\x00\x01\xff\xff' + frame)    # Corrupted length (256).
+    assert tr.framesReceived(buffer) == 0
+    tr.parent = SimpleNamespace(slaveProperties = {"maxCto": 8, "maxDto": 8})
+    assert tr.frameLimit() == 8
+    assert tr.framesReceived(buffer) == len(buffer)
+    assert [element[1] for element in tr.daqQueue] == [7]
+
+
+def test_sxi_without_checksum_bounds_length_by_packet_type():
+    from types import SimpleNamespace
+    from pyxcp.transport.sxi import SxI
+
+    tr = SxI()
+    tr.parent = SimpleNamespace(slaveProperties = {"maxCto": 8, "maxDto": 64})
+    assert tr.packetLimits() == (8, 64)
+    corrupted = tr.HEADER.pack(40, 0) + b'\xff\x00'   # Response, length above MAX_CTO.
+    frames = b''.join(tr.HEADER.pack(2, idx) + bytes([idx, 0]) for idx in range(1, 21))
+    buffer = bytearray(corrupted + frames)
+    assert tr.framesReceived(buffer) == len(buffer)
+    assert [element[1] for element in tr.daqQueue] == list(range(1, 21))
+    assert not tr.resQueue
+    assert tr.framingErrors >= 1
+    assert tr.resync(bytearray(corrupted + frames)) == len(corrupted)
+
+
+class FakeSerial:
+    """Hands out `chunks` one per :meth:`read`, blocks (shortly) if there are none left.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.timeout = None
+        self.reads = 0
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size = 1):
+        import time
+
+        self.reads += 1
+        if self.chunks:
+            return self.chunks.pop(0)
+        time.sleep(self.timeout)
+        return b''
+
+    def isOpen(self):
+        return False
+
+def test_sxi_listener_reads_in_bulk():
+    import time
+    from pyxcp.transport.sxi import SxI
+
+    tr = SxI()
+    tr.READ_TIMEOUT = 0.02
+    packets = b''.join(tr.HEADER.pack(2, idx) + bytes([idx, 0]) for idx in range(100))
+    tr.commPort = FakeSerial([packets[: 150], packets[150: ], b'\x05\x00\x00'])
+    tr.startListener()
+    try:
+        start = time.perf_counter()
+        while tr.framingErrors == 0 and time.perf_counter() - start < 2.0:
+            time.sleep(0.01)
+        assert [element[1] for element in tr.daqQueue] == list(range(100))
+        assert tr.framingErrors >= 1    # Truncated trailing frame.
+        assert tr.commPort.reads < 20
+    finally:
+        tr.finishListener()
+        tr.listener.join()
+
+def test_sxi_idle_resync_keeps_partial_frame():
+    import time
+    from types import SimpleNamespace
+    from pyxcp.transport.sxi import SxI
+
+    tr = SxI()
+    tr.READ_TIMEOUT = 0.02
+    tr.parent = SimpleNamespace(slaveProperties = {"maxCto": 8, "maxDto": 8})
+    frames = [tr.HEADER.pack(2, idx) + bytes([idx, 0]) for idx in range(3)]
+    stale = tr.HEADER.pack(8, 0)    # Plausible, but the frame never completes.
+    tr.commPort = FakeSerial([stale + frames[0] + frames[1][: 1], b'', frames[1][1: ] + frames[2]])
+    assert tr.resync(bytearray(stale + frames[0] + frames[1][: 1])) == len(stale)
+    tr.startListener()
+    try:
+        start = time.perf_counter()
+        while len(tr.daqQueue) < 3 and time.perf_counter() - start < 2.0:
+            time.sleep(0.01)
+        assert [element[1] for element in tr.daqQueue] == [0, 1, 2]
+        assert tr.framingErrors == 1
+    finally:
+        tr.finishListener()
+        tr.listener.join()
@@ -28,3 +28,4 @@ import sys
 from .eth import Eth
 from .sxi import SxI
 from .can import Can
+from .canbus import CanBus
@@ -26,13 +26,15 @@ __copyright__ = """
 import abc
 from collections import deque
 import threading
-from time import time, sleep, perf_counter
+from time import time, sleep, perf_counter_ns
 
 from ..logger import Logger
 from ..utils import flatten, hexDump
 
 import pyxcp.types as types
 from pyxcp.config import Configuration
+from pyxcp.daq.stats import DaqStatistics
+from pyxcp.transport.process import ListenerProcess
 
 from ..timing import Timing
 
@@ -54,6 +56,43 @@ def get(q, timeout):
     return item
 
 
+class EventQueue(deque):
+    """Bounded queue of EV or SERV packets, which calls handlers on arrival.
+
+    The oldest packets are discarded once `maxlen` is reached.
+
+    Parameters
+    ----------
+    maxlen: int
+    codes: :class:`pyxcp.types.Event` or :class:`pyxcp.types.ServiceRequest`
+    logger: :class:`pyxcp.logger.Logger`
+    """
+
+    def __init__(self, maxlen, codes, logger):
+        super(EventQueue, self).__init__(maxlen=maxlen)
+        self.codes = codes
+        self.logger = logger
+        self.handlers = []  # (code or None, handler)
+
+    def addHandler(self, handler, code=None):
+        self.handlers.append((code, handler))
+
+    def removeHandler(self, handler):
+        self.handlers = [(c, h) for c, h in self.handlers if h != handler]
+
+    def append(self, packet):
+        super(EventQueue, self).append(packet)
+        if not self.handlers:
+            return
+        code, data = types.decodeEventPacket(packet, self.codes)
+        for hcode, handler in self.handlers:
+            if hcode is None or hcode == code:
+                try:
+                    handler(code, data)
+                except Exception as e:
+                    self.logger.error("Handler {!r} for {!r} failed: {}".format(handler, code, e))
+
+
 class BaseTransport(metaclass=abc.ABCMeta):
     """Base class for transport-layers (Can, Eth, Sxi).
 
@@ -64,14 +103,34 @@ class BaseTransport(metaclass=abc.ABCMeta):
     loglevel: ["INFO", "WARN", "DEBUG", "ERROR", "CRITICAL"]
         Controls the verbosity of log messages.
 
+    Attributes
+    ----------
+    daqQueue: :class:`collections.deque`
+        DAQ elements ``(packet, counter, length, timestamp)``.
+    first_daq_timestamp: int or None
+        Timestamp of the first DAQ packet.
+
+    Note
+    ----
+    DAQ timestamps are integer nano-seconds in the time-base of :func:`time.perf_counter_ns`
+    (formerly float seconds of :func:`time.perf_counter`), 0 if `CREATE_DAQ_TIMESTAMPS` is off.
     """
 
     PARAMETER_MAP = {
         #                         Type    Req'd   Default
         "CREATE_DAQ_TIMESTAMPS": (bool,   False,  False),
         "LOGLEVEL":              (str,    False,  "WARN"),
+        "LISTENER_PROCESS":      (bool,   False,  False),
+            # Receive in a child process (Python >= 3.8), see :mod:`pyxcp.transport.process`.
+        "LISTENER_RING_SIZE":    (int,    False,  16 * 1024 * 1024),
+        "EVENT_QUEUE_SIZE":      (int,    False,  256),
+        "DAQ_QUEUE_SIZE":        (int,    False,  0),
+            # 0 means unbounded, otherwise the oldest packets are discarded (and counted).
     }
 
+    # Mask of the transport-layer counter, None if the transport-layer has none.
+    COUNTER_MASK = None
+
     def __init__(self, config=None):
         self.parent = None
         self.config = Configuration(BaseTransport.PARAMETER_MAP or {}, config or {})
@@ -84,16 +143,27 @@ class BaseTransport(metaclass=abc.ABCMeta):
         create_daq_timestamps = self.config.get("CREATE_DAQ_TIMESTAMPS")
         self.create_daq_timestamps = False if create_daq_timestamps is None else create_daq_timestamps
         self.timing = Timing()
+        # Serializes command/response round trips, e.g. when background services
+        # like :class:`pyxcp.clocksync.ClockSync` talk to the slave concurrently.
+        self.requestLock = threading.RLock()
         self.resQueue = deque()
-        self.daqQueue = deque()
-        self.evQueue = deque()
-        self.servQueue = deque()
+        daqQueueSize = self.config.get("DAQ_QUEUE_SIZE")
+        self.daqQueue = deque(maxlen=daqQueueSize or None)
+        self.daqStatistics = DaqStatistics()
+        eventQueueSize = self.config.get("EVENT_QUEUE_SIZE")
+        self.evQueue = EventQueue(eventQueueSize, types.Event, self.logger)
+        self.servQueue = EventQueue(eventQueueSize, types.ServiceRequest, self.logger)
+        self.evQueue.addHandler(self.daqStatistics.overloadEvent, types.Event.EV_DAQ_OVERLOAD)
         self.listener = threading.Thread(
             target=self.listen,
             args=(),
             kwargs={},
         )
 
+        self.listenerProcess = None
+        if self.config.get("LISTENER_PROCESS"):
+            self.listenerProcess = ListenerProcess(self, self.config.get("LISTENER_RING_SIZE"))
+
         self.first_daq_timestamp = None
 
     def __del__(self):
@@ -111,30 +181,71 @@ class BaseTransport(metaclass=abc.ABCMeta):
         self.finishListener()
         if self.listener.is_alive():
             self.listener.join()
+        if self.listenerProcess is not None:
+            self.listenerProcess.stop()
         self.closeConnection()
 
     @abc.abstractmethod
     def connect(self):
         pass
 
+    def checkReceivePathMutable(self, what: str):
+        """Raise :class:`RuntimeError`, if the receive path runs in a listener process.
+
+        The child process works on a copy of the transport taken at fork time,
+        so changes of routes, filters and the like wouldn't reach it.
+        """
+        listenerProcess = getattr(self, "listenerProcess", None)
+        if listenerProcess is not None and listenerProcess.running:
+            raise RuntimeError("{} isn't possible while the listener process is running "
+                "(LISTENER_PROCESS) -- configure it before connecting.".format(what))
+
     def startListener(self):
-        self.listener.start()
+        if self.listenerProcess is not None:
+            self.listenerProcess.start()
+        else:
+            self.listener.start()
 
     def finishListener(self):
         if hasattr(self, "closeEvent"):
             self.closeEvent.set()
 
+    def addEventHandler(self, handler, code=None):
+        """Call `handler(code, data)` as soon as an EV packet arrives.
+
+        Handlers run on the thread receiving packets and should return quickly.
+
+        Parameters
+        ----------
+        handler: callable
+        code: :class:`pyxcp.types.Event` or None
+            None means any event.
+        """
+        self.evQueue.addHandler(handler, code)
+
+    def removeEventHandler(self, handler):
+        self.evQueue.removeHandler(handler)
+
+    def addServiceHandler(self, handler, code=None):
+        """Like :meth:`addEventHandler`, but for SERV packets (:class:`pyxcp.types.ServiceRequest`).
+        """
+        self.servQueue.addHandler(handler, code)
+
+    def removeServiceHandler(self, handler):
+        self.servQueue.removeHandler(handler)
+
     def request(self, cmd, *data):
-        frame = self._prepare_request(cmd, *data)
-        self.timing.start()
-        self.send(frame)
+        with self.requestLock:
+            frame = self._prepare_request(cmd, *data)
+            self.timing.start()
+            self.send(frame)
 
-        try:
-            xcpPDU = get(self.resQueue, timeout=2.0)
-        except Empty:
-            raise types.XcpTimeoutError("Response timed out.") from None
+            try:
+                xcpPDU = get(self.resQueue, timeout=2.0)
+            except Empty:
+                raise types.XcpTimeoutError("Response timed out.") from None
 
-        self.timing.stop()
+            self.timing.stop()
 
         pid = types.Response.parse(xcpPDU).type
         if pid == 'ERR' and cmd.name != 'SYNCH':
@@ -163,6 +274,21 @@ class BaseTransport(metaclass=abc.ABCMeta):
         frame = self._prepare_request(cmd, *data)
         self.send(frame)
 
+    def block_request_many(self, requests):
+        """Like :meth:`block_request`, but sends several requests at once (see :meth:`sendMany`).
+
+        Parameters
+        ----------
+        requests: sequence of tuples (cmd, *data)
+        """
+        if self.resQueue:
+            xcpPDU = self.resQueue.popleft()
+            pid = types.Response.parse(xcpPDU).type
+            if pid == 'ERR':
+                err = types.XcpError.parse(xcpPDU[1:])
+                raise types.XcpResponseError(err)
+        self.sendMany([self._prepare_request(cmd, *data) for cmd, *data in requests])
+
     def _prepare_request(self, cmd, *data):
         """
         Prepares a request to be sent
@@ -213,6 +339,12 @@ class BaseTransport(metaclass=abc.ABCMeta):
     def send(self, frame):
         pass
 
+    def sendMany(self, frames):
+        """Send several frames, transport-layers may do better than calling :meth:`send` repeatedly.
+        """
+        for frame in frames:
+            self.send(frame)
+
     @abc.abstractmethod
     def closeConnection(self):
         """Does the actual connection shutdown.
@@ -224,8 +356,25 @@ class BaseTransport(metaclass=abc.ABCMeta):
     def listen(self):
         pass
 
-    def processResponse(self, response, length, counter):
+    def processResponse(self, response, length, counter, recvTimestamp=None):
+        """Classify and queue an incoming XCP packet.
+
+        Parameters
+        ----------
+        response: bytes
+            XCP packet (without transport-layer header).
+        length: int
+            Length as stated by the transport-layer header.
+        counter: int
+            Transport-layer counter.
+        recvTimestamp: int or None
+            Reception time in nano-seconds (:func:`time.perf_counter_ns`
+            time-base), if the transport-layer knows better than us,
+            e.g. hardware or kernel timestamps.
+        """
         self.counterReceived = counter
+        if self.COUNTER_MASK is not None and self.daqStatistics is not None:
+            self.daqStatistics.counterReceived(counter, self.COUNTER_MASK)
         if hasattr(self, 'use_tcp'):
             use_tcp = self.use_tcp
         else:
@@ -249,20 +398,42 @@ class BaseTransport(metaclass=abc.ABCMeta):
                 # self.resQueue.put(response)
                 self.resQueue.append(response)
             elif pid == 0xfd:
-                # self.evQueue.put(response)
                 self.evQueue.append(response)
             elif pid == 0xfc:
-                # self.servQueue.put(response)
                 self.servQueue.append(response)
         else:
-            if self.first_daq_timestamp is None:
-                self.first_daq_timestamp = perf_counter()
-            if self.create_daq_timestamps:
-                timestamp = perf_counter()
-            else:
-                timestamp = 0.0
-            element = ((response, counter, length, timestamp,))
-            self.daqQueue.append(element)
+            self.processDaq(response, counter, length, recvTimestamp)
+
+    def processDaq(self, response, counter, length, recvTimestamp=None, queue=None):
+        """Timestamp and queue a DAQ packet, see :meth:`processResponse`.
+
+        Parameters
+        ----------
+        recvTimestamp: int or None
+            Receive time in nano-seconds (:func:`time.perf_counter_ns` time-base), if the driver provides one.
+        queue: :class:`collections.deque` or None
+            Defaults to :attr:`daqQueue`.
+        """
+        if self.create_daq_timestamps:
+            timestamp = perf_counter_ns() if recvTimestamp is None else recvTimestamp
+        else:
+            timestamp = 0
+        if self.first_daq_timestamp is None:
+            self.first_daq_timestamp = timestamp if timestamp else perf_counter_ns()
+        element = ((response, counter, length, timestamp,))
+        self.appendDaq(element, queue)
+
+    def appendDaq(self, element, queue=None):
+        """Account for and queue a DAQ element ``(packet, counter, length, timestamp)``.
+        """
+        if queue is None:
+            queue = self.daqQueue
+        stats = self.daqStatistics
+        if stats is not None:
+            stats.daqReceived(element[0])
+            if queue.maxlen is not None and len(queue) == queue.maxlen:
+                stats.daqDropped(queue[0][0])
+        queue.append(element)
 
 
 def createTransport(name, *args, **kws):
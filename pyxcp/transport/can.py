@@ -28,10 +28,13 @@ __copyright__ = """
 
 import abc
 import functools
+import inspect
 import operator
+from time import perf_counter_ns, sleep
 
 from typing import Type
 
+from pyxcp.clocksync import TimestampConverter   # Also part of this module's API.
 from pyxcp.transport.base import BaseTransport
 from pyxcp.config import Configuration
 
@@ -218,10 +221,17 @@ class CanInterfaceBase(metaclass=abc.ABCMeta):
             Refers to owner.
         receive_callback: callable
             Receive callback function to register with the following argument: payload: bytes
+
+        Note
+        ----
+        Drivers receiving frames on their own (e.g. in a notification thread of the
+        vendor library) may push them through `receive_callback` or, to take care of
+        driver timestamps, :meth:`Can.frameReceived`; `CAN_USE_DEFAULT_LISTENER`
+        should be False in this case.
         """
 
     @abc.abstractmethod
-    def transmit(self, payload: bytes):
+    def transmit(self, payload: bytes, fd: bool = False, brs: bool = False):
         """
         Must transmit the given payload on the master can id.
 
@@ -229,6 +239,11 @@ class CanInterfaceBase(metaclass=abc.ABCMeta):
         ----------
         payload: int
             payload to transmit
+        fd: bool
+            Send a CAN-FD frame (only passed if the transport runs in CAN-FD mode,
+            see :attr:`Can.fd`).
+        brs: bool
+            Switch to the data bitrate (CAN-FD only).
         """
 
     @abc.abstractmethod
@@ -240,14 +255,109 @@ class CanInterfaceBase(metaclass=abc.ABCMeta):
         """Open connection to can interface"""
 
     @abc.abstractmethod
-    def read(self):
-        """Read incoming data"""
+    def read(self, timeout: float = 0.0):
+        """Read incoming data.
+
+        Parameters
+        ----------
+        timeout: float
+            Block up to `timeout` seconds, if no frame is available.
+
+        Returns
+        -------
+        :class:`Frame` or None
+            None on timeout.
+
+        Note
+        ----
+        Drivers without the `timeout` parameter are polled by the default listener.
+        """
 
     @abc.abstractmethod
     def getTimestampResolution(self):
         """Get timestamp resolution in nano seconds.
+
+        Returns
+        -------
+        int or None
+            None, if the driver doesn't timestamp frames, in this case
+            host timestamps are used.
         """
 
+    def getTimestampClock(self):
+        """The clock driver timestamps are taken from, if the host can read it.
+
+        Returns
+        -------
+        callable or None
+            Returns the current driver time in nano seconds, e.g. :func:`time.time_ns`
+            for kernel timestamps, see :class:`~pyxcp.clocksync.TimestampConverter`.
+        """
+        return None
+
+    def read_many(self, max_frames: int, timeout: float = 0.0) -> list:
+        """Read up to `max_frames` frames at once.
+
+        Batch capable drivers should override this method, the default implementation
+        just calls :meth:`read`.
+
+        Parameters
+        ----------
+        max_frames: int
+        timeout: float
+            Block up to `timeout` seconds, if no frame is available.
+
+        Returns
+        -------
+        list of tuples (raw_id, data, timestamp)
+            `raw_id` is XCP formatted (see :class:`Identifier`), `timestamp` in driver ticks
+            (see :meth:`getTimestampResolution`); empty on timeout.
+        """
+        frame = self.read(timeout)
+        return [(frame.id.raw_id, frame.data, frame.timestamp)] if frame else []
+
+    def setFilters(self, ids):
+        """Program acceptance filters, so that (at least) frames with identifiers `ids` pass.
+
+        Called by :class:`Can` whenever the set of receive identifiers changes (also
+        before :meth:`connect`); drivers without filter support may accept anything.
+
+        Parameters
+        ----------
+        ids: list of int or None
+            XCP formatted identifiers, see :func:`calculateFilter`;
+            None opens the filters completely (see :meth:`Can.broadcast`).
+        """
+
+    def transmit_many(self, frames, fd: bool = False, brs: bool = False, identifier=None):
+        """Transmit several payloads on the master can id, see :meth:`transmit`.
+
+        Parameters
+        ----------
+        frames: sequence of bytes
+        identifier: :class:`Identifier` or None
+            Use :meth:`transmitTo` instead.
+        """
+        if identifier is not None:
+            for payload in frames:
+                self.transmitTo(identifier, payload, fd, brs)
+        elif fd:
+            for payload in frames:
+                self.transmit(payload, fd=fd, brs=brs)
+        else:
+            for payload in frames:
+                self.transmit(payload)
+
+    def transmitTo(self, identifier, payload: bytes, fd: bool = False, brs: bool = False):
+        """Like :meth:`transmit`, but on an arbitrary identifier; required by :class:`pyxcp.transport.canbus.CanBus`
+        and :meth:`Can.broadcast`.
+
+        Parameters
+        ----------
+        identifier: :class:`Identifier`
+        """
+        raise NotImplementedError("{} can't transmit on arbitrary identifiers.".format(self.__class__.__name__))
+
     def loadConfig(self, config):
         """Load configuration data.
         """
@@ -279,7 +389,15 @@ class Can(BaseTransport):
         "CAN_ID_MASTER":            (int,    True,   None),
         "CAN_ID_SLAVE":             (int,    True,   None),
         "CAN_ID_BROADCAST":         (int,    False,  None),
+        "CAN_ID_DAQ":               (dict,   False,  None),
+            # DAQ list number -> identifier, for slaves with fixed DAQ identifiers
+            # (otherwise see :meth:`pyxcp.master.Master.setDaqId`).
+        "CAN_FD":                   (bool,   False,  False),
+            # CAN-FD mode: frames of up to 64 bytes, i.e. MAX_CTO / MAX_DTO up to 64.
+        "CAN_FD_BRS":               (bool,   False,  True),
+            # Bitrate switch, data phase runs at FD_BAUDRATE.
         "BAUDRATE":                 (float,  False,  250000.0),
+        "FD_BAUDRATE":              (float,  False,  2000000.0),
         "BTL_CYCLES":               (int,    False,  16),   # a.k.a TQs
         "SAMPLE_RATE":              (int,    False,  1),
         "SAMPLE_POINT":             (float,  False,  87.5),
@@ -288,7 +406,11 @@ class Can(BaseTransport):
         "TSEG2":                    (int,    False,  2),
     }
 
-    MAX_DATAGRAM_SIZE = 7
+    MAX_DATAGRAM_SIZE = 8
+    READ_TIMEOUT = 0.1  # Seconds the default listener blocks in :meth:`CanInterfaceBase.read`.
+    POLL_INTERVAL = 0.001
+    READ_BATCH_SIZE = 256   # Frames per :meth:`CanInterfaceBase.read_many` call.
+    MAX_DATAGRAM_SIZE_FD = 64
     HEADER = EmptyHeader()
     HEADER_SIZE = 0
 
@@ -309,35 +431,217 @@ class Can(BaseTransport):
         self.canInterface.loadConfig(config)
         self.useDefaultListener = self.config.get("CAN_USE_DEFAULT_LISTENER")
         self.max_dlc_required = self.config.get("MAX_DLC_REQUIRED")
+        self.fd = self.config.get("CAN_FD")
+        self.brs = self.fd and self.config.get("CAN_FD_BRS")
+        if self.fd:
+            self.MAX_DATAGRAM_SIZE = self.MAX_DATAGRAM_SIZE_FD
         self.can_id_master = Identifier(self.config.get("CAN_ID_MASTER"))
         self.can_id_slave = Identifier(self.config.get("CAN_ID_SLAVE"))
+        broadcastId = self.config.get("CAN_ID_BROADCAST")
+        self.can_id_broadcast = Identifier(broadcastId) if broadcastId is not None else None
+        self.discovery = None   # Collects all incoming frames while broadcasting.
+        self.status = 0
+        self.timestampConverter = None
+        self.daqIds = {}     # DAQ list number -> XCP formatted identifier.
+        self.daqRoutes = {}  # XCP formatted identifier -> queue.
+        for daqList, identifier in (self.config.get("CAN_ID_DAQ") or {}).items():
+            self.setDaqId(int(daqList), identifier)
         self.canInterface.init(self, self.dataReceived)
 
-    def dataReceived(self, payload: bytes):
-        self.processResponse(payload, len(payload), counter=0)
+    @property
+    def receiveIds(self) -> list:
+        """XCP formatted identifiers the slave sends on.
+        """
+        return [self.can_id_master.raw_id] + sorted(set(self.daqIds.values()))
+
+    def setDaqId(self, daqList: int, identifier: int, queue=None):
+        """Receive packets of `daqList` on `identifier`.
+
+        Frames with `identifier` go straight to `queue` (defaults to :attr:`daqQueue`),
+        i.e. without classification by PID.
+        """
+        self.checkReceivePathMutable("Changing DAQ identifiers")
+        identifier = Identifier(identifier).raw_id
+        if identifier == self.can_id_master.raw_id:
+            raise ValueError("DAQ identifier must differ from CAN_ID_MASTER.")
+        others = {i for d, i in self.daqIds.items() if d != daqList}
+        if identifier in others and self.daqRoutes[identifier] is not queue:
+            raise ValueError("Identifier 0x{:08x} is already routed to another queue.".format(identifier))
+        previous = self.daqIds.get(daqList)
+        if previous is not None and previous not in others:
+            del self.daqRoutes[previous]
+        self.daqIds[daqList] = identifier
+        self.daqRoutes[identifier] = queue  # None means :attr:`daqQueue`.
+        if hasattr(self, "canInterface"):
+            self.canInterface.setFilters(self.receiveIds)
+
+    def dataReceived(self, payload: bytes, timestamp: int = None):
+        """
+        Parameters
+        ----------
+        payload: bytes
+        timestamp: int or None
+            Reception time in nano seconds (host time-base).
+        """
+        self.processResponse(payload, len(payload), counter=0, recvTimestamp=timestamp)
+
+    def packetReceived(self, rawId: int, data: bytes, timestamp: int = None):
+        """Like :meth:`dataReceived`, considering the identifier (see :meth:`setDaqId`).
+        """
+        if self.discovery is not None:
+            self.discovery.append((rawId, data))
+            return
+        queue = self.daqRoutes.get(rawId, False) if self.daqRoutes else False
+        if queue is False:
+            self.processResponse(data, len(data), 0, timestamp)
+        else:
+            self.processDaq(data, 0, len(data), timestamp, queue)
+
+    def frameReceived(self, frame: Frame):
+        """Like :meth:`dataReceived`, but takes care of driver timestamps.
+        """
+        if self.timestampConverter and self.create_daq_timestamps:
+            timestamp = self.timestampConverter(frame.timestamp, perf_counter_ns())
+        else:
+            timestamp = None
+        if self.discovery is not None:
+            self.discovery.append((frame.id.raw_id, frame.data))
+            return
+        queue = self.daqRoutes.get(frame.id.raw_id, False) if self.daqRoutes else False
+        if queue is False:
+            self.dataReceived(frame.data, timestamp)
+        else:
+            self.processDaq(frame.data, 0, len(frame.data), timestamp, queue)
+
+    def framesReceived(self, frames):
+        """Like :meth:`frameReceived`, but for a batch of tuples as returned by
+        :meth:`CanInterfaceBase.read_many`.
+        """
+        if self.discovery is not None:
+            self.discovery.extend((rawId, data) for rawId, data, _ in frames)
+            return
+        processResponse = self.processResponse
+        processDaq = self.processDaq
+        routes = self.daqRoutes
+        if self.timestampConverter and self.create_daq_timestamps:
+            convert = self.timestampConverter
+            hostNs = perf_counter_ns()
+            # The latest frame has the least latency, it has to determine the offset for the whole batch.
+            convert(frames[-1][2], hostNs)
+        else:
+            convert = None
+        for rawId, data, timestamp in frames:
+            timestamp = convert(timestamp, hostNs) if convert else None
+            queue = routes.get(rawId, False) if routes else False
+            if queue is False:
+                processResponse(data, len(data), 0, timestamp)
+            else:
+                processDaq(data, 0, len(data), timestamp, queue)
 
     def listen(self):
-        while True:
-            if self.closeEvent.isSet():
-                return
-            frame = self.canInterface.read()
-            if frame:
-                self.dataReceived(frame.data)
+        canInterface = self.canInterface
+        read = canInterface.read
+        frameReceived = self.frameReceived
+        closed = self.closeEvent.is_set
+        if type(canInterface).read_many is not CanInterfaceBase.read_many:
+            read_many = canInterface.read_many
+            framesReceived = self.framesReceived
+            timeout = self.READ_TIMEOUT
+            batchSize = self.READ_BATCH_SIZE
+            while not closed():
+                frames = read_many(batchSize, timeout)
+                if frames:
+                    framesReceived(frames)
+        elif "timeout" in inspect.signature(read).parameters:
+            timeout = self.READ_TIMEOUT
+            while not closed():
+                frame = read(timeout)
+                if frame:
+                    frameReceived(frame)
+        else:
+            # Driver can't block, at least don't burn a core.
+            wait = self.closeEvent.wait
+            interval = self.POLL_INTERVAL
+            while not closed():
+                frame = read()
+                if frame:
+                    frameReceived(frame)
+                else:
+                    wait(interval)
 
     def connect(self):
-        if self.useDefaultListener:
-            self.startListener()
-        self.canInterface.connect()
-        self.status = 1  # connected
+        if self.status == 0:
+            resolution = self.canInterface.getTimestampResolution()
+            self.timestampConverter = TimestampConverter(resolution, self.canInterface.getTimestampClock()) \
+                if resolution else None
+            self.canInterface.connect()
+            if self.useDefaultListener:
+                self.startListener()
+            self.status = 1  # connected
+
+    def broadcast(self, payload: bytes, window: float = 0.05, identifier: int = None) -> list:
+        """Transmit `payload` on `CAN_ID_BROADCAST` and collect every frame received within `window` seconds.
+
+        Acceptance filters are opened for the duration of the window, regular
+        processing of incoming frames is suspended meanwhile.
+        Requires a driver implementing :meth:`CanInterfaceBase.transmitTo`.
 
-    def send(self, frame):
+        Parameters
+        ----------
+        payload: bytes
+        window: float
+        identifier: int or None
+            Transmit on this (XCP formatted) identifier instead.
+
+        Returns
+        -------
+        list of tuples (raw_id, data)
+        """
+        self.checkReceivePathMutable("Broadcasting")
+        if identifier is not None:
+            identifier = Identifier(identifier)
+        elif self.can_id_broadcast is not None:
+            identifier = self.can_id_broadcast
+        else:
+            raise ValueError("CAN_ID_BROADCAST is not configured.")
+        responses = []
+        self.discovery = responses
+        try:
+            self.canInterface.setFilters(None)
+            self.canInterface.transmitTo(identifier, self._pad(payload), self.fd, self.brs)
+            sleep(window)
+        finally:
+            self.discovery = None
+            self.canInterface.setFilters(self.receiveIds)
+        return responses
+
+    def _pad(self, frame):
+        if self.fd:
+            # CAN-FD knows only some lengths above 8 bytes, so FILL bytes may be required anyway.
+            length = self.MAX_DATAGRAM_SIZE if self.max_dlc_required else setDLC(len(frame))
+            if len(frame) < length:
+                frame += b'\x00' * (length - len(frame))
         # XCP on CAN trailer: if required, FILL bytes must be appended
-        if self.max_dlc_required:
+        elif self.max_dlc_required:
             # append fill bytes up to MAX DLC (=8)
             if len(frame) < 8:
                 frame += b'\x00' * (8 - len(frame))
-        # send the request
-        self.canInterface.transmit(payload=frame)
+        return frame
+
+    def send(self, frame):
+        frame = self._pad(frame)
+        if self.fd:
+            self.canInterface.transmit(payload=frame, fd=True, brs=self.brs)
+        else:
+            # send the request
+            self.canInterface.transmit(payload=frame)
+
+    def sendMany(self, frames):
+        frames = [self._pad(frame) for frame in frames]
+        if self.fd:
+            self.canInterface.transmit_many(frames, fd=True, brs=self.brs)
+        else:
+            self.canInterface.transmit_many(frames)
 
     def closeConnection(self):
         if hasattr(self, "canInterface"):
@@ -364,6 +668,56 @@ def setDLC(length: int):
         raise ValueError("DLC could be at most 64.")
 
 
+def frameBits(length: int, extended: bool = False, fd: bool = False, stuffing: bool = True) -> tuple:
+    """Length of a data frame on the wire, including inter-frame space.
+
+    Stuff bits are counted worst-case, CAN-FD frames are approximated
+    according to ISO 11898-1:2015 (dynamic stuffing up to the stuff count,
+    fixed stuff bits in the CRC field).
+
+    Parameters
+    ----------
+    length: int
+        Data bytes, rounded up to a valid DLC (see :func:`setDLC`).
+    extended: bool
+        29 bit identifier.
+    fd: bool
+        FD frame format.
+    stuffing: bool
+        Include (worst-case) stuff bits.
+
+    Returns
+    -------
+    tuple (int, int)
+        Bits transmitted at the nominal bitrate and bits of the data phase, i.e. transmitted
+        at the data bitrate if the bitrate switch is used (always 0 for classic frames).
+    """
+    length = setDLC(length)
+    if not fd:
+        # SOF, arbitration, control, data and CRC are subject to stuffing.
+        stuffed = (54 if extended else 34) + 8 * length
+        stuffBits = (stuffed - 1) // 4 if stuffing else 0
+        return stuffed + stuffBits + 13, 0  # CRC delimiter, ACK, EOF, IFS.
+    arbitration = 36 if extended else 17   # SOF .. BRS
+    data = 5 + 8 * length                   # ESI, DLC, data
+    crc = 17 if length <= 16 else 21
+    if stuffing:
+        arbitration += (arbitration - 1) // 4
+        data += data // 4 + (4 + crc + 3) // 4
+    data += 4 + crc + 1                     # Stuff count, CRC, CRC delimiter.
+    return arbitration + 12, data           # ACK, EOF, IFS.
+
+
+def frameDuration(length: int, extended: bool = False, fd: bool = False, brs: bool = False,
+                  bitrate: float = 500000.0, fdBitrate: float = 2000000.0, stuffing: bool = True) -> float:
+    """Time in seconds a data frame occupies the bus, see :func:`frameBits`.
+    """
+    nominal, data = frameBits(length, extended, fd, stuffing)
+    if brs:
+        return nominal / bitrate + data / fdBitrate
+    return (nominal + data) / bitrate
+
+
 def calculateFilter(ids: list):
     """
     :param ids: An iterable (usually list or tuple) containing CAN identifiers.
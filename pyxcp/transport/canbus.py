@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Several XCP slaves on one CAN channel.
+
+A :class:`CanBus` owns a single driver channel (:class:`~pyxcp.transport.can.CanInterfaceBase`)
+and a single listener thread, which demultiplexes incoming frames by identifier
+into the :class:`~pyxcp.transport.can.Can` transports of the slaves (a dictionary lookup per frame).
+Slave transports use the pseudo driver ``CanBusPort`` and refer to the bus by name:
+
+.. code-block:: python
+
+    bus = CanBus({"CAN_DRIVER": "SocketCAN", "SC_CHANNEL": "can0"}, name = "powertrain")
+    engine = Master("can", config = {"CAN_DRIVER": "CanBusPort", "CAN_BUS": "powertrain",
+        "CAN_ID_MASTER": 0x101, "CAN_ID_SLAVE": 0x100})
+    gearbox = Master("can", config = {"CAN_DRIVER": "CanBusPort", "CAN_BUS": "powertrain",
+        "CAN_ID_MASTER": 0x201, "CAN_ID_SLAVE": 0x200})
+
+The channel is opened with the first connecting slave and closed with the last one.
+The driver needs to implement :meth:`~pyxcp.transport.can.CanInterfaceBase.transmitTo`
+and a blocking :meth:`~pyxcp.transport.can.CanInterfaceBase.read`.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import threading
+from time import perf_counter_ns
+
+from pyxcp.config import Configuration
+from pyxcp.logger import Logger
+from pyxcp.transport.can import Can, CanInterfaceBase, TimestampConverter, registered_drivers
+
+BUSES = {}  # name -> CanBus
+
+
+class CanBus:
+    """
+    Parameters
+    ----------
+    config: dict
+        Driver parameters (`CAN_DRIVER`, `BAUDRATE`, `CAN_FD`, ... see :class:`~pyxcp.transport.can.Can`).
+    name: str
+        Referred to by the `CAN_BUS` parameter of slave transports.
+    """
+
+    PARAMETER_MAP = {
+        #                           Type    Req'd   Default
+        "CAN_DRIVER":               (str,    True,   None),
+        "CAN_FD":                   (bool,   False,  False),
+        "BAUDRATE":                 (float,  False,  250000.0),
+        "FD_BAUDRATE":              (float,  False,  2000000.0),
+        "BTL_CYCLES":               (int,    False,  16),
+        "SAMPLE_RATE":              (int,    False,  1),
+        "SAMPLE_POINT":             (float,  False,  87.5),
+        "SJW":                      (int,    False,  2),
+        "TSEG1":                    (int,    False,  5),
+        "TSEG2":                    (int,    False,  2),
+        "LOGLEVEL":                 (str,    False,  "WARN"),
+    }
+
+    def __init__(self, config, name: str = "default"):
+        self.config = Configuration(self.PARAMETER_MAP, dict(config))
+        self.name = name
+        self.logger = Logger("transport.CanBus")
+        self.logger.setLevel(self.config.get("LOGLEVEL"))
+        self.fd = self.config.get("CAN_FD")
+        drivers = registered_drivers()
+        interfaceName = self.config.get("CAN_DRIVER")
+        if not interfaceName in drivers or interfaceName == CanBusPort.__name__:
+            raise ValueError("{} is an invalid driver name -- choose from {}".format(
+                interfaceName, [x for x in drivers.keys() if x != CanBusPort.__name__])
+            )
+        self.canInterface = drivers[interfaceName]()
+        self.canInterface.loadConfig(dict(config))
+        self.canInterface.init(self, None)
+        self.transports = []
+        self.routes = {}    # XCP formatted identifier -> Can.packetReceived
+        self.promiscuous = None     # Receives everything while broadcasting, see :meth:`Can.broadcast`.
+        self.unroutedCount = 0
+        self.timestampConverter = None
+        self.lock = threading.Lock()    # Serializes transmission.
+        self.closeEvent = threading.Event()
+        self.listener = None
+        BUSES[name] = self
+
+    @staticmethod
+    def get(name: str):
+        try:
+            return BUSES[name]
+        except KeyError:
+            raise ValueError("No CAN bus named '{}' -- choose from {}".format(name, list(BUSES))) from None
+
+    @property
+    def receiveIds(self) -> list:
+        return sorted(self.routes)
+
+    def attach(self, transport: Can):
+        """Start receiving for `transport`, opens the channel if required.
+        """
+        if transport.fd != self.fd:
+            raise ValueError("CAN_FD setting of the slave doesn't match the bus.")
+        with self.lock:
+            if transport not in self.transports:
+                self.transports.append(transport)
+            try:
+                self._updateRoutes()
+            except ValueError:
+                self.transports.remove(transport)
+                raise
+            if self.listener is None:
+                self._open()
+
+    def detach(self, transport: Can):
+        """Stop receiving for `transport`, closes the channel after the last one.
+        """
+        with self.lock:
+            if transport in self.transports:
+                self.transports.remove(transport)
+            self._updateRoutes()
+            listener = None
+            if not self.transports:
+                listener, self.listener = self.listener, None
+        if listener is not None:
+            self._close(listener)   # Unlocked, callbacks of the listener may still transmit.
+
+    def update(self):
+        """Receive identifiers of a transport changed.
+        """
+        with self.lock:
+            self._updateRoutes()
+
+    def _updateRoutes(self):
+        routes = {}
+        for transport in self.transports:
+            for rawId in transport.receiveIds:
+                if rawId in routes:
+                    raise ValueError("Identifier 0x{:08x} is used by more than one slave.".format(rawId))
+                routes[rawId] = transport.packetReceived
+        self.routes = routes    # Replaced, not modified -- the listener isn't locked.
+        self.promiscuous = next((t.packetReceived for t in self.transports if t.discovery is not None), None)
+        if self.promiscuous is not None:
+            self.canInterface.setFilters(None)
+        elif routes:
+            self.canInterface.setFilters(self.receiveIds)
+
+    def _open(self):
+        self.canInterface.connect()
+        resolution = self.canInterface.getTimestampResolution()
+        self.timestampConverter = TimestampConverter(resolution, self.canInterface.getTimestampClock()) \
+            if resolution else None
+        self.closeEvent.clear()
+        self.listener = threading.Thread(target=self.listen, name="CanBus-{}".format(self.name), daemon=True)
+        self.listener.start()
+
+    def _close(self, listener):
+        self.closeEvent.set()
+        listener.join()
+        self.canInterface.close()
+
+    def close(self):
+        with self.lock:
+            self.transports = []
+            self.routes = {}
+            self.promiscuous = None
+            listener, self.listener = self.listener, None
+        if listener is not None:
+            self._close(listener)
+        if BUSES.get(self.name) is self:
+            del BUSES[self.name]
+
+    def transmit(self, identifier, payload: bytes, fd: bool = False, brs: bool = False):
+        with self.lock:
+            self.canInterface.transmitTo(identifier, payload, fd, brs)
+
+    def transmit_many(self, identifier, frames, fd: bool = False, brs: bool = False):
+        with self.lock:
+            self.canInterface.transmit_many(frames, fd, brs, identifier=identifier)
+
+    def listen(self):
+        read_many = self.canInterface.read_many
+        closed = self.closeEvent.is_set
+        batchSize = Can.READ_BATCH_SIZE
+        timeout = Can.READ_TIMEOUT
+        while not closed():
+            frames = read_many(batchSize, timeout)
+            if frames:
+                self.framesReceived(frames)
+
+    def framesReceived(self, frames):
+        routes = self.routes
+        promiscuous = self.promiscuous
+        convert = self.timestampConverter
+        if convert:
+            hostNs = perf_counter_ns()
+            convert(frames[-1][2], hostNs)
+        for rawId, data, timestamp in frames:
+            receiver = promiscuous or routes.get(rawId)
+            if receiver is None:
+                self.unroutedCount += 1
+            else:
+                receiver(rawId, data, convert(timestamp, hostNs) if convert else None)
+
+
+class CanBusPort(CanInterfaceBase):
+    """Pseudo driver connecting a :class:`~pyxcp.transport.can.Can` transport to a :class:`CanBus`.
+    """
+
+    PARAMETER_MAP = {
+        #                        Type    Req'd   Default
+        "CAN_BUS":              (str,    False,  "default"),
+    }
+
+    def __init__(self):
+        self.bus = None
+        self.parent = None
+
+    def init(self, parent, receive_callback):
+        self.parent = parent
+        parent.useDefaultListener = False   # The bus listens for us.
+
+    def connect(self):
+        self.bus = CanBus.get(self.config.get("CAN_BUS"))
+        self.bus.attach(self.parent)
+
+    def close(self):
+        if self.bus is not None:
+            self.bus.detach(self.parent)
+            self.bus = None
+
+    def transmit(self, payload: bytes, fd: bool = False, brs: bool = False):
+        self.bus.transmit(self.parent.can_id_slave, payload, fd, brs)
+
+    def transmitTo(self, identifier, payload: bytes, fd: bool = False, brs: bool = False):
+        self.bus.transmit(identifier, payload, fd, brs)
+
+    def transmit_many(self, frames, fd: bool = False, brs: bool = False, identifier=None):
+        self.bus.transmit_many(identifier or self.parent.can_id_slave, frames, fd, brs)
+
+    def setFilters(self, ids):
+        if self.bus is not None:
+            self.bus.update()
+
+    def read(self, timeout: float = 0.0):
+        return None
+
+    def getTimestampResolution(self):
+        return None     # Timestamps are converted by the bus.
@@ -42,6 +42,14 @@ BAUDRATE_PRESETS = {
     50000:      canlib.canBITRATE_50K
 }
 
+FD_BAUDRATE_PRESETS = {
+    8000000:    canlib.canFD_BITRATE_8M_60P,
+    4000000:    canlib.canFD_BITRATE_4M_80P,
+    2000000:    canlib.canFD_BITRATE_2M_80P,
+    1000000:    canlib.canFD_BITRATE_1M_80P,
+    500000:     canlib.canFD_BITRATE_500K_80P,
+}
+
 
 class Kvaser(can.CanInterfaceBase):
     """
@@ -54,6 +62,8 @@ class Kvaser(can.CanInterfaceBase):
         "KV_BAUDRATE_PRESET":   (bool,   False,  True),
     }
 
+    WRITE_SYNC_TIMEOUT = 1000   # ms
+
     def __init__(self):
         self.connected = False
 
@@ -65,6 +75,8 @@ class Kvaser(can.CanInterfaceBase):
         openFlags = canlib.canOPEN_ACCEPT_VIRTUAL if self.config.get("KV_ACCEPT_VIRTUAL")== True else None
         bitrate = canlib.canBITRATE_500K
         #bitrateFlags = canlib.canDRIVER_NORMAL
+        if self.parent.fd:
+            openFlags = (openFlags or 0) | canlib.canOPEN_CAN_FD
         self.ch = canlib.openChannel(self.channel, openFlags)
         self.parent.logger.debug("{} [CANLib version: {}]".format(ChannelData(self.channel).device_name, canlib.dllversion()))
 
@@ -79,10 +91,26 @@ class Kvaser(can.CanInterfaceBase):
             tseg1 = self.config.get("TSEG1")
             tseg2 = self.config.get("TSEG2")
             self.ch.setBusParams(baudrate, tseg1, tseg2, sjw)
+        if self.parent.fd:
+            fdBaudrate = int(self.parent.config.get("FD_BAUDRATE"))
+            if not fdBaudrate in FD_BAUDRATE_PRESETS:
+                raise ValueError("No preset for FD baudrate '{}'".format(fdBaudrate))
+            self.ch.setBusParamsFd(FD_BAUDRATE_PRESETS[fdBaudrate], 0, 0, 0)
         self.ch.iocontrol.timer_scale = 10  # 10µS, fixed for now.
+        self.setFilters(self.parent.receiveIds)
         self.ch.busOn()
         self.connected = True
 
+    def setFilters(self, ids):
+        if not hasattr(self, "ch"):
+            return
+        if ids is None:
+            self.ch.canSetAcceptanceFilter(0, 0, False)
+            self.ch.canSetAcceptanceFilter(0, 0, True)
+            return
+        cfilter, cmask = can.calculateFilter(ids)
+        self.ch.canSetAcceptanceFilter(cfilter, cmask, any(can.isExtendedIdentifier(i) for i in ids))
+
     def close(self):
         self.tearDownChannel()
         self.connected = False
@@ -95,16 +123,55 @@ class Kvaser(can.CanInterfaceBase):
             except canlib.exceptions.CanGeneralError:
                 pass
 
-    def transmit(self, payload):
-        frame = KVFrame(id_ = self.parent.can_id_slave.id, data = payload,
-            flags = canlib.canMSG_EXT if self.parent.can_id_slave.is_extended else canlib.canMSG_STD)
-        self.ch.write(frame)
+    def transmit(self, payload, fd = False, brs = False):
+        self.transmitTo(self.parent.can_id_slave, payload, fd, brs)
+
+    def transmitTo(self, identifier, payload, fd = False, brs = False):
+        self.ch.write(self._makeFrame(identifier, payload, fd, brs))
+
+    def transmit_many(self, frames, fd = False, brs = False, identifier = None):
+        # Frames are queued back to back (canlib's write doesn't wait for the bus), synced once.
+        identifier = identifier or self.parent.can_id_slave
+        write = self.ch.write
+        for payload in frames:
+            frame = self._makeFrame(identifier, payload, fd, brs)
+            try:
+                write(frame)
+            except canlib.exceptions.CanError as e:
+                if e.status != canlib.Error.TXBUFOFL:
+                    raise
+                self.ch.writeSync(self.WRITE_SYNC_TIMEOUT)     # Transmit queue full.
+                write(frame)
+        self.ch.writeSync(self.WRITE_SYNC_TIMEOUT)
+
+    def _makeFrame(self, identifier, payload, fd, brs):
+        flags = canlib.canMSG_EXT if identifier.is_extended else canlib.canMSG_STD
+        if fd:
+            flags |= canlib.canFDMSG_FDF | (canlib.canFDMSG_BRS if brs else 0)
+        return KVFrame(id_ = identifier.id, data = payload, flags = flags)
+
+    def read_many(self, max_frames, timeout = 0.0):
+        if not self.connected:
+            return []
+        result = []
+        read = self.ch.read
+        try:
+            frame = read(int(timeout * 1000))
+            while True:
+                extended = (frame.flags & canlib.canMSG_EXT) == canlib.canMSG_EXT
+                result.append((frame.id | can.CAN_EXTENDED_ID if extended else frame.id, frame.data, frame.timestamp))
+                if len(result) >= max_frames:
+                    break
+                frame = read(0)
+        except canlib.exceptions.CanNoMsg:
+            pass
+        return result
 
-    def read(self):
+    def read(self, timeout = 0.0):
         if not self.connected:
             return
         try:
-            frame = self.ch.read(5)
+            frame = self.ch.read(int(timeout * 1000))
         except canlib.exceptions.CanNoMsg:
             return None
         else:
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Linux SocketCAN driver (``CAN_DRIVER = "SocketCAN"``).
+
+Uses a raw ``AF_CAN`` socket, so no third-party packages are required.
+Bitrates (including the CAN-FD data bitrate) are a property of the network
+interface and must be configured outside of pyXCP, e.g.::
+
+    ip link set can0 up type can bitrate 500000 dbitrate 2000000 fd on
+
+or, for testing::
+
+    ip link add dev vcan0 type vcan && ip link set vcan0 up
+
+The kernel drops frames not addressed to us (``CAN_RAW_FILTER``, see
+:func:`pyxcp.transport.can.calculateFilter`) and timestamps them on reception (``SO_TIMESTAMPNS``).
+:meth:`SocketCAN.read_many` blocks up to `timeout` seconds and fetches
+all frames available (up to `max_frames`) per wakeup; :meth:`SocketCAN.read`
+buffers up to `SC_BATCH_SIZE` frames.
+"""
+
+__copyright__="""
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import deque
+import select
+import socket
+import struct
+from time import time_ns
+
+import pyxcp.transport.can as can
+
+# <linux/can.h>
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CANFD_BRS = 0x01
+CANFD_ESI = 0x02
+
+CAN_FRAME = struct.Struct("=IB3x8s")
+CANFD_FRAME = struct.Struct("=IBB2x64s")
+CAN_MTU = CAN_FRAME.size
+CANFD_MTU = CANFD_FRAME.size
+CAN_FILTER = struct.Struct("=II")
+
+SOL_CAN_RAW = getattr(socket, "SOL_CAN_RAW", 101)
+CAN_RAW_FILTER = getattr(socket, "CAN_RAW_FILTER", 1)
+CAN_RAW_FD_FRAMES = getattr(socket, "CAN_RAW_FD_FRAMES", 5)
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+TIMESPEC = struct.Struct("@ll")
+ANCILLARY_BUFSIZE = socket.CMSG_SPACE(TIMESPEC.size) if hasattr(socket, "CMSG_SPACE") else 0
+
+HAS_SOCKETCAN = hasattr(socket, "AF_CAN") and hasattr(socket, "CAN_RAW")
+
+
+def packFrame(identifier: can.Identifier, payload: bytes, fd: bool = False, brs: bool = False) -> bytes:
+    """Build a `struct can_frame` (or `struct canfd_frame`, if `fd` is True).
+    """
+    canId = identifier.id | (CAN_EFF_FLAG if identifier.is_extended else 0)
+    if fd:
+        return CANFD_FRAME.pack(canId, len(payload), CANFD_BRS if brs else 0, payload)
+    if len(payload) > 8:
+        raise ValueError("Classic CAN frames carry at most 8 bytes, got {}.".format(len(payload)))
+    return CAN_FRAME.pack(canId, len(payload), payload)
+
+
+def unpackFrame(data: bytes):
+    """Parse a `struct can_frame` or `struct canfd_frame`.
+
+    Returns
+    -------
+    tuple (int, bytes) or None
+        XCP formatted identifier (:obj:`CAN_EFF_FLAG` equals :obj:`pyxcp.transport.can.CAN_EXTENDED_ID`)
+        and payload; None for error and remote frames.
+    """
+    if len(data) == CANFD_MTU:
+        canId, length, _, payload = CANFD_FRAME.unpack(data)
+    else:
+        canId, length, payload = CAN_FRAME.unpack(data[:CAN_MTU])
+    if canId & (CAN_ERR_FLAG | CAN_RTR_FLAG):
+        return None
+    return canId & (CAN_EFF_FLAG | CAN_EFF_MASK), payload[:length]
+
+
+def makeFilters(ids) -> bytes:
+    """`CAN_RAW_FILTER` option value accepting `ids` (XCP formatted identifiers), or anything if `ids` is None.
+    """
+    if ids is None:
+        return CAN_FILTER.pack(0, CAN_RTR_FLAG)
+    ids = list(ids)
+    cfilter, cmask = can.calculateFilter(ids)
+    # Frame format must match as well, unless both formats are in use.
+    if all(can.isExtendedIdentifier(i) for i in ids):
+        cfilter |= CAN_EFF_FLAG
+        cmask |= CAN_EFF_FLAG
+    elif not any(can.isExtendedIdentifier(i) for i in ids):
+        cmask |= CAN_EFF_FLAG
+    return CAN_FILTER.pack(cfilter, cmask | CAN_RTR_FLAG)
+
+
+class SocketCAN(can.CanInterfaceBase):
+    """
+    """
+
+    PARAMETER_MAP = {
+        #                        Type    Req'd   Default
+        "SC_CHANNEL":           (str,    False,  "can0"),
+        "SC_BATCH_SIZE":        (int,    False,  64),
+    }
+
+    def __init__(self):
+        self.connected = False
+        self.sock = None
+        self.frames = deque()
+
+    def init(self, parent, receive_callback):
+        self.parent = parent
+
+    def connect(self):
+        if not HAS_SOCKETCAN:
+            raise RuntimeError("SocketCAN is not supported on this platform.")
+        self.channel = self.config.get("SC_CHANNEL")
+        self.fd = self.parent.fd     # Requires an FD capable interface (MTU 72).
+        self.batchSize = self.config.get("SC_BATCH_SIZE")
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        if self.fd:
+            self.sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FD_FRAMES, 1)
+        self.sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, makeFilters(self.parent.receiveIds))
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.sock.bind((self.channel, ))
+        self.sock.setblocking(False)
+        self.poller = select.poll()
+        self.poller.register(self.sock, select.POLLIN)
+        self.parent.logger.debug("SocketCAN interface '{}' opened{}.".format(self.channel, " (FD)" if self.fd else ""))
+        self.connected = True
+
+    def close(self):
+        self.connected = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def setFilters(self, ids):
+        if self.sock is not None:
+            self.sock.setsockopt(SOL_CAN_RAW, CAN_RAW_FILTER, makeFilters(ids))
+
+    def transmit(self, payload, fd = False, brs = False):
+        self.sock.send(packFrame(self.parent.can_id_slave, payload, fd, brs))
+
+    def transmitTo(self, identifier, payload, fd = False, brs = False):
+        self.sock.send(packFrame(identifier, payload, fd, brs))
+
+    def transmit_many(self, frames, fd = False, brs = False, identifier = None):
+        send = self.sock.send
+        identifier = identifier or self.parent.can_id_slave
+        for payload in frames:
+            send(packFrame(identifier, payload, fd, brs))
+
+    def _receive(self, timeout: float, maxFrames: int):
+        """Wait up to `timeout` seconds and buffer all frames available (at most `maxFrames`).
+        """
+        if not self.poller.poll(timeout * 1000):
+            return
+        recvmsg = self.sock.recvmsg
+        append = self.frames.append
+        for _ in range(maxFrames):
+            try:
+                data, ancdata, _, _ = recvmsg(CANFD_MTU, ANCILLARY_BUFSIZE)
+            except BlockingIOError:
+                break
+            frame = unpackFrame(data)
+            if frame is None:
+                continue
+            timestamp = 0
+            for level, tp, cdata in ancdata:
+                if level == socket.SOL_SOCKET and tp == SO_TIMESTAMPNS:
+                    sec, nsec = TIMESPEC.unpack(cdata[:TIMESPEC.size])
+                    timestamp = sec * 1000000000 + nsec
+            append((frame[0], frame[1], timestamp))
+
+    def _fill(self, timeout: float, maxFrames: int) -> bool:
+        if not self.frames:
+            try:
+                self._receive(timeout, maxFrames)
+            except OSError:
+                if self.connected:
+                    raise
+        return bool(self.frames)
+
+    def read(self, timeout = 0.0):
+        if not self.connected or not self._fill(timeout, self.batchSize):
+            return None
+        rawId, payload, timestamp = self.frames.popleft()
+        return can.Frame(id_ = can.Identifier(rawId), dlc = len(payload), data = payload, timestamp = timestamp)
+
+    def read_many(self, max_frames, timeout = 0.0):
+        if not self.connected or not self._fill(timeout, max_frames):
+            return []
+        frames = self.frames
+        if len(frames) <= max_frames:
+            result = list(frames)
+            frames.clear()
+            return result
+        return [frames.popleft() for _ in range(max_frames)]
+
+    def getTimestampResolution(self):
+        # Wall-clock nano seconds, mapped to the host time-base by :class:`pyxcp.clocksync.TimestampConverter`.
+        return 1
+
+    def getTimestampClock(self):
+        return time_ns
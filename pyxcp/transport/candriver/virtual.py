@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""In-process virtual CAN bus (``CAN_DRIVER = "VirtualCAN"``).
+
+Any number of :class:`~pyxcp.transport.can.Can` transports (masters) and
+simulated slaves (see :class:`VirtualNode`) can be attached to a
+:class:`VirtualBus`; every frame is delivered to all other nodes whose
+acceptance filters let it pass.
+
+Each frame occupies the bus for its bit time (:func:`pyxcp.transport.can.frameDuration`,
+worst-case bit stuffing), so :meth:`VirtualBus.load` reports a realistic bus
+load and -- with `pacing` enabled -- transmission blocks like a controller
+with a single transmit mailbox, i.e. throughput is limited to what the bitrate allows:
+
+.. code-block:: python
+
+    import pyxcp.transport.candriver.virtual
+
+    bus = VirtualBus("sim", bitrate = 500000)
+    def slave(node, rawId, data):
+        node.send(0x101, b"\\xff")  # Positive response to anything.
+    VirtualNode(bus, ids = [0x100], callback = slave)
+    xm = Master("can", config = {"CAN_DRIVER": "VirtualCAN", "VC_BUS": "sim",
+        "CAN_ID_MASTER": 0x101, "CAN_ID_SLAVE": 0x100})
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+from collections import deque
+import threading
+from time import perf_counter_ns, sleep
+
+import pyxcp.transport.can as can
+
+BUSES = {}  # name -> VirtualBus
+
+
+class VirtualBus:
+    """
+    Parameters
+    ----------
+    name: str
+        Referred to by the `VC_BUS` parameter of :class:`VirtualCAN`.
+    bitrate: float
+        Nominal bitrate.
+    fdBitrate: float
+        Data bitrate of CAN-FD frames with bitrate switch.
+    pacing: bool
+        Block senders until their frames are transmitted; otherwise frames are
+        delivered immediately, but bus time is accounted anyway.
+
+    Frames are delivered in bus-time order, even if sent concurrently.
+    """
+
+    def __init__(self, name: str = "default", bitrate: float = 500000.0, fdBitrate: float = 2000000.0,
+                 pacing: bool = True):
+        self.name = name
+        self.bitrate = bitrate
+        self.fdBitrate = fdBitrate
+        self.pacing = pacing
+        self.nodes = ()     # Replaced, not modified -- transmission isn't locked.
+        self.lock = threading.Lock()
+        self.busyUntil = 0
+        self._tickets = 0   # Position of frames on the bus, assigned with busyUntil.
+        self._cursor = 0    # Next frame to deliver.
+        # Reentrant: callbacks (simulated slaves) respond from within a delivery.
+        self._release = threading.Condition(threading.RLock())
+        self.reset()
+        BUSES[name] = self
+
+    @staticmethod
+    def get(name: str):
+        try:
+            return BUSES[name]
+        except KeyError:
+            raise ValueError("No virtual CAN bus named '{}' -- choose from {}".format(name, list(BUSES))) from None
+
+    def attach(self, node):
+        with self.lock:
+            if node not in self.nodes:
+                self.nodes = self.nodes + (node, )
+
+    def detach(self, node):
+        with self.lock:
+            self.nodes = tuple(n for n in self.nodes if n is not node)
+
+    def close(self):
+        self.nodes = ()
+        if BUSES.get(self.name) is self:
+            del BUSES[self.name]
+
+    def reset(self):
+        """Reset bus-load accounting.
+        """
+        self.frameCount = 0
+        self.busyNs = 0
+        self.since = perf_counter_ns()
+
+    def load(self) -> float:
+        """Bus load (0.0 .. 1.0) since the last :meth:`reset`.
+        """
+        elapsed = max(perf_counter_ns(), self.busyUntil) - self.since
+        return self.busyNs / elapsed if elapsed > 0 else 0.0
+
+    def transmit(self, sender, rawId: int, payload: bytes, fd: bool = False, brs: bool = False):
+        """Transmit a frame from `sender` to all other nodes.
+
+        Parameters
+        ----------
+        sender: :class:`VirtualNode`
+        rawId: int
+            XCP formatted identifier.
+        """
+        duration = int(can.frameDuration(len(payload), can.isExtendedIdentifier(rawId), fd, brs,
+            self.bitrate, self.fdBitrate) * 1000000000)
+        with self.lock:
+            now = perf_counter_ns()
+            end = max(now, self.busyUntil) + duration
+            self.busyUntil = end
+            self.frameCount += 1
+            self.busyNs += duration
+            ticket = self._tickets
+            self._tickets += 1
+        if self.pacing:
+            sleep((end - now) / 1000000000)
+            timestamp = end
+        else:
+            timestamp = now
+        with self._release:
+            while self._cursor != ticket:
+                self._release.wait()
+            self._cursor += 1
+            self._release.notify_all()
+            for node in self.nodes:
+                if node is not sender and node.accepts(rawId):
+                    node.deliver(rawId, payload, timestamp)
+
+
+class VirtualNode:
+    """Attachment point to a :class:`VirtualBus`, also usable for simulated slaves.
+
+    Parameters
+    ----------
+    bus: :class:`VirtualBus`
+    ids: list of int or None
+        Acceptance filter (XCP formatted identifiers), None accepts anything.
+    callback: callable or None
+        Called as `callback(node, rawId, data)` in the thread of the sender;
+        otherwise frames are queued for :meth:`receive`.
+    """
+
+    def __init__(self, bus: VirtualBus, ids=None, callback=None):
+        self.bus = bus
+        self.callback = callback
+        self.frames = deque()
+        self.condition = threading.Condition()
+        self.setFilters(ids)
+        bus.attach(self)
+
+    def setFilters(self, ids):
+        self.ids = frozenset(ids) if ids is not None else None
+
+    def accepts(self, rawId: int) -> bool:
+        return self.ids is None or rawId in self.ids
+
+    def deliver(self, rawId: int, data: bytes, timestamp: int):
+        if self.callback is not None:
+            self.callback(self, rawId, data)
+        else:
+            with self.condition:
+                self.frames.append((rawId, data, timestamp))
+                self.condition.notify()
+
+    def send(self, identifier, payload: bytes, fd: bool = False, brs: bool = False):
+        """
+        Parameters
+        ----------
+        identifier: int or :class:`~pyxcp.transport.can.Identifier`
+        """
+        rawId = identifier.raw_id if isinstance(identifier, can.Identifier) else identifier
+        self.bus.transmit(self, rawId, bytes(payload), fd, brs)
+
+    def receive(self, maxFrames: int, timeout: float = 0.0) -> list:
+        """Wait up to `timeout` seconds, then return up to `maxFrames` tuples (raw_id, data, timestamp).
+        """
+        frames = self.frames
+        with self.condition:
+            if not frames and timeout:
+                self.condition.wait(timeout)
+            if len(frames) <= maxFrames:
+                result = list(frames)
+                frames.clear()
+                return result
+            return [frames.popleft() for _ in range(maxFrames)]
+
+    def close(self):
+        self.bus.detach(self)
+
+
+class VirtualCAN(can.CanInterfaceBase):
+    """
+    """
+
+    PARAMETER_MAP = {
+        #                        Type    Req'd   Default
+        "VC_BUS":               (str,    False,  "default"),
+            # Created on demand, using BAUDRATE / FD_BAUDRATE of the transport.
+        "VC_PACING":            (bool,   False,  True),
+    }
+
+    def __init__(self):
+        self.node = None
+        self.ids = None
+
+    def init(self, parent, receive_callback):
+        self.parent = parent
+
+    def connect(self):
+        name = self.config.get("VC_BUS")
+        bus = BUSES.get(name)
+        if bus is None:
+            config = self.parent.config
+            bus = VirtualBus(name, config.get("BAUDRATE"), config.get("FD_BAUDRATE"), self.config.get("VC_PACING"))
+        self.node = VirtualNode(bus, self.ids)
+
+    def close(self):
+        if self.node is not None:
+            self.node.close()
+            self.node = None
+
+    def setFilters(self, ids):
+        self.ids = ids
+        if self.node is not None:
+            self.node.setFilters(ids)
+
+    def transmit(self, payload, fd = False, brs = False):
+        self.node.send(self.parent.can_id_slave, payload, fd, brs)
+
+    def transmitTo(self, identifier, payload, fd = False, brs = False):
+        self.node.send(identifier, payload, fd, brs)
+
+    def transmit_many(self, frames, fd = False, brs = False, identifier = None):
+        send = self.node.send
+        identifier = identifier or self.parent.can_id_slave
+        for payload in frames:
+            send(identifier, payload, fd, brs)
+
+    def read(self, timeout = 0.0):
+        frames = self.read_many(1, timeout)
+        if not frames:
+            return None
+        rawId, payload, timestamp = frames[0]
+        return can.Frame(id_ = can.Identifier(rawId), dlc = len(payload), data = payload, timestamp = timestamp)
+
+    def read_many(self, max_frames, timeout = 0.0):
+        node = self.node
+        if node is None:
+            return []
+        return node.receive(max_frames, timeout)
+
+    def getTimestampResolution(self):
+        return 1    # Nano seconds, host time-base.
+
+    def getTimestampClock(self):
+        return perf_counter_ns
@@ -26,14 +26,50 @@ __copyright__ = """
 import selectors
 import socket
 import struct
+import sys
+from time import perf_counter_ns, time_ns
 
+from pyxcp.clocksync import TimestampConverter
 from pyxcp.transport.base import BaseTransport
 
 DEFAULT_XCP_PORT = 5555
 
+# Linux specific, not exported by the socket module.
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+TIMESPEC = struct.Struct("@ll")
+ANCILLARY_BUFSIZE = socket.CMSG_SPACE(TIMESPEC.size) if hasattr(socket, "CMSG_SPACE") else 0
 
-class Eth(BaseTransport):
+
+def kernelTimestamp(ancdata):
+    """Extract the SCM_TIMESTAMPNS reception time from ancillary data.
+
+    Parameters
+    ----------
+    ancdata: list
+        As returned by :meth:`socket.socket.recvmsg`.
+
+    Returns
+    -------
+    int or None
+        Reception time in wall-clock nano seconds (:func:`time.time_ns`).
     """
+    for level, tp, data in ancdata:
+        if level == socket.SOL_SOCKET and tp == SCM_TIMESTAMPNS:
+            sec, nsec = TIMESPEC.unpack(data[:TIMESPEC.size])
+            return sec * 1000000000 + nsec
+    return None
+
+
+class Eth(BaseTransport):
+    """XCP on Ethernet (TCP / UDP).
+
+    Note
+    ----
+    With `KERNEL_TIMESTAMPS` DAQ timestamps are the kernel reception times, mapped
+    to integer nano-seconds in the :func:`time.perf_counter_ns` time-base (like all
+    DAQ timestamps, see :class:`~pyxcp.transport.base.BaseTransport`) by a
+    :class:`~pyxcp.clocksync.TimestampConverter` -- the same way as driver timestamps of XCP on CAN.
     """
 
     PARAMETER_MAP = {
@@ -42,11 +78,15 @@ class Eth(BaseTransport):
         "PORT":           (int,    False,  5555),
         "PROTOCOL":       (str,    False,  "TCP"),
         "IPV6":           (bool,   False,  False),
+        "KERNEL_TIMESTAMPS": (bool,  False,  False),
+            # Linux only: let the kernel timestamp incoming packets (SO_TIMESTAMPNS),
+            # so DAQ timestamps are independent of the load of the Python process.
     }
 
     MAX_DATAGRAM_SIZE = 512
     HEADER = struct.Struct("<HH")
     HEADER_SIZE = HEADER.size
+    COUNTER_MASK = 0xffff
 
     def __init__(self, config=None):
         super(Eth, self).__init__(config)
@@ -76,6 +116,14 @@ class Eth(BaseTransport):
         if hasattr(socket, "SO_REUSEPORT"):
             self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.settimeout(0.5)
+        self.kernelTimestamps = self.config.get("KERNEL_TIMESTAMPS")
+        if self.kernelTimestamps:
+            if sys.platform.startswith("linux"):
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            else:
+                self.logger.warn("KERNEL_TIMESTAMPS are only supported on Linux.")
+                self.kernelTimestamps = False
+        self.timestampConverter = TimestampConverter(1, time_ns) if self.kernelTimestamps else None
 
     def connect(self):
         if self.status == 0:
@@ -90,10 +138,15 @@ class Eth(BaseTransport):
         processResponse = self.processResponse
         EVENT_READ = selectors.EVENT_READ
 
-        close_event_set = self.closeEvent.isSet
+        close_event_set = self.closeEvent.is_set
         socket_fileno = self.sock.fileno
         select = self.selector.select
 
+        kernel_timestamps = self.kernelTimestamps
+        sock_recvmsg = self.sock.recvmsg if kernel_timestamps else None
+        convert = self.timestampConverter
+        recvTimestamp = None
+
         if use_tcp:
             sock_recv = self.sock.recv
         else:
@@ -111,7 +164,13 @@ class Eth(BaseTransport):
                             # first try to get the header in one go
                             # if we are lucky this will avoid creating a
                             # bytearray and extending it
-                            header = sock_recv(HEADER_SIZE)
+                            if kernel_timestamps:
+                                header, ancdata, _, _ = sock_recvmsg(HEADER_SIZE, ANCILLARY_BUFSIZE)
+                                recvTimestamp = kernelTimestamp(ancdata)
+                                if recvTimestamp is not None:
+                                    recvTimestamp = convert(recvTimestamp, perf_counter_ns())
+                            else:
+                                header = sock_recv(HEADER_SIZE)
                             size = len(header)
                             if size != HEADER_SIZE:
 
@@ -143,9 +202,17 @@ class Eth(BaseTransport):
                                 continue
                         else:
                             try:
-                                response, _ = sock_recv(
-                                    Eth.MAX_DATAGRAM_SIZE
-                                )
+                                if kernel_timestamps:
+                                    response, ancdata, _, _ = sock_recvmsg(
+                                        Eth.MAX_DATAGRAM_SIZE, ANCILLARY_BUFSIZE
+                                    )
+                                    recvTimestamp = kernelTimestamp(ancdata)
+                                    if recvTimestamp is not None:
+                                        recvTimestamp = convert(recvTimestamp, perf_counter_ns())
+                                else:
+                                    response, _ = sock_recv(
+                                        Eth.MAX_DATAGRAM_SIZE
+                                    )
                                 length, counter = HEADER_UNPACK(
                                     response[:HEADER_SIZE]
                                 )
@@ -154,7 +221,7 @@ class Eth(BaseTransport):
                                 self.logger.error(str(e))
                                 continue
 
-                        processResponse(response, length, counter)
+                        processResponse(response, length, counter, recvTimestamp)
             except Exception:
                 self.status = 0  # disconnected
                 break
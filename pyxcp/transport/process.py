@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Transport-layer listener running in a child process.
+
+Reception, framing and PID classification (:meth:`~pyxcp.transport.base.BaseTransport.processResponse`)
+happen in a forked child, which doesn't compete with the application for the GIL:
+
+- DAQ packets are published into shared-memory rings (:mod:`pyxcp.daq.shmring`),
+  one for :attr:`~pyxcp.transport.base.BaseTransport.daqQueue` and one for every other queue DAQ
+  identifiers are routed to (:meth:`pyxcp.transport.can.Can.setDaqId`). The :class:`~pyxcp.daq.drain.DaqDrain`
+  of each queue reads its ring directly (:meth:`~pyxcp.daq.drain.DaqDrain.feed`), i.e. sinks get
+  the packets without copies; only while there are no sinks, packets are copied into the queue.
+  Other processes may attach to the rings as well (see :attr:`ListenerProcess.ringName`).
+- Responses, events and service requests go through a pipe into the usual queues,
+  so the command/response API of the parent stays as is.
+
+Sending still takes place in the parent. Requires the `fork` start method
+(i.e. POSIX) and a transport whose receive path survives a fork (sockets, serial ports).
+The child is forked as soon as the receive path is open, before the transport starts
+any thread; forking while other threads are running is refused, because the child would
+inherit their locks in whatever state they happen to be -- start recorders, clock sync and
+the like after connecting.
+
+Transport-layer counter gaps and packets dropped by the rings are reported back
+to the parent's :attr:`~pyxcp.transport.base.BaseTransport.daqStatistics`.
+The child works on a copy of the transport taken at fork time, so changing the
+receive path afterwards (:meth:`pyxcp.transport.can.Can.setDaqId`,
+:meth:`pyxcp.transport.can.Can.broadcast`) raises :class:`RuntimeError`,
+see :meth:`~pyxcp.transport.base.BaseTransport.checkReceivePathMutable`.
+"""
+
+__copyright__ = """
+    pySART - Simplified AUTOSAR-Toolkit for Python.
+
+   (C) 2009-2019 by Christoph Schueler <cpu12.gems@googlemail.com>
+
+   All Rights Reserved
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+
+import functools
+import multiprocessing
+import struct
+import threading
+from time import perf_counter_ns
+
+from pyxcp.daq.drain import DaqDrain
+from pyxcp.daq.shmring import RingConsumer, RingPublisher
+from pyxcp.daq.stats import DaqStatistics
+from pyxcp.logger import Logger
+
+# Tags of packets sent through the pipe.
+RESPONSE = 0
+EVENT = 1
+SERVICE = 2
+TRANSPORT_GAP = 3   # Followed by GAP.
+DAQ_DROPPED = 4     # Followed by the PID of the dropped packet.
+
+GAP = struct.Struct("<I")
+
+JOIN_TIMEOUT = 2.0
+
+
+class PipeForwarder:
+    """Child side stand-in for `resQueue`, `evQueue` and `servQueue`.
+    """
+
+    def __init__(self, conn, tag: int):
+        self.conn = conn
+        self.tag = bytes([tag])
+
+    def append(self, response):
+        self.conn.send_bytes(self.tag + bytes(response))
+
+
+class RingForwarder:
+    """Child side stand-in for `daqQueue`.
+    """
+
+    maxlen = None   # Drops are accounted for in :meth:`append`.
+
+    def __init__(self, publisher, statistics):
+        self.publisher = publisher
+        self.statistics = statistics
+
+    def append(self, element):
+        if not self.publisher.publish(*element):
+            self.statistics.daqDropped(element[0])
+
+
+class StatisticsForwarder(DaqStatistics):
+    """Child side stand-in for `daqStatistics`.
+
+    Transport-layer counter gaps and packets dropped because the ring is full are
+    sent to the parent, which accounts for received packets itself.
+    """
+
+    def __init__(self, conn):
+        super(StatisticsForwarder, self).__init__()
+        self.conn = conn
+
+    def transportGap(self, count: int):
+        self.conn.send_bytes(bytes([TRANSPORT_GAP]) + GAP.pack(count))
+
+    def daqReceived(self, packet):
+        pass
+
+    def daqDropped(self, packet):
+        self.conn.send_bytes(bytes([DAQ_DROPPED, packet[0]]))
+
+
+class ListenerProcess:
+    """Runs :meth:`~pyxcp.transport.base.BaseTransport.listen` of a transport in a child process.
+
+    Parameters
+    ----------
+    transport: :class:`~pyxcp.transport.base.BaseTransport`
+    ringSize: int
+        Size of each DAQ ring in bytes.
+    """
+
+    def __init__(self, transport, ringSize: int):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Listener process requires the 'fork' start method.")
+        self.transport = transport
+        self.ringSize = ringSize
+        self.logger = Logger("transport.ListenerProcess")
+        self._context = multiprocessing.get_context("fork")
+        self._stopEvent = self._context.Event()
+        self._rings = []    # (queue, RingPublisher, RingConsumer), daqQueue first.
+        self._drains = []   # DaqDrain of each ring.
+        self._process = None
+        self._pump = None
+        self._statsLock = threading.Lock()  # Drains of several rings and the response pump update statistics.
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None
+
+    @property
+    def ringName(self) -> str:
+        """Name of the ring of :attr:`~pyxcp.transport.base.BaseTransport.daqQueue`,
+        see :class:`pyxcp.daq.shmring.RingConsumer`.
+        """
+        return self._rings[0][1].name if self._rings else None
+
+    @property
+    def droppedCount(self) -> int:
+        """DAQ packets dropped, because a ring was full.
+        """
+        if self._process is None:
+            return 0
+        return sum(consumer.droppedCount for _, _, consumer in self._rings)
+
+    def _queues(self) -> list:
+        """Queues receiving DAQ packets, :attr:`~pyxcp.transport.base.BaseTransport.daqQueue` first.
+        """
+        queues = [self.transport.daqQueue]
+        for queue in (getattr(self.transport, "daqRoutes", None) or {}).values():
+            if queue is not None and all(queue is not q for q in queues):
+                queues.append(queue)
+        return queues
+
+    def start(self):
+        others = [thread.name for thread in threading.enumerate() if thread is not threading.current_thread()]
+        if others:
+            raise RuntimeError("Listener process can't be forked while other threads are running ({}) -- "
+                "connect before starting them.".format(", ".join(others)))
+        for queue in self._queues():
+            publisher = RingPublisher(size=self.ringSize)
+            # Attach before forking, so no packet published by the child gets lost.
+            self._rings.append((queue, publisher, RingConsumer(publisher.name)))
+        parentConn, childConn = self._context.Pipe(duplex=False)
+        self._process = self._context.Process(
+            target=self._run, args=(childConn, ), name="XcpListener", daemon=True
+        )
+        self._process.start()
+        childConn.close()
+        self._pump = threading.Thread(target=self._pumpResponses, args=(parentConn, ), name="XcpResponsePump",
+            daemon=True)
+        self._pump.start()
+        for queue, _, consumer in self._rings:
+            drain = DaqDrain.forQueue(queue)
+            drain.feed(consumer, self._account, functools.partial(self._store, queue))
+            self._drains.append(drain)
+
+    def _run(self, conn):
+        """Child process.
+        """
+        tr = self.transport
+        tr.closeEvent = self._stopEvent
+        tr.resQueue = PipeForwarder(conn, RESPONSE)
+        tr.evQueue = PipeForwarder(conn, EVENT)
+        tr.servQueue = PipeForwarder(conn, SERVICE)
+        tr.daqStatistics = StatisticsForwarder(conn)
+        forwarders = {id(queue): RingForwarder(publisher, tr.daqStatistics) for queue, publisher, _ in self._rings}
+        tr.daqQueue = forwarders[id(tr.daqQueue)]
+        if getattr(tr, "daqRoutes", None):
+            tr.daqRoutes = {identifier: (forwarders[id(queue)] if queue is not None else None)
+                for identifier, queue in tr.daqRoutes.items()}
+        try:
+            tr.listen()
+        finally:
+            for _, publisher, _ in self._rings:
+                publisher.close(unlink=False)
+            conn.close()
+
+    def _pumpResponses(self, conn):
+        tr = self.transport
+        queues = {RESPONSE: tr.resQueue, EVENT: tr.evQueue, SERVICE: tr.servQueue}
+        while True:
+            try:
+                data = conn.recv_bytes()
+            except (EOFError, OSError):
+                break
+            tag = data[0]
+            if tag in (TRANSPORT_GAP, DAQ_DROPPED):
+                self._lost(data)
+            else:
+                queues[tag].append(data[1:])
+        conn.close()
+
+    def _lost(self, message):
+        """Apply statistics sent by the child.
+        """
+        stats = self.transport.daqStatistics
+        if stats is None:
+            return
+        with self._statsLock:
+            if message[0] == TRANSPORT_GAP:
+                stats.transportGap(GAP.unpack_from(message, 1)[0])
+            else:
+                stats.daqDropped(message[1:])
+
+    def _account(self, elements):
+        """Statistics for a batch read from a ring (runs on the drain).
+        """
+        tr = self.transport
+        if tr.first_daq_timestamp is None:
+            tr.first_daq_timestamp = elements[0][3] or perf_counter_ns()
+        stats = tr.daqStatistics
+        if stats is not None:
+            received = stats.daqReceived
+            with self._statsLock:
+                for element in elements:
+                    received(element[0])
+
+    def _store(self, queue, elements):
+        """Copy a batch read from a ring into `queue`, while its drain has no sinks.
+        """
+        stats = self.transport.daqStatistics
+        maxlen = queue.maxlen
+        append = queue.append
+        for packet, counter, length, timestamp in elements:
+            if maxlen is not None and len(queue) == maxlen and stats is not None:
+                with self._statsLock:
+                    stats.daqDropped(queue[0][0])
+            append((bytes(packet), counter, length, timestamp))
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._stopEvent.set()
+        self._process.join(JOIN_TIMEOUT)
+        if self._process.is_alive():
+            self.logger.warn("Listener process didn't finish, terminating.")
+            self._process.terminate()
+            self._process.join()
+        self._pump.join()
+        self._pump = None
+        self._process = None
+        for (_, publisher, _), drain in zip(self._rings, self._drains):
+            publisher.close()   # Closed by the child as well, unless it was terminated.
+            drain.unfeed()
+        self._rings = []
+        self._drains = []
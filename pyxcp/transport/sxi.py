@@ -1,6 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+"""XCP on SxI (serial interfaces).
+
+Header and tail of the frames are configurable as in ``XCPonSxI.aml``:
+
+- `HEADER_FORMAT`: one of :obj:`HEADER_FORMATS`, i.e. a length field (byte or word),
+  optionally followed by a counter (`CTR`) or a fill (`FILL`) field of the same size.
+- `CHECKSUM`: ``NO_CHECKSUM``, ``CHECKSUM_BYTE`` (sum of all bytes) or
+  ``CHECKSUM_WORD`` (sum of all little-endian words; odd packets are filled with a zero byte),
+  taken over header and packet.
+
+The listener reads whatever the serial port has to offer in one go (blocking
+up to :attr:`SxI.READ_TIMEOUT` seconds, if nothing is available) and splits
+the buffer into frames. Frames with an implausible length or a wrong
+checksum are skipped byte-wise until a valid frame is found again;
+incomplete frames followed by an idle line are discarded
+(see :attr:`SxI.framingErrors`).
+
+Without a checksum (``NO_CHECKSUM``), a corrupted length is only detected
+if it exceeds the limit of the packet type, i.e. MAX_CTO for responses, events
+and service requests (PID >= 0xFC) and MAX_DTO for DAQ packets, once connected
+(see :meth:`SxI.packetLimits`). A corrupted, but plausible length swallows the
+bytes following it, framing recovers at the end of the bogus frame at the
+earliest -- configure a checksum if the line isn't reliable.
+"""
+
 __copyright__ = """
     pySART - Simplified AUTOSAR-Toolkit for Python.
 
@@ -24,11 +49,65 @@ __copyright__ = """
 """
 
 import struct
+from time import perf_counter_ns
 
 import serial
 
 from pyxcp.transport.base import BaseTransport
 
+# Header format: (struct format, has counter)
+HEADER_FORMATS = {
+    "HEADER_LEN_BYTE":      ("<B", False),
+    "HEADER_LEN_CTR_BYTE":  ("<BB", True),
+    "HEADER_LEN_FILL_BYTE": ("<Bx", False),
+    "HEADER_LEN_WORD":      ("<H", False),
+    "HEADER_LEN_CTR_WORD":  ("<HH", True),
+    "HEADER_LEN_FILL_WORD": ("<Hxx", False),
+}
+
+CHECKSUMS = ("NO_CHECKSUM", "CHECKSUM_BYTE", "CHECKSUM_WORD")
+
+
+class SxIHeader:
+    """Packs and unpacks the header of a frame, see :obj:`HEADER_FORMATS`.
+    """
+
+    def __init__(self, headerFormat: str):
+        try:
+            fmt, self.hasCounter = HEADER_FORMATS[headerFormat]
+        except KeyError:
+            raise ValueError("{!r} is an invalid header format -- choose from {}".format(
+                headerFormat, list(HEADER_FORMATS))) from None
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+        self.maxLength = (1 << (8 * struct.calcsize(fmt[:2]))) - 1
+        self.counterMask = self.maxLength if self.hasCounter else None
+
+    def pack(self, length: int, counter: int) -> bytes:
+        if self.hasCounter:
+            return self.struct.pack(length, counter & self.counterMask)
+        return self.struct.pack(length)
+
+    def unpack_from(self, buffer, offset: int = 0) -> tuple:
+        """
+        Returns
+        -------
+        tuple (length, counter)
+            `counter` is 0 if the header has none.
+        """
+        values = self.struct.unpack_from(buffer, offset)
+        return (values[0], values[1]) if self.hasCounter else (values[0], 0)
+
+
+def checksumByte(data) -> int:
+    return sum(data) & 0xff
+
+
+def checksumWord(data) -> int:
+    """`data` must be of even length.
+    """
+    return sum(struct.unpack("<{}H".format(len(data) // 2), data)) & 0xffff
+
 
 class SxI(BaseTransport):
     """
@@ -42,18 +121,30 @@ class SxI(BaseTransport):
         "BYTESIZE":             (int,    False,  8),
         "PARITY":               (str,    False,  "N"),
         "STOPBITS":             (int,    False,  1),
+        "HEADER_FORMAT":        (str,    False,  "HEADER_LEN_CTR_WORD"),
+        "CHECKSUM":             (str,    False,  "NO_CHECKSUM"),
     }
 
     MAX_DATAGRAM_SIZE = 512
     TIMEOUT = 0.75
+    READ_TIMEOUT = 0.1  # Seconds the listener blocks, if no data is available.
     HEADER = struct.Struct("<HH")
     HEADER_SIZE = HEADER.size
+    COUNTER_MASK = 0xffff
 
     def __init__(self, config=None):
         super(SxI, self).__init__(config)
         self.loadConfig(config)
         self.portName = self.config.get("PORT")
         self.baudrate = self.config.get("BAUDRATE")
+        self.HEADER = SxIHeader(self.config.get("HEADER_FORMAT"))
+        self.HEADER_SIZE = self.HEADER.size
+        self.COUNTER_MASK = self.HEADER.counterMask
+        self.checksum = self.config.get("CHECKSUM")
+        if self.checksum not in CHECKSUMS:
+            raise ValueError("{!r} is an invalid checksum type -- choose from {}".format(self.checksum, list(CHECKSUMS)))
+        self.maxLength = min(self.MAX_DATAGRAM_SIZE, self.HEADER.maxLength)   # Plausibility limit.
+        self.framingErrors = 0
 
     def __del__(self):
         self.closeConnection()
@@ -83,21 +174,139 @@ class SxI(BaseTransport):
     def flush(self):
         self.commPort.flush()
 
+    def tailSize(self, length: int) -> int:
+        """Bytes behind a packet of `length` bytes (fill byte and checksum).
+        """
+        if self.checksum == "CHECKSUM_BYTE":
+            return 1
+        elif self.checksum == "CHECKSUM_WORD":
+            return 2 + ((self.HEADER_SIZE + length) & 1)
+        return 0
+
+    def tail(self, frame) -> bytes:
+        """Fill byte and checksum for `frame` (header and packet).
+        """
+        if self.checksum == "CHECKSUM_BYTE":
+            return bytes([checksumByte(frame)])
+        elif self.checksum == "CHECKSUM_WORD":
+            fill = b"\x00" if len(frame) & 1 else b""
+            return fill + struct.pack("<H", checksumWord(bytes(frame) + fill))
+        return b""
+
     def listen(self):
-        while True:
-            if self.closeEvent.isSet():
-                return
-            if not self.commPort.inWaiting():
+        commPort = self.commPort
+        closed = self.closeEvent.is_set
+        commPort.timeout = self.READ_TIMEOUT
+        buffer = bytearray()
+        while not closed():
+            data = commPort.read(commPort.in_waiting or 1)
+            if data:
+                buffer += data
+                consumed = self.framesReceived(buffer, perf_counter_ns())
+                if consumed:
+                    del buffer[: consumed]
+            elif buffer:
+                # Line is idle in the middle of a frame, i.e. the header is garbage or
+                # something got lost -- skip to the next plausible header.
+                self.framingErrors += 1
+                del buffer[: self.resync(buffer)]
+                consumed = self.framesReceived(buffer, perf_counter_ns())
+                if consumed:
+                    del buffer[: consumed]
+
+    def frameLimit(self) -> int:
+        """Upper bound of the length field -- MAX_CTO / MAX_DTO once connected.
+
+        Without a checksum, a corrupted length swallows the following frames,
+        so the tighter the bound, the less gets lost.
+        """
+        return max(self.packetLimits())
+
+    def packetLimits(self) -> tuple:
+        """Upper bounds of the length field by packet type.
+
+        Returns
+        -------
+        tuple (int, int)
+            For responses, events and service requests (MAX_CTO) and for DAQ packets (MAX_DTO).
+        """
+        properties = getattr(self.parent, "slaveProperties", None) or {}
+        maxCto = properties.get("maxCto")
+        maxDto = properties.get("maxDto")
+        if maxCto and maxDto:
+            return (min(self.maxLength, maxCto), min(self.maxLength, maxDto))
+        return (self.maxLength, self.maxLength)
+
+    def resync(self, buffer) -> int:
+        """Number of bytes to skip to get to the next plausible header in `buffer`.
+
+        The stale frame at the start of `buffer` is skipped in any case; a frame that
+        starts behind it, but isn't complete yet, is kept.
+        """
+        unpack = self.HEADER.unpack_from
+        headerSize = self.HEADER_SIZE
+        ctoLimit, dtoLimit = self.packetLimits()
+        maxLength = max(ctoLimit, dtoLimit)
+        checksum = self.checksum != "NO_CHECKSUM"
+        size = len(buffer)
+        for pos in range(1, size - headerSize + 1):
+            length, _ = unpack(buffer, pos)
+            if not length or length > maxLength:
+                continue
+            if not checksum and pos + headerSize < size and \
+                    length > (ctoLimit if buffer[pos + headerSize] >= 0xFC else dtoLimit):
                 continue
-            length, counter = self.HEADER.unpack(
-                self.commPort.read(self.HEADER_SIZE))
+            end = pos + headerSize + length
+            frameEnd = end + self.tailSize(length)
+            if checksum and frameEnd <= size and self.tail(buffer[pos: end]) != buffer[end: frameEnd]:
+                continue
+            return pos
+        return max(size - headerSize + 1, 1)   # Keep what may be the start of a header.
 
-            response = self.commPort.read(length)
-            self.timing.stop()
+    def framesReceived(self, buffer, timestamp: int = None) -> int:
+        """Process all complete frames in `buffer`.
 
-            self.processResponse(response, length, counter)
+        Returns
+        -------
+        int
+            Number of bytes consumed (including skipped garbage).
+        """
+        unpack = self.HEADER.unpack_from
+        headerSize = self.HEADER_SIZE
+        ctoLimit, dtoLimit = self.packetLimits()
+        maxLength = max(ctoLimit, dtoLimit)
+        checksum = self.checksum != "NO_CHECKSUM"
+        tailSize = self.tailSize
+        processResponse = self.processResponse
+        size = len(buffer)
+        pos = 0
+        while size - pos >= headerSize:
+            length, counter = unpack(buffer, pos)
+            if not length or length > maxLength:
+                self.framingErrors += 1
+                pos += 1    # Resynchronize.
+                continue
+            if not checksum and ctoLimit != dtoLimit and pos + headerSize < size and \
+                    length > (ctoLimit if buffer[pos + headerSize] >= 0xFC else dtoLimit):
+                # The only hint of a corrupted length without a checksum.
+                self.framingErrors += 1
+                pos += 1
+                continue
+            end = pos + headerSize + length
+            frameEnd = end + tailSize(length)
+            if frameEnd > size:
+                break
+            if checksum and self.tail(buffer[pos: end]) != buffer[end: frameEnd]:
+                self.framingErrors += 1
+                pos += 1
+                continue
+            processResponse(bytes(buffer[pos + headerSize: end]), length, counter, timestamp)
+            pos = frameEnd
+        return pos
 
     def send(self, frame):
+        if self.checksum != "NO_CHECKSUM":
+            frame = frame + self.tail(frame)
         self.commPort.write(frame)
 
     def closeConnection(self):
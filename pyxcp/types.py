@@ -23,6 +23,7 @@ __copyright__ = """
   51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
+from collections import namedtuple
 import enum
 
 import construct
@@ -30,7 +31,7 @@ import construct
 from construct import (
     Struct, Enum, Padding, Int8ul, GreedyBytes, Byte, Int16ul, Int32ul,
     BitStruct, BitsInteger, Flag, If, this, Int16ub, Int32ub, IfThenElse,
-    Int16sl, Int32sl, Int16sb, Int32sb)
+    Int16sl, Int32sl, Int16sb, Int32sb, Bytes)
 
 
 if construct.version < (2, 8):
@@ -160,6 +161,62 @@ class Command(enum.IntEnum):
     TIME_CORRELATION_PROPERTIES = 0xC6
 
 
+class CanCommand(enum.IntEnum):
+    """Sub-commands of TRANSPORT_LAYER_CMD (XCP on CAN).
+    """
+    GET_SLAVE_ID = 0xFF
+    GET_DAQ_ID = 0xFE
+    SET_DAQ_ID = 0xFD
+
+
+class Event(enum.IntEnum):
+    """Event codes of EV packets (PID 0xFD).
+    """
+    EV_RESUME_MODE = 0x00
+    EV_CLEAR_DAQ = 0x01
+    EV_STORE_DAQ = 0x02
+    EV_STORE_CAL = 0x03
+    EV_CMD_PENDING = 0x05
+    EV_DAQ_OVERLOAD = 0x06
+    EV_SESSION_TERMINATED = 0x07
+    EV_TIME_SYNC = 0x08
+    EV_STIM_TIMEOUT = 0x09
+    EV_SLEEP = 0x0A
+    EV_WAKE_UP = 0x0B
+    EV_ECU_STATE_CHANGE = 0x0C
+    EV_USER = 0xFE
+    EV_TRANSPORT = 0xFF
+
+
+class ServiceRequest(enum.IntEnum):
+    """Service request codes of SERV packets (PID 0xFC).
+    """
+    SERV_RESET = 0x00
+    SERV_TEXT = 0x01
+
+
+def decodeEventPacket(packet, codes=Event):
+    """Split an EV or SERV packet.
+
+    Parameters
+    ----------
+    packet: bytes
+        Starting with the PID.
+    codes: :class:`Event` or :class:`ServiceRequest`
+
+    Returns
+    -------
+    tuple (code, data)
+        Unknown codes (e.g. vendor specific) are returned as int.
+    """
+    code = packet[1] if len(packet) > 1 else None
+    try:
+        code = codes(code)
+    except ValueError:
+        pass
+    return code, bytes(packet[2:])
+
+
 class CommandCategory(enum.IntEnum):
     STD = 0
     CAL = 1
@@ -760,3 +817,18 @@ TimeCorrelationPropertiesResponse = Struct(
     Padding(1),
     "clusterId" / Int16u
 )
+
+GetDaqIdResponse = Struct(
+    "canIdFixed" / Flag,
+    Padding(2),
+    "canId" / Int32u
+)
+
+GetSlaveIdResponse = Struct(
+    "echo" / Bytes(3),      # b"XCP", inverted in mode 1.
+    "canId" / Int32u        # CMD/STIM identifier.
+)
+
+CanSlave = namedtuple("CanSlave", "canIdMaster canIdSlave")
+CanSlave.__doc__ = """XCP on CAN slave found by :meth:`pyxcp.master.Master.getSlaveID`,
+identifiers as in the `CAN_ID_MASTER` / `CAN_ID_SLAVE` parameters."""
@@ -29,14 +29,23 @@ setup(
 
     include_package_data=True,
     install_requires=install_reqs,
+    python_requires=">=3.7",
     extras_require={
        "docs": [
            'sphinxcontrib-napoleon'
        ],
         "develop": [
             "bumpversion"
+       ],
+        "recorder": [
+            "numpy"
        ]
     } ,
+    entry_points={
+        "console_scripts": [
+            "xdaq-convert = pyxcp.recorder.convert:main",
+        ],
+    },
     package_dir={'tests': 'pyxcp/tests'},
     tests_require=["pytest", "pytest-runner"],
     test_suite="pyxcp.tests",
@@ -59,9 +68,7 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
     ],
 )